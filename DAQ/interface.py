@@ -32,6 +32,7 @@ class Interface(tk.Tk):
     rate = 10000
     samples_to_read = 1000
     timeout = 10
+    refresh_interval = 50
     device_name = ''
     def __init__(self):
         super(Interface, self).__init__()
@@ -149,22 +150,37 @@ class Interface(tk.Tk):
             pW.setRange(QtCore.QRectF(0, minrange, 
                                       int(self.samples_to_read.get()), 
                                       maxrange-minrange))
-            if len(task.clist.names)>1:
-                curves = []
-                for i in range(len(task.clist.names)):
-                    pen = pg.mkPen(pg.intColor(i))
-                    curves.append(pW.plot(pen=pen))
-                while not myapp.close:
-                    data = task.read()
+            curves = []
+            for i in range(len(task.clist.names)):
+                pen = pg.mkPen(pg.intColor(i))
+                curves.append(pW.plot(pen=pen))
+            # acquisition fills the buffer from the DAQmx every N samples 
+            # event while the plot is refreshed at its own rate
+            buffer = RingBuffer(len(curves), int(self.samples_to_read.get()))
+            task.on_samples(buffer.block, buffer.write)
+
+            def refresh():
+                # the errors of the acquisition callback are only seen here
+                try:
+                    task.check_stream()
+                except Exception as err:
+                    timer.stop()
+                    messagebox.showerror('Acquisition error', str(err))
+                    app.quit()
+                    return
+                if buffer.samples_written:
+                    data = buffer.snapshot(buffer.block)
                     for i in range(len(curves)):
                         curves[i].setData(data[i])
-                    app.processEvents()
-            else:
-                curve = pW.plot()
-                while not myapp.close:
-                    data = task.read()
-                    curve.setData(data)
-                    app.processEvents()
+
+            timer = QtCore.QTimer()
+            timer.timeout.connect(refresh)
+            timer.start(self.refresh_interval)
+            task.start()
+            app.exec_()
+            timer.stop()
+            task.stop()
+            task.clear_sample_callbacks()
         else:
             r = task.read()
             r = pd.DataFrame(r)
@@ -1,5 +1,6 @@
 import aq63XX 
-import nidaqmx
+import orchestration # concurrent instrument calls
+import controller # NI DAQ
 import pandas as pd
 import matplotlib.pyplot as plt
 import numpy as np
@@ -17,19 +18,14 @@ span_osa = 1.0
 wav_i_osa = center_wav_osa - span_osa*1/2
 wav_f_osa = wav_i_osa + span_osa
 
-#auxiliary functions and custom errors
-def _daq_write_voltage(voltage, dev_id = _dev_write):
-    with nidaqmx.Task() as analog_output:
-        analog_output.ao_channels.add_ao_voltage_chan(dev_id)
-        analog_output.write(voltage)
-
-def _daq_read_voltage(dev_id):
-    with nidaqmx.Task() as task:
-        task.ai_channels.add_ai_voltage_chan(dev_id)
-        # adjust the acquisition rate
-        task.timing.cfg_samp_clk_timing(rate = 200e3, sample_mode = nidaqmx.constants.AcquisitionType.FINITE)
-        return np.mean(task.read(number_of_samples_per_channel=100))
+# long lived DAQ tasks, so no task is created for every point of the map
+# adjust the acquisition rate
+daq = controller.PointIO(_dev_write, rate = 200e3)
+daq_tol = 1e-3 # max change between consecutive DAQ readings to consider the signal settled [V]
+
+osa_attempts = 3 # tries of an OSA sweep or trace fetch before the map is aborted
 
+#auxiliary functions and custom errors
 # class VoltageAboveRange(Exception):
 #     def __init__(self, err_tshd, message = "Desired voltage is above range supported sensor."):
 #         self.err_tshd = err_tshd
@@ -43,43 +39,60 @@ def _daq_read_voltage(dev_id):
 #         super().__init__(self.message)
 
 
-## Configure OSA
-osa = aq63XX.AQ63XX()
-osa.CloseOSA()
-osa.ConnectOSA(isgpib = True, address = 5)
-# to prevent OSA from freezing to calibrate
-osa.osa.write(':CALibration:ZERO off')
-
-## ASCII or BINARY mode
-osa.SetBinary(False)
-
-## create a vector for the OSA wavelengths
-osa.SetStartWavelength(wav_i_osa)
-osa.SetStopWavelength(wav_f_osa)
-osa.SetSensMode("Mid")
-osa.SingleSweep()
-ended = False
-while not ended:
-    ended = osa.EndedSweep()
-    time.sleep(0.1)
-osa.trace = "tra" # 20 dBm with filter
-x_a, y_a = osa.GetData()
+## Configure the instruments, each in its own worker thread so they are set up concurrently
+def _configure_osa(osa):
+    osa.CloseOSA()
+    osa.ConnectOSA(isgpib = True, address = 5)
+    # to prevent OSA from freezing to calibrate
+    osa.osa.write(':CALibration:ZERO off')
+    ## ASCII or BINARY mode
+    osa.SetBinary(False)
+    ## create a vector for the OSA wavelengths
+    osa.SetStartWavelength(wav_i_osa)
+    osa.SetStopWavelength(wav_f_osa)
+    osa.SetSensMode("Mid")
+    osa.SingleSweep()
+    osa.wait_sweep()
+    osa.trace = "tra" # 20 dBm with filter
+    return osa.GetData()
+
+def _configure_keithley(keithley, address):
+    keithley.connectSM(address=address)
+    keithley.conf_apply_current()
+    # change this
+    keithley.set_compliance_voltage(5) # initialize the compliance voltage [Volts]
+
+def _osa_sweep(osa):
+    # the trace is fetched separately
+    osa.SingleSweep()
+    osa.wait_sweep(timeout=60)
+
+def _osa_fetch(osa):
+    return osa.GetData()[1]
+
+def _osa_retry(osa, action, attempts = osa_attempts):
+    # a failed sweep or fetch is tried again, the error is raised after the last attempt
+    for attempt in range(1, attempts+1):
+        try:
+            return action(osa)
+        except Exception:
+            if attempt == attempts:
+                raise
+            print(f"{action.__name__} failed, trying again ({attempt}/{attempts})")
+            time.sleep(0.1)
+
+osa = orchestration.Instrument(aq63XX.AQ63XX(), 'osa')
+keithley3 = orchestration.Instrument(keithley2400.Keithley2400SM(), 'keithley3') # current controller
+keithley1 = orchestration.Instrument(keithley2400.Keithley2400SM(), 'keithley1') # current controller
+daqW = orchestration.Instrument(daq, 'daq')
+
+setup = orchestration.Plan()
+setup.step('osa', osa.run, _configure_osa)
+setup.step('keithley3', keithley3.run, _configure_keithley, 25)
+setup.step('keithley1', keithley1.run, _configure_keithley, 24)
+x_a, y_a = orchestration.run(setup.run())['osa']
 lamda_osa = x_a
 
-
-## Configure current
-keithley3 = keithley2400.Keithley2400SM() # current controller
-keithley3.connectSM(address=25)
-keithley3.conf_apply_current()
-# change this
-keithley3.set_compliance_voltage(5) # initialize the compliance voltage [Volts]
-
-keithley1 = keithley2400.Keithley2400SM() # current controller
-keithley1.connectSM(address=24)
-keithley1.conf_apply_current()
-# change this
-keithley1.set_compliance_voltage(5) # initialize the compliance voltage [Volts]
-
 ## take data
 # current loops
 current_vec1 = np.arange(30.2,30.6,0.1)
@@ -89,65 +102,61 @@ current_vec3 = np.arange(31.2,31.6,0.1)
 # voltage ramp
 step_volt = 0.1
 volts = np.arange(2.0, -(2.0+step_volt), -step_volt)
+heater_settle = 2 # time for the heaters to settle after a current change [s]
 # Initialize 4D array
 mapOsayVh3h1 = np.zeros((len(current_vec1), len(current_vec3), len(volts), len(lamda_osa)))
 mapTransmVh3h1 = np.zeros((len(current_vec1), len(current_vec3), len(volts), 2))
 
-t0 = time.time()
+async def fetch_trace(index):
+    mapOsayVh3h1[index] = await osa.run(_osa_retry, _osa_fetch)
 
-for ind_h1, curr1 in enumerate(current_vec1):
-    keithley1.set_source_current(curr1*1e-3) # set current in heater 1
-    time.sleep(2)
-    
-    for ind_h3, curr3 in enumerate(current_vec3):
-        keithley3.set_source_current(curr3*1e-3) # set current in heater 3
-        time.sleep(2)
-        
-        for ind_v, v0 in enumerate(volts):
-            _daq_write_voltage(v0)
-            print(f'iteration for heater 1 = {curr1:.2f} mA, heater 3 = {curr3:.2f} mA, and DAQ_voltage = {v0:.2f}')
-
-            acquisition = False
-            attempts = 0
-            while (not acquisition) or (attempts <= 4):
-                try:
-                    osa.SingleSweep()
-                    ended = False
-                    while not ended:
-                        ended = osa.EndedSweep()
-                        time.sleep(0.1)
-                    # osa.trace = "tra"
-                    x_a, y_a = osa.GetData()
-                    acquisition = True
-                    attempts = 100000000
-                    # print('successful data acquisition')
-                except:
-                    print(f"Data acquisition failed for heater 1 = {curr1:.2f} mA, heater 3 = {curr3:.2f} mA, and DAQ_voltage = {v0:.2f}")
-                    attempts = attempts+1
-                    time.sleep(0.1)
-
-            mapOsayVh3h1[ind_h1, ind_h3, ind_v] = y_a
-            mapTransmVh3h1[ind_h1, ind_h3, ind_v, 0] = _daq_read_voltage(_dev_read_T)
-            time.sleep(1)
-            mapTransmVh3h1[ind_h1, ind_h3, ind_v, 1] = _daq_read_voltage(_dev_read_mzi)
-            time.sleep(1)
+async def take_map():
+    # fetch of the last OSA trace, awaited with the set up of the next point and before the next sweep,
+    # which would overwrite the trace
+    pending = []
+    for ind_h1, curr1 in enumerate(current_vec1):
+        await keithley1.set_source_current(curr1*1e-3, settle = heater_settle) # set current in heater 1
         
-        _daq_write_voltage(0)
+        for ind_h3, curr3 in enumerate(current_vec3):
+            await keithley3.set_source_current(curr3*1e-3, settle = heater_settle) # set current in heater 3
+            # both heaters settle at the same time, while the last OSA trace is fetched
+            await orchestration.gather(keithley1.ready(), keithley3.ready(), *pending)
+            pending = []
+            
+            for ind_v, v0 in enumerate(volts):
+                # the last trace is fetched while the voltage is set
+                await orchestration.gather(daqW.write(v0, _dev_write), *pending)
+                pending = []
+                print(f'iteration for heater 1 = {curr1:.2f} mA, heater 3 = {curr3:.2f} mA, and DAQ_voltage = {v0:.2f}')
+
+                # both channels are sampled in one scan until the readings settle, during the OSA sweep
+                _, mapTransmVh3h1[ind_h1, ind_h3, ind_v] = await orchestration.gather(
+                    osa.run(_osa_retry, _osa_sweep), daqW.read_settled([_dev_read_T, _dev_read_mzi], 100, tol = daq_tol))
+                pending = [fetch_trace((ind_h1, ind_h3, ind_v))]
+            
+            await daqW.write(0, _dev_write)
+    await orchestration.gather(*pending)
+
+t0 = time.time()
+orchestration.run(take_map())
 
         
 map_complete1 = xr.DataArray(mapOsayVh3h1, coords=[current_vec1, current_vec3, volts, lamda_osa], dims=["h1_current", "h3_current", "DAQ_voltage", "Power_OSA"])
 map_complete2 = xr.DataArray(mapTransmVh3h1, dims=["h1_current", "h3_current", "DAQ_voltage", "transmission"])
 
-# _daq_write_voltage(0)
+# daq.write(0, _dev_write)
 # osa.SingleSweep()
-osa.CloseOSA()
+osa.driver.CloseOSA()
 print('success!')
 
 t1 = time.time()
 print(f"it took {t1-t0:.6f} s to run")
 
-keithley1.set_source_current(0)
-keithley3.set_source_current(0)
+keithley1.driver.set_source_current(0)
+keithley3.driver.set_source_current(0)
+for instrument in (osa, keithley1, keithley3, daqW):
+    instrument.close()
+daq.close()
 
 # Saving data
 # save = True
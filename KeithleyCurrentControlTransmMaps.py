@@ -13,7 +13,9 @@ import oscDSOX3104A # oscilloscope 1GHz
 import agilent816xb # laser
 import controller # NI DAQ
 import pickle
+import sweepstore # chunked storage of the sweeps
 import keithley2400 # current controller for the heaters
+import heater # closed loop heater power
 import time
 import sys
 
@@ -29,13 +31,17 @@ scan_speed = 5 # in nm/s
 wth_i = 1530 # start wavelength in nm - min 1450 nm
 wth_f = 1570 # stop wavelength in nm - max 1650 nm
 scan_time = (wth_f-wth_i)/scan_speed
+llog_step = 1e-3 # wavelength logging step in nm
 
 laser.connectlaser()
-laser.setState(0,1)
-laser.setOutputTrigger(0,1,mode="SWST")
-laser.setSweepState(0,"Stop") # just to ensure that the laser sweep from a previous run has been stopped before the next sweep starts
-laser.setSweep(0,"CONT", wth_i, wth_f, 1, 0, 0, scan_speed)
-laser.setPwr(0,7) # in dBm
+laser.checkLambdaLogging(wth_i, wth_f, llog_step) # raises if the laser cannot log that many points
+with laser.batch(check_errors=True): # the setup goes in a couple of GPIB transfers
+    laser.setState(0,1)
+    laser.setOutputTrigger(0,1,mode="STF") # a pulse every llog_step, the wavelength logging needs it
+    laser.setSweepState(0,"Stop") # just to ensure that the laser sweep from a previous run has been stopped before the next sweep starts
+    laser.setSweep(0,"CONT", wth_i, wth_f, llog_step, 0, 0, scan_speed)
+    laser.setLambdaLogging(0, True) # the laser logs its wavelength every llog_step
+    laser.setPwr(0,7) # in dBm
 
 #--- Initial config for the oscilloscope ---#
 osc.connectOSC()
@@ -103,10 +109,8 @@ def measResistence(curr, wait=2):
     time.sleep(wait) # wait for the temperature to stabilize 
 
     while cond > tol:
-        # take the averaged resistence value      
-        res = []
-        for ii in range(Nmean):
-            res.append(keithley.get_ohms()) # get the resistence in Ohm
+        # take the averaged resistence value (all readings in one GPIB transfer)
+        res, _, _ = keithley.get_buffered(Nmean, "RES") # get the resistence in Ohm
 
         if abs(np.mean(res)) < 1e3: # if the resistence is smaller than 1k Ohm -> True
             cond = np.std(res)/np.mean(res)
@@ -144,10 +148,8 @@ def CheckTime(curr=10,maxtime=20):
         print(f"{t} s")
 
         # take the averaged resistence value     
-        res = []
-        for ii in range(Nmean):
-            res.append(keithley.get_ohms())
-        R.append(np.mean(res))  
+        res, meanR, _ = keithley.get_buffered(Nmean, "RES")
+        R.append(meanR)  
 
         keithley.set_source_current(0) 
         time.sleep(t) 
@@ -175,8 +177,9 @@ def plotPwr(maxCurr, step, plot=True):
     stdR = []
     Power = []
 
-    for curr in current:
-        res, pwr = measResistence(curr)
+    # the current ramp runs on the keithley, with a 2 s delay for the temperature to stabilize
+    meas = keithley.source_list(np.array(current)*1e-3, dwell=2, measure=("RES",))
+    for curr, res in zip(current, meas["RES"]):
         R.append(res)
         stdR.append(res)
         Power.append((curr*1e-3)**2/res*1e3) # in mW
@@ -215,32 +218,22 @@ PotLinear = np.linspace(0, MaxPower, step)
 # --- Obtain a current vector to meet the linearly spaced dissipated power vector and save the spectra ---#
 
 # initialize variables
-resGuess = R # resistence guess to calculate the current needed to meet the intended power
+# the controller predicts the current from a linear R(P) model and waits for the resistence to settle
+heaterCtrl = heater.HeaterPowerController(keithley, R0=R)
+heaterCtrl.add_point(maxCurr**2*1e-6*R, R) # point measured at the max current
 resistence = []
 current = []
 i = 0
-wait = 2
 
 # scan the power levels 
 for p in PotLinear[0:5]:
-    if p == 0:
-        R, curr, Power = (0,0,0) # take the averaged resistence value 
-    else:
-        while np.abs(p-Power)/p > 0.01:  
-            curr = np.sqrt(p*1e-3*resGuess)*1e3 # calculate current in mA 
-            R, Power = measResistence(curr) # take the averaged resistence value 
-
-            resGuess = R # update the resistence guess
-            print(f"for iteraction # {i}, calculated power is off the target by {np.abs(p-Power)/p}")
+    sp = heaterCtrl.set_power(p*1e-3) # power in W
+    R, curr = sp.res, sp.curr*1e3 # in Ohm and mA
+    print(f"{p:.3f} mW set with {curr:.3f} mA, R = {R:.2f} Ohm, in {sp.steps} steps")
 
     resistence.append(R)
     current.append(curr) 
 
-    keithley.set_source_current(curr*1e-3) # set current in A
-    time.sleep(wait) # wait for the temperature to stabilize
-    
-    laser.setSweepState(0,"Start") # enable the laser sweep
-
     # save spectrum 
     task.acquisition_mode = 'N Samples'
     task.rate = sampRate
@@ -248,11 +241,16 @@ for p in PotLinear[0:5]:
     task.timeout = 1.5*scan_time
     print(f"Sampling rate: {sampRate} Pts/s")
     print(f"Trace length: {int(sampRate*(scan_time+2))}")
-    task.config()
+    task.config() # the DAQmx task is only rebuilt if the channels change
+    task.start() # armed before the sweep starts, so no trigger pulse is missed
+
+    laser.setSweepState(0,"Start") # enable the laser sweep
     r = task.read()
-    task.close()
+    task.stop()
 
-    laser.setSweepState(0,"Stop") # enable the laser sweep
+    # wavelength of every sample, from the laser log aligned on the trigger pulses (ai0)
+    wl = agilent816xb.align_lambda_log(laser.getLambdaLog(0), r[0])
+    laser.setSweepState(0,"Stop") # stop the laser sweep
 
     plot = False
     if plot:
@@ -263,26 +261,23 @@ for p in PotLinear[0:5]:
         # plt.legend()
         plt.show()
 
-    df = pd.DataFrame({'trigger_laser': r[0,:], 'cav': r[1,:], 'acetylene': r[2,:], 'mzi': r[3,:]})
+    df = pd.DataFrame({'wavelength': wl, 'trigger_laser': r[0,:], 'cav': r[1,:], 'acetylene': r[2,:], 'mzi': r[3,:]})
     # df.hvplot.line(y=['cav','acetylene','mzi'], width=1000, height=300, datashade=True, hover=False))
 
     # change these
     filedir = 'C:\\Users\\Lab\\Documents\\Nathalia Tomazio\\python codes\\transmission data\\C-band_heater control\\'
-    filename = 'test_10DEZ21_chip2_R-2R-R_wg-ring gap 600 nm_ring-ring gap 500 nm_TE_heater1_'
-    if i<10:
-        compl = f'0{i}_{curr*1e3:.2f}mA_{p:.2e}mW'
-    else:
-        compl = f'{i}_{curr*1e3:.2f}mA_{p:.2e}mW'
-    filepath = filedir + filename + compl
-    print('saved data: '+filepath+'.pkl')
-    # df.to_parquet(filepath+'.parq', compression='brotli')
-    picklefile = open(f"{filepath}.pkl", 'wb')
-    pickle.dump(df, picklefile)
-
-    picklefile.close()
+    filename = 'test_10DEZ21_chip2_R-2R-R_wg-ring gap 600 nm_ring-ring gap 500 nm_TE_heater1'
+    store = sweepstore.SweepStore(filedir + filename + '.sweeps') # one store for the whole power scan
+    n = store.append(df, metadata={'name': filename, 'step': i, 'power_mW': p, 'current_mA': curr, 'res_Ohm': R,
+                                   'wth_i': wth_i, 'wth_f': wth_f, 'scan_speed': scan_speed,
+                                   'llog_step': llog_step, 'rate': sampRate})
+    print(f'saved data: {filedir + filename}.sweeps, sweep {n}')
 
     i = i+1
 
+task.close()
+print(f"DAQ task configuration: {task.config_stats()}")
+
 
 #--- Save the heater power and current to a cvs file ---#
 df0 = pd.DataFrame({'heater power (mW)': PotLinear[0:5], 'resistence (Ohm)': resistence, 'current (mA)': current})
@@ -13,7 +13,7 @@ import matplotlib.pyplot as plt
 import oscDSOX3104A # oscilloscope 1GHz
 # import oscAglDSO9404A # oscilloscope DSO9404 = 4GHz, big
 import agilent816xb # laser
-import pickle
+import sweepstore # chunked storage of the sweeps
 import ivi # the code uses the ivi package only to acquire the waveform
 import controller # NI DAQ
 import random
@@ -35,13 +35,17 @@ scan_speed = 5 # in nm/s
 wth_i = 1554 # start wavelength in nm - min 1450 nm
 wth_f = 1560 # stop wavelength in nm - max 1650 nm
 scan_time = (wth_f-wth_i)/scan_speed
+llog_step = 1e-3 # wavelength logging step in nm
 
 laser.connectlaser()
-laser.setState(0,1)
-laser.setOutputTrigger(0,1,mode="SWST")
-laser.setSweepState(0,"Stop") # just to ensure that the laser sweep from a previous run has been stopped before the next sweep starts
-laser.setSweep(0,"CONT", wth_i, wth_f, 1, 0, 0, scan_speed)
-laser.setPwr(0,7) # in dBm
+laser.checkLambdaLogging(wth_i, wth_f, llog_step) # raises if the laser cannot log that many points
+with laser.batch(check_errors=True): # the setup goes in a couple of GPIB transfers
+    laser.setState(0,1)
+    laser.setOutputTrigger(0,1,mode="STF") # a pulse every llog_step, the wavelength logging needs it
+    laser.setSweepState(0,"Stop") # just to ensure that the laser sweep from a previous run has been stopped before the next sweep starts
+    laser.setSweep(0,"CONT", wth_i, wth_f, llog_step, 0, 0, scan_speed)
+    laser.setLambdaLogging(0, True) # the laser logs its wavelength every llog_step
+    laser.setPwr(0,7) # in dBm
 
 # --- Initial config for the oscilloscope ---#
 # change these
@@ -53,7 +57,7 @@ laser.setPwr(0,7) # in dBm
 osc.connectOSC()
 osc.stop() # just to restart the scope waveforms 
 
-laser.setSweepState(0,"Start") # enable the laser sweep 
+# the laser sweep is started below, once the DAQ is armed
 
 osc.run()
 
@@ -121,6 +125,7 @@ if DAQ:
         task.rate = sampRate
         interval = 100
         task.samples = int(sampRate*1e-3*interval)
+        laser.setSweepState(0,"Start") # enable the laser sweep
         ani = FuncAnimation(plt.gcf(), animate, interval=interval)
         plt.tight_layout()
         plt.show()
@@ -132,33 +137,59 @@ if DAQ:
         task.timeout = 1.5*scan_time
         print(f"Sampling rate: {sampRate} Pts/s")
         print(f"Trace length: {int(sampRate*(scan_time+2))}")
+        stream = False # long sweeps go block by block to a file instead of the memory
+        log_only = False # the DAQmx driver writes the TDMS file itself, for the full 400 kSa/s
+        if log_only:
+            task.tdmsLogging = True
+            task.tdmsFilepath = 'daq_sweep.tdms'
+            task.logging_mode = 'Log Only'
         task.config()
-        r = task.read()
+        task.start() # armed before the sweep starts, so no trigger pulse is missed
+        laser.setSweepState(0,"Start") # enable the laser sweep
+        if log_only:
+            r = controller.read_tdms(task.run_logging(start=False))
+        elif stream:
+            r = task.read_to_file('daq_sweep.npy', start=False, progress=lambda n, total: print(f"\r{100*n/total:.0f} %", end=''))
+            print()
+        else:
+            r = task.read()
         task.close()
+        # wavelength of every sample, from the laser log aligned on the trigger pulses (ai0)
+        if log_only or stream:
+            # written block by block next to the samples, never whole in memory
+            wl = np.lib.format.open_memmap('daq_sweep_wavelength.npy', mode='w+', dtype=float, shape=(r.shape[1],))
+            agilent816xb.align_lambda_log(laser.getLambdaLog(0), r[0], out=wl)
+        else:
+            wl = agilent816xb.align_lambda_log(laser.getLambdaLog(0), r[0])
 
 
     plot = True
     if plot:
-        plt.plot(-0.25+r[0,:]/20, label = "laser trigger")
-        plt.plot(0.9+r[1,:],label = "cav")
-        plt.plot(0.5+r[2,:], label = "acetylene")
-        plt.plot(r[3,:]/10, label = "MZI")
+        # the plot of the files streamed to disk is decimated, the screen does not show more points anyway
+        d = max(1, r.shape[1]//200000) if log_only or stream else 1
+        plt.plot(-0.25+r[0,::d]/20, label = "laser trigger")
+        plt.plot(0.9+r[1,::d],label = "cav")
+        plt.plot(0.5+r[2,::d], label = "acetylene")
+        plt.plot(r[3,::d]/10, label = "MZI")
         # plt.legend()
         plt.show()
 
-    df = pd.DataFrame({'trigger_laser': r[0,:], 'cav': r[1,:], 'acetylene': r[2,:], 'mzi': r[3,:]})
-    # df.hvplot.line(y=['cav','acetylene','mzi'], width=1000, height=300, datashade=True, hover=False))
+    # views of the samples, the store reads them chunk by chunk
+    columns = {'wavelength': wl, 'trigger_laser': r[0,:], 'cav': r[1,:], 'acetylene': r[2,:], 'mzi': r[3,:]}
+    # pd.DataFrame(columns).hvplot.line(y=['cav','acetylene','mzi'], width=1000, height=300, datashade=True, hover=False))
 
     # change this to false in case you do not want to save the file  
     save = False
     if save:
         # change these
         filedir = 'C:\\Users\\Lab\\Documents\\Nathalia Tomazio\\python codes\\transmission data\\broadband spectra\\'
+        storename = 'broadband spectra.sweeps' # one store holds many sweeps
         filename = 'test_02DEZ21_chip2_3 coupled rings R-2R-R_wg-ring gap 800 nm_ring-ring gap 750 nm_broadband_TM_through port'
-        filepath = filedir + filename
-        print('saved data: '+filepath+'.pkl')
-        # df.to_parquet(filepath+'.parq', compression='brotli')
-        picklefile = open(f"{filepath}.pkl", 'wb')
-        pickle.dump(df, picklefile)
-        picklefile.close()
-
+        store = sweepstore.SweepStore(filedir + storename)
+        # the sweep only appears in the store once completely written
+        n = store.append(columns, metadata={'name': filename, 'wth_i': wth_i, 'wth_f': wth_f, 'scan_speed': scan_speed,
+                                       'llog_step': llog_step, 'power_dBm': 7, 'rate': sampRate})
+        print(f'saved data: {filedir + storename}, sweep {n}')
+
+else:
+    laser.setSweepState(0,"Start") # enable the laser sweep, seen on the scope only
@@ -37,11 +37,12 @@ wth_f = 1549.5 # stop wavelength in nm - max 1650 nm
 scan_time = (wth_f-wth_i)/scan_speed
 
 laser.connectlaser()
-laser.setState(0,1)
-laser.setOutputTrigger(0,1,mode="SWST")
-laser.setSweepState(0,"Stop") # just to ensure that the laser sweep from a previous run has been stopped before the next sweep starts
-laser.setSweep(0,"CONT", wth_i, wth_f, 1, 0, 0, scan_speed)
-laser.setPwr(0,13) # in dBm
+with laser.batch(check_errors=True): # the setup goes in a couple of GPIB transfers
+    laser.setState(0,1)
+    laser.setOutputTrigger(0,1,mode="SWST")
+    laser.setSweepState(0,"Stop") # just to ensure that the laser sweep from a previous run has been stopped before the next sweep starts
+    laser.setSweep(0,"CONT", wth_i, wth_f, 1, 0, 0, scan_speed)
+    laser.setPwr(0,13) # in dBm
 
 # --- Initial config for the oscilloscope ---#
 # change these
@@ -11,13 +11,11 @@ import oscDSOX3104A # oscilloscope 1GHz
 # import oscAglDSO9404A # oscilloscope DSO9404 = 4GHz, big
 import agilent816xb # laser 
 import pickle
-import ivi # the code uses the ivi package only to acquire the waveform
 
 # --- define the objects for the laser and oscilloscope --- #
 # change these
 laser = agilent816xb.Agilent816xb()  # laser 
 osc = oscDSOX3104A.OSCDSOX3104A()  # DSOX3104A = 1GHz
-scope = ivi.agilent.agilentDSOX3104A('USB0::0x0957::0x17A0::MY52490398::INSTR')  # DSOX3104A = 1GHz
 # osc = oscAglDSO9404A.OSCDSO9404A()  # DSO9404 = 4GHz, big scope
 
 
@@ -29,11 +27,12 @@ wth_f = 1650 # stop wavelength in nm - max 1650 nm
 scan_time = (wth_f-wth_i)/scan_speed
 
 laser.connectlaser()
-laser.setState(0,1)
-laser.setOutputTrigger(0,1)
-laser.setSweepState(0,"Stop") # just to ensure that the laser sweep from a previous run has been stopped before the next sweep starts
-laser.setSweep(0,"CONT", wth_i, wth_f, 1, 0, 0, scan_speed)
-laser.setPwr(0,5e-3) # in W
+with laser.batch(check_errors=True): # the setup goes in a couple of GPIB transfers
+    laser.setState(0,1)
+    laser.setOutputTrigger(0,1)
+    laser.setSweepState(0,"Stop") # just to ensure that the laser sweep from a previous run has been stopped before the next sweep starts
+    laser.setSweep(0,"CONT", wth_i, wth_f, 1, 0, 0, scan_speed)
+    laser.setPwr(0,5e-3) # in W
 
 # --- Initial config for the oscilloscope ---#
 # change these
@@ -42,6 +41,7 @@ linewidth_pts = 100 # sampling pts within a resonance linewidth
 sampling_rate = scan_speed*linewidth_pts/linewidth
 
 osc.connectOSC()
+osc.initOSC() # binary waveforms, as get_all_channels reads them
 osc.stop() # just to restart the scope waveforms 
 
 laser.setSweepState(0,"Start") # enable the laser sweep 
@@ -81,10 +81,8 @@ def Acquisition(data_crop=False, plot=True, save=False):
     # oscstop = osc.getStopTime()
 
 
-    ch1_data = scope.channels[0].measurement.fetch_waveform()
-    ch2_data = scope.channels[1].measurement.fetch_waveform()
-    ch3_data = scope.channels[2].measurement.fetch_waveform()
-    ch4_data = scope.channels[3].measurement.fetch_waveform()
+    # all the channels are fetched in one pass, sharing the same time axis
+    osc_time, osc_data = osc.get_all_channels(osc_channels)
     # ch1_data = osc.getData(1)
     # ch2_data = osc.getData(2)
     # ch3_data = osc.getData(3)
@@ -92,7 +90,7 @@ def Acquisition(data_crop=False, plot=True, save=False):
 
     # osc_time = np.linspace(oscstart, oscstop, len(ch1_data))
 
-    df = pd.DataFrame({'time':ch1_data.x, 'trigger_laser': ch1_data.y, 'cav': ch2_data.y, 'acetylene': ch3_data.y, 'mzi': ch4_data.y})
+    df = pd.DataFrame({'time':osc_time, 'trigger_laser': osc_data[0], 'cav': osc_data[1], 'acetylene': osc_data[2], 'mzi': osc_data[3]})
 
     # cropping the data might be necessary for the module wavelength_calibration.py to correctly identify the acetylene/hcn ref peaks  
     if data_crop:
@@ -4,7 +4,10 @@
 # author: Paulo Felipe Jarschel (feb 2018)
 # modified by: Leticia Magalhaes (aug 2021)
 
-import visa
+try:
+    import pyvisa as visa
+except ImportError:  # older pyvisa releases are imported as visa
+    import visa
 import numpy as np
 import struct
 import matplotlib.pyplot as plt
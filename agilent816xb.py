@@ -1,7 +1,13 @@
 # -*- coding: utf-8 -*-
 
-import visa
+try:
+    import pyvisa as visa
+except ImportError:  # older pyvisa releases are imported as visa
+    import visa
+import visasessions
+import time
 import numpy as np
+import scpibatch
 
 
 class Agilent816xb:
@@ -17,23 +23,19 @@ class Agilent816xb:
     laser = None
     laserOK = False
     laserID = ""
+    poll_start = 0.005  # interval in s between queries waiting for the sweep start
+    poll_end = 0.05  # interval in s between queries waiting for the sweep end
+    use_opc = False
+    max_llog_points = 100001  # wavelengths the laser logs in one sweep
 
     # main functions
     def __init__(self):
         try:
-            self.visarm = visa.ResourceManager('@ni')
+            self.visarm = visasessions.resource_manager()
             self.visaOK = True
         except:
             print("Error creating VISA Resource Manager! Is the GPIB Card connected?")
-
             pass
-        if not self.visaOK:
-            try:
-                self.visarm = visa.ResourceManager('@py')
-                self.visaOK = True
-            except:
-                print("Error creating VISA Resource Manager! Is the GPIB Card connected?")
-                pass
 
     def __del__(self):
         self.closelaser()
@@ -51,10 +53,10 @@ class Agilent816xb:
             try:
                 if self.gpib:
                     lasername = "GPIB0::" + str(self.gpibAddr) + "::INSTR"
-                    self.laser = self.visarm.open_resource(lasername)
+                    self.laser = visasessions.open_session(lasername)
                 # elif self.eth:
                 #     osaname = "TCPIP0::" + self.ip + "::" + str(self.port) + "::SOCKET"
-                #     self.laser = self.visarm.open_resource(osaname, read_termination="\r\n", timeout=5000)
+                #     self.laser = visasessions.open_session(osaname, read_termination="\r\n", timeout=5000)
                 #     self.laser.query('open "' + self.user + '"')
                 #     self.laser.query(self.passwd)
                 if "816" in self.laser.query("*IDN?"):
@@ -65,6 +67,19 @@ class Agilent816xb:
                 print("Error opening lasererator! Is it connected?")
                 pass
 
+    def batch(self, check_errors=False):
+        """
+        Join the commands written inside the block into as few GPIB transfers 
+        as possible, e.g.
+
+            with laser.batch(check_errors=True):
+                laser.setSweep(0, "CONT", 1530, 1570, 1, 0, 0, 5)
+                laser.setPwr(0, 7)
+
+        check_errors: query SYST:ERR? once at the end, raises IOError on errors
+        """
+        return scpibatch.batch(self, "laser", check_errors)
+
     def initlaser(self):
         return 0
 
@@ -79,7 +94,7 @@ class Agilent816xb:
     def closelaser(self):
         if self.laserOK:
             self.laserOK = False
-            self.laser.close()
+            visasessions.close_session(self.laser)
 
     def getWL(self, slot):
         if self.laserOK:
@@ -125,19 +140,99 @@ class Agilent816xb:
         if self.laserOK:
             if mode != "CONT" and mode != "STEP":
                 mode = "CONT"
-            self.laser.write(f":sour{slot}:wav:swe:mode {mode}")
-            self.laser.write(f":sour{slot}:wav:swe:start {start}nm")
-            self.laser.write(f":sour{slot}:wav:swe:stop {stop}nm")
-            self.laser.write(f":sour{slot}:wav:swe:step {step}nm")
-            self.laser.write(f":sour{slot}:wav:swe:cycl {cycles}")
-            self.laser.write(f":sour{slot}:wav:swe:dwel {dwell}ms")
-            self.laser.write(f":sour{slot}:wav:swe:spe {speed}nm/s")
+            with self.batch():
+                self.laser.write(f":sour{slot}:wav:swe:mode {mode}")
+                self.laser.write(f":sour{slot}:wav:swe:start {start}nm")
+                self.laser.write(f":sour{slot}:wav:swe:stop {stop}nm")
+                self.laser.write(f":sour{slot}:wav:swe:step {step}nm")
+                self.laser.write(f":sour{slot}:wav:swe:cycl {cycles}")
+                self.laser.write(f":sour{slot}:wav:swe:dwel {dwell}ms")
+                self.laser.write(f":sour{slot}:wav:swe:spe {speed}nm/s")
 
     def setSweepState(self, slot, state):
         if self.laserOK:
             options = ["Stop", "Start", "Pause (Stepped)", "Continue (Stepped)"]
             self.laser.write(f":sour{slot}:wav:swe:stat {options.index(state)}")
 
+    def getSweepState(self, slot):
+        """
+        0 - stopped
+        1 - running
+        2 - paused (stepped)
+        """
+        if self.laserOK:
+            return int(float(self.laser.query(f":sour{slot}:wav:swe:stat?")))
+        else:
+            return 0
+
+    def wait_sweep_started(self, slot, start=None, timeout=10):
+        """
+        Wait for the sweep started with setSweepState(slot, "Start") to begin, 
+        querying the laser every poll_start seconds instead of continuously
+
+        start: wavelength in nm the laser must pass, if None the sweep state 
+               is polled instead
+        timeout: max waiting time in seconds, raises TimeoutError
+
+        returns the time.time() of the sweep start, taken halfway through the
+        query that detected it
+        """
+        if self.laserOK:
+            t0 = time.time()
+            while True:
+                tq = time.time()
+                if start is None:
+                    started = self.getSweepState(slot) == 1
+                else:
+                    started = self.getWL(slot) > start
+                tr = time.time()
+                if started:
+                    return (tq + tr)/2
+                if timeout is not None and tr - t0 > timeout:
+                    raise TimeoutError("Timeout waiting for the Agilent816xb sweep to start")
+                time.sleep(max(0, self.poll_start - (tr - tq)))
+        return time.time()
+
+    def wait_sweep_finished(self, slot, timeout=None, use_opc=None):
+        """
+        Wait for the end of the sweep (all its cycles)
+
+        With use_opc the laser is asked *OPC?, answered only when the sweep is 
+        over, in a single GPIB transaction. Otherwise the sweep state is 
+        polled every poll_end seconds.
+
+        timeout: max waiting time in seconds, None waits for ever when 
+                 polling, raises TimeoutError
+        use_opc: overrides the use_opc class attribute
+
+        returns the time.time() of the sweep end
+        """
+        if use_opc is None:
+            use_opc = self.use_opc
+        if self.laserOK:
+            t0 = time.time()
+            if use_opc:
+                visatimeout = self.laser.timeout
+                if timeout is not None:
+                    self.laser.timeout = 1000*timeout
+                try:
+                    self.laser.query("*OPC?")
+                except visa.VisaIOError:
+                    raise TimeoutError("Timeout waiting for the Agilent816xb sweep to finish")
+                finally:
+                    self.laser.timeout = visatimeout
+                return time.time()
+            while True:
+                tq = time.time()
+                finished = self.getSweepState(slot) == 0
+                tr = time.time()
+                if finished:
+                    return (tq + tr)/2
+                if timeout is not None and tr - t0 > timeout:
+                    raise TimeoutError("Timeout waiting for the Agilent816xb sweep to finish")
+                time.sleep(max(0, self.poll_end - (tr - tq)))
+        return time.time()
+
     def setOutputTrigger(self, slot, state, mode="SWST"):
         """
         configure the trigger
@@ -149,11 +244,94 @@ class Agilent816xb:
         3 - loopback
 
         "SWST" means set the trigger for when the sweep starts
+        "STF" gives a pulse at every sweep step, needed by the wavelength
+        logging
         """
         if self.laserOK:
-            self.laser.write(f":trig:conf {state}")
-            self.laser.write(f":trig{slot}:outp {mode}")
+            with self.batch():
+                self.laser.write(f":trig:conf {state}")
+                self.laser.write(f":trig{slot}:outp {mode}")
+
+    def checkLambdaLogging(self, start, stop, step):
+        """
+        Return the number of wavelengths logged by a sweep from start to stop 
+        (nm) every step, raises ValueError above max_llog_points
+        """
+        points = int(np.floor((stop - start)/step + 1e-9)) + 1
+        if points > self.max_llog_points:
+            raise ValueError(f"The sweep logs {points} wavelengths, the laser "
+                             f"logs at most {self.max_llog_points}: increase "
+                             "the step or reduce the span")
+        return points
+
+    def setLambdaLogging(self, slot, onoff):
+        """
+        Enable the wavelength logging of the sweep: in CONT mode, the laser
+        logs its wavelength every sweep step (setSweep step), to be read
+        with getLambdaLog after the sweep. The output trigger must be STF
+        (setOutputTrigger), the sweep does not start otherwise
+        """
+        if self.laserOK:
+            self.laser.write(f":sour{slot}:wav:swe:llog {1 if onoff else 0}")
+
+    def getLambdaLog(self, slot):
+        """
+        Read the wavelengths logged during the last sweep in a single binary 
+        block, in nm
+        """
+        if self.laserOK:
+            # read by the byte count of the block header, whatever the 
+            # termination character of the session
+            data = self.laser.query_binary_values(f":sour{slot}:read:data? llog", 
+                                                  datatype='d', container=np.array)
+            return data*1e9
+        else:
+            return np.zeros(0)
+
+
+def align_lambda_log(wavelengths, trigger, threshold=None, out=None, 
+                     block=1 << 20):
+    """
+    Map the wavelengths logged by the laser onto the samples of a DAQ 
+    acquisition that recorded the laser output trigger in STF mode, one 
+    pulse for every logged point
 
-    
+    wavelengths: logged wavelengths in nm (getLambdaLog)
+    trigger: DAQ samples of the trigger channel (ai0)
+    threshold: trigger level in V, halfway between min and max if None
+    out: float64 array receiving the result, e.g. a memory-mapped file for 
+    acquisitions streamed to disk, a new array if None
+    block: samples processed at a time, the trigger is never copied whole
 
+    The n-th rising edge is the n-th logged wavelength, so the DAQ must be 
+    armed before the sweep starts and acquire until its end: a ValueError is 
+    raised if the number of edges differs from the number of logged points.
 
+    returns the wavelength of every sample in nm, nan outside the sweep
+    """
+    wavelengths = np.asarray(wavelengths)
+    n = len(trigger)
+    if threshold is None:
+        threshold = (trigger.min() + trigger.max())/2
+    edges = []
+    previous = True  # no edge at the first sample
+    for start in range(0, n, block):
+        high = np.asarray(trigger[start:start+block]) > threshold
+        rising = ~np.concatenate(([previous], high[:-1])) & high
+        edges.append(np.flatnonzero(rising) + start)
+        previous = high[-1]
+    edges = np.concatenate(edges) if edges else np.zeros(0, dtype=int)
+    if len(edges) < 2:
+        raise ValueError("Less than 2 trigger edges found in the trigger "
+                         "channel, is the output trigger set to STF?")
+    if len(edges) != len(wavelengths):
+        raise ValueError(f"{len(edges)} trigger edges for {len(wavelengths)} "
+                         "logged wavelengths, was the DAQ started before the "
+                         "sweep and did it acquire until the sweep end?")
+    if out is None:
+        out = np.empty(n)
+    for start in range(0, n, block):
+        stop = min(start + block, n)
+        out[start:stop] = np.interp(np.arange(start, stop), edges, 
+                                    wavelengths, left=np.nan, right=np.nan)
+    return out
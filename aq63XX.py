@@ -4,11 +4,16 @@
 # author: Paulo Felipe Jarschel (feb 2018)
 # modified by: Leticia Magalhaes (aug 2021)
 
-import visa
+try:
+    import pyvisa as visa
+except ImportError:  # older pyvisa releases are imported as visa
+    import visa
+import visasessions
 import numpy as np
-import struct
 import matplotlib.pyplot as plt
 import time
+import scpidata
+import scpibatch
 
 class AQ63XX:
     #definitions
@@ -29,22 +34,25 @@ class AQ63XX:
     traceLength = 0
     trace = "tra"
     tracen = 0
+    use_opc = False
+    poll_min = 0.01
+    poll_max = 0.1
     
     #main functions
     def __init__(self):
+        # instrument state cache (wavelengths in nm) and x-axis arrays 
+        # memoized per (start, stop, points)
+        self.state = {}
+        self.axis_cache = {}
+        # single sweep timing used by wait_sweep
+        self.sweep_started = None
+        self.sweep_durations = []
         try:
-            self.visarm = visa.ResourceManager('@ni')
+            self.visarm = visasessions.resource_manager()
             self.visaOK = True
         except:
             print("Error creating VISA Resource Manager! Is the GPIB Card connected?")
             pass
-        if not self.visaOK:
-            try:
-                self.visarm = visa.ResourceManager('@py')
-                self.visaOK = True
-            except:
-                print("Error creating VISA Resource Manager! Is the GPIB Card connected?")
-                pass
     
     def __del__(self):
         self.CloseOSA()
@@ -66,12 +74,13 @@ class AQ63XX:
             if self.gpib:
                 osaname = "GPIB0::" + str(self.gpibAddr) + "::INSTR"
                 print(osaname)
-                self.osa = self.visarm.open_resource(osaname)
+                self.osa = visasessions.open_session(osaname)
             elif self.eth:
                 osaname = "TCPIP0::" + self.ip + "::" + str(self.port) + "::SOCKET"
-                self.osa = self.visarm.open_resource(osaname, read_termination="\r\n", timeout = 5000)
+                self.osa = visasessions.open_session(osaname, read_termination="\r\n", timeout = 5000)
                 self.osa.query('open "' + self.user + '"')
                 self.osa.query(self.passwd)
+            self.invalidate()
             if "AQ" in self.osa.query("*IDN?"):
                 self.osaOK = True
                 print("OSA connected. IDN: ", self.osa.query("*IDN?"))
@@ -122,7 +131,7 @@ class AQ63XX:
                 self.osaOK = False
                 if self.eth:
                     self.osa.write("close")
-                self.osa.close()
+                visasessions.close_session(self.osa)
             except:
                 pass
     
@@ -132,7 +141,41 @@ class AQ63XX:
             self.ConnectOSA()
             self.InitOSA()
 
+    def batch(self, check_errors=False):
+        """
+        Join the commands written inside the block into as few transfers as
+        possible, see scpibatch
+
+        check_errors: query SYST:ERR? once at the end, raises IOError on errors
+        """
+        return scpibatch.batch(self, "osa", check_errors)
+
+    def invalidate(self):
+        """Forget the cached instrument state, call it after changing the 
+        OSA settings on the front panel."""
+        self.state.clear()
+        self.axis_cache.clear()
+
+    def xaxis(self, points):
+        """Return the wavelength axis of a trace with the given number of 
+        points, using the cached start and stop wavelengths when available.
+        The returned array is shared between calls and is read only."""
+        start = self.state.get("start")
+        if start is None:
+            start = self.GetStartWavelength()
+        stop = self.state.get("stop")
+        if stop is None:
+            stop = self.GetStopWavelength()
+        key = (start, stop, points)
+        if key not in self.axis_cache:
+            axis = np.linspace(start, stop, points)
+            axis.flags.writeable = False
+            self.axis_cache[key] = axis
+        return self.axis_cache[key]
+
     def HorizonScale(self, is_wavelength):
+        self.state.pop("start", None)
+        self.state.pop("stop", None)
         if is_wavelength:
             self.osa.write(":UNIT:X WAVelength")
         else:
@@ -147,6 +190,71 @@ class AQ63XX:
         if self.osaOK:
             self.osa.write("init:smod single")
             self.osa.write("init")
+            self.sweep_started = time.time()
+
+    def wait_sweep(self, timeout=None, use_opc=None):
+        """Wait for the end of the sweep started by SingleSweep.
+
+        With use_opc the OSA is asked *OPC?, which is only answered when the
+        sweep is over, so a single GPIB transaction replaces the polling. 
+        Otherwise the sweep status is polled with an adaptive back-off: the 
+        first poll is only sent close to the duration learned from the 
+        previous sweeps and the polling interval then grows from poll_min 
+        to poll_max.
+
+        Args:
+            timeout (float): maximum waiting time in seconds, None waits 
+                for ever when polling
+            use_opc (bool): overrides the use_opc class attribute
+
+        Returns:
+            dict: duration of this sweep, number of polls, expected duration
+                and mean/std/count of the durations measured so far
+        """
+        if use_opc is None:
+            use_opc = self.use_opc
+        # only sweeps whose start is known are used to learn the duration
+        learn = self.sweep_started is not None
+        start = self.sweep_started if learn else time.time()
+        self.sweep_started = None
+        expected = None
+        if self.sweep_durations:
+            expected = float(np.median(self.sweep_durations[-10:]))
+        polls = 0
+        if not self.osaOK:
+            learn = False
+        elif use_opc:
+            visatimeout = self.osa.timeout
+            if timeout is not None:
+                self.osa.timeout = 1000*timeout
+            try:
+                self.osa.query("*OPC?")
+                polls = 1
+            except visa.VisaIOError:
+                raise TimeoutError("Timeout waiting for the OSA AQ63XX sweep")
+            finally:
+                self.osa.timeout = visatimeout
+        else:
+            if expected and learn:
+                time.sleep(max(0, start + 0.9*expected - time.time()))
+            interval = self.poll_min
+            while True:
+                polls = polls + 1
+                if self.EndedSweep():
+                    break
+                if timeout is not None and time.time() - start > timeout:
+                    raise TimeoutError("Timeout waiting for the OSA AQ63XX sweep")
+                time.sleep(interval)
+                interval = min(2*interval, self.poll_max)
+        duration = time.time() - start
+        if learn:
+            self.sweep_durations.append(duration)
+            del self.sweep_durations[:-100]
+        durations = self.sweep_durations or [duration]
+        return {"duration": duration, "polls": polls, "expected": expected,
+                "mean": float(np.mean(durations)),
+                "std": float(np.std(durations)),
+                "count": len(self.sweep_durations)}
     
     def StopSweep(self):
         if self.osaOK:
@@ -156,12 +264,14 @@ class AQ63XX:
         if self.osaOK:
             resp = self.osa.query("sens:wav:start?")
             startwavelength = float(resp)*1e9
+            self.state["start"] = startwavelength
             return startwavelength
         else:
             return 0
     
     def SetStartWavelength(self, wl):
         if self.osaOK:
+            self.state["start"] = wl
             wl = wl*1e-9
             self.osa.write("sens:wav:start " + str(wl))
     
@@ -169,12 +279,14 @@ class AQ63XX:
         if self.osaOK:
             resp = self.osa.query("sens:wav:stop?")
             stopwavelength = float(resp)*1e9
+            self.state["stop"] = stopwavelength
             return stopwavelength
         else:
             return 0
     
     def SetStopWavelength(self, wl):
         if self.osaOK:
+            self.state["stop"] = wl
             wl = wl*1e-9
             self.osa.write("sens:wav:stop " + str(wl))
     
@@ -188,6 +300,9 @@ class AQ63XX:
     
     def SetCenterWavelength(self, wl):
         if self.osaOK:
+            # start and stop move with the center, query them again
+            self.state.pop("start", None)
+            self.state.pop("stop", None)
             wl = wl*1e-9
             self.osa.write("sens:wav:center " + str(wl))
     
@@ -211,6 +326,9 @@ class AQ63XX:
                 self.HorizonScale(is_wavelength=False)
             
             self.osa.write("sens:wav:span {:.3f} ".format(wl)+ wl_unit)
+            # start and stop move with the span, query them again
+            self.state.pop("start", None)
+            self.state.pop("stop", None)
     
     def GetResBW(self):
         if self.osaOK:
@@ -317,11 +435,15 @@ class AQ63XX:
         if self.osaOK:
             self.osa.write("init:smod auto")
             self.osa.write("init")
+            # the auto sweep chooses the wavelength range itself
+            self.invalidate()
     
     def PeakCenter(self):
         if self.osaOK:
             self.osa.write("calc:mark:auto on")
             self.osa.write("calc:mark:scen")
+            # the span is moved to center the peak
+            self.invalidate()
     
     def GetData(self):
         data_x = []
@@ -333,46 +455,37 @@ class AQ63XX:
         return data_x, data_y
     
     def GetBinTrace(self):
-        counter = 0
-        while counter<100 and self.EndedSweep()==False:
-            time.sleep(.1)
+        try:
+            self.wait_sweep(timeout=10)
+        except TimeoutError:
             #print("Waiting for Acquisition.")
-            counter = counter+1
+            pass
 
+        # read by the byte count of the block header, the payload may hold 
+        # the termination character of the Ethernet session
         data_y = self.osa.query_binary_values("trac:data:y? " + self.trace, 
-                                        datatype='f', is_big_endian=False)
+                                              datatype='f', is_big_endian=False,
+                                              container=np.array)
         # data_x = self.osa.query_binary_values("trac:data:x? " + self.trace, 
         #                                 datatype='f', is_big_endian=False)
-        start = self.GetStartWavelength()
-        stop = self.GetStopWavelength()
-        data_x = np.linspace(start, stop, len(data_y))
-        return np.array(data_x), np.array(data_y)
+        # pyvisa returns a read only view of the block and the axis is 
+        # shared, the caller gets arrays of its own
+        data_x = self.xaxis(len(data_y)).copy()
+        return data_x, data_y.copy()
 
     
     def GetASCIITrace(self):
         if self.osaOK:
             # print('OSA ok')
-            data_y = self.osa.query("trac:data:y? " + self.trace)
-            stringlist_y = data_y.split(",")
-            numlist_y = []
+            data_y = scpidata.parse_ascii(self.osa.query("trac:data:y? " + self.trace))
 
-            # data_x = self.osa.query("trac:data:x? " + self.trace)
-            # stringlist_x = data_x.split(",")
-            # numlist_x = []
-            
-            for i in range(0, len(stringlist_y)):
-                # numlist_x.append(float(stringlist_x[i]))
-                numlist_y.append(float(stringlist_y[i]))
+            # data_x = scpidata.parse_ascii(self.osa.query("trac:data:x? " + self.trace))
 
-            start = self.GetStartWavelength()
-            stop = self.GetStopWavelength()
-            numlist_x = np.linspace(start, stop, len(numlist_y))
+            data_x = self.xaxis(len(data_y)).copy() # the cached axis is read only
 
-            return numlist_x, numlist_y
+            return data_x, data_y
         else:
-            arr = []
-            for i in range(0,self.traceLength):
-                arr[i] = "0"
+            arr = np.zeros(self.traceLength)
             return arr, arr
     
     def ChangeTrace(self, tr, wr=True):
@@ -393,27 +506,28 @@ class AQ63XX:
             elif tr == 6:
                 self.trace = "trg"
                 
-            self.osa.write("trac:stat:tra fix")
-            self.osa.write("trac:stat:trb fix")
-            self.osa.write("trac:stat:trc fix")
-            self.osa.write("trac:stat:trd fix")
-            self.osa.write("trac:stat:tre fix")
-            self.osa.write("trac:stat:trf fix")
-            self.osa.write("trac:stat:trg fix")
+            with self.batch():
+                self.osa.write("trac:stat:tra fix")
+                self.osa.write("trac:stat:trb fix")
+                self.osa.write("trac:stat:trc fix")
+                self.osa.write("trac:stat:trd fix")
+                self.osa.write("trac:stat:tre fix")
+                self.osa.write("trac:stat:trf fix")
+                self.osa.write("trac:stat:trg fix")
         
-            self.osa.write("trac:stat:tra off")
-            self.osa.write("trac:stat:trb off")
-            self.osa.write("trac:stat:trc off")
-            self.osa.write("trac:stat:trd off")
-            self.osa.write("trac:stat:tre off")
-            self.osa.write("trac:stat:trf off")
-            self.osa.write("trac:stat:trg off")
+                self.osa.write("trac:stat:tra off")
+                self.osa.write("trac:stat:trb off")
+                self.osa.write("trac:stat:trc off")
+                self.osa.write("trac:stat:trd off")
+                self.osa.write("trac:stat:tre off")
+                self.osa.write("trac:stat:trf off")
+                self.osa.write("trac:stat:trg off")
         
-            self.osa.write("trac:act " + self.trace)
-            self.osa.write("trac:stat:" + self.trace + " on")
+                self.osa.write("trac:act " + self.trace)
+                self.osa.write("trac:stat:" + self.trace + " on")
     
-            if wr:
-                self.osa.write("trac:attr:" + self.trace + " write")
+                if wr:
+                    self.osa.write("trac:attr:" + self.trace + " write")
     
     def EndedSweep(self):
         if self.osaOK:
@@ -436,6 +550,9 @@ class AQ63XX:
 
         self.osa.write(':SENSe:WAVelength:STARt {:.3f}'.format(lbd_ini)+lbd_unit)
         self.osa.write(':SENSe:WAVelength:STOP {:.3f}'.format(lbd_end)+lbd_unit)
+        if lbd_unit == 'NM':
+            self.state["start"] = round(lbd_ini, 3)
+            self.state["stop"] = round(lbd_end, 3)
         #self.osa.write(':SENSe:BANDwidth:RESolution {:.3f}'.format(resolution)+resolution_unit)
         self.osa.write(':TRACe:ACTive TRA')
 
@@ -446,42 +563,7 @@ class AQ63XX:
         This function interprets bytes as packed by binary data.
         It is supposed to get the output of the Yokogawa AQ6370C Optical Spectrum Analyser and convert to floats (regard-less of the span).
         '''
-        
-        #Grab the beginning section of the image file, which will contain the header.
-        Header = str(data_in[0:12])
-        #print("Header is " + str(Header))
-        
-        #Find the start position of the IEEE header, which starts with a '#'.
-        startpos = Header.find("#")
-        #print("Start Position reported as " + str(startpos))
-        
-        #Check for problem with start position.
-        if startpos < 0:
-            raise IOError("No start of block found")
-            
-        #Find the number that follows '#' symbol.  This is the number of digits in the block length.
-        Size_of_Length = int(Header[startpos+1])
-        #print("Size of Length reported as " + str(Size_of_Length))
-        
-        ##Now that we know how many digits are in the size value, get the size of the image file.
-        Image_Size = int(Header[startpos+2:startpos+2+Size_of_Length])
-        #print("Number of bytes in image file are: " + str(Image_Size))
-        
-        # Get the length from the header
-        offset = startpos+Size_of_Length
-        
-        # Extract the data out into a list.
-        data_raw = data_in[offset:offset+Image_Size]
-        float_len=4 #A Float takes 4 chars en this packed data
-        data_len=int( len(data_raw)/float_len )
-        #print('Number of points in data ', data_len)
-        
-        output_vec=np.zeros(data_len)
-        for i in range(data_len):
-            output_vec[i]=struct.unpack('<f', data_raw[float_len*i:float_len*(i+1)])[0]
-        
-        
-        return(output_vec)
+        return scpidata.decode_block(data_in, datatype='f', is_big_endian=False)
 
     def trace_data(self, axis = "Y"):
         """
@@ -0,0 +1,363 @@
+"""This module gives a lazy, read only view of the measurements saved under
+'transmission data/'.
+
+The files are indexed once, from their names only, following the naming of
+the save blocks of the acquisition scripts, e.g.
+`08DEZ21_chip2_R-2R-R_wg-ring gap 800 nm_ring-ring gap 500 nm_TE_heater1.csv`.
+The first time a file is accessed it is converted to a raw float64 array
+(one row per column) in a cache folder, and opened memory-mapped from then
+on, so only the parts of the sweeps actually used are read into memory::
+
+    import archive
+
+    data = archive.Archive("transmission data")
+    for sweep in data.select(gap=700, polarization='TE'):
+        print(sweep.meta['date'], sweep['cav'].min())
+
+The cache is rebuilt for a file whose size or modification time changed.
+Empty files, left by interrupted runs, are not indexed and are listed in
+:attr:`Archive.empty`.
+"""
+
+__all__ = ['Archive', 'Sweep', 'parse_name', 'parse_date']
+
+import csv
+import datetime
+import hashlib
+import json
+import os
+import pickle
+import re
+
+import numpy as np
+
+# English and Portuguese month abbreviations used in the file names
+_months = {'JAN': 1, 'FEB': 2, 'FEV': 2, 'MAR': 3, 'APR': 4, 'ABR': 4,
+           'MAY': 5, 'MAI': 5, 'JUN': 6, 'JUL': 7, 'AUG': 8, 'AGO': 8,
+           'SEP': 9, 'SET': 9, 'OCT': 10, 'OUT': 10, 'NOV': 11, 'DEC': 12,
+           'DEZ': 12}
+
+# file extension -> kind of measurement
+extensions = {'.pkl': 'sweep',  # DataFrame of a DAQ sweep
+              '.csv': 'heater',  # heater power, resistance and current
+              }
+
+_index_name = 'index.json'
+
+
+def parse_date(text):
+    """Return the date of a file name token, '08DEZ21' or '22-01-13'
+    (yy-mm-dd), None if it is not a date.
+
+    :param text: The token
+    :type text: str
+    :rtype: datetime.date
+    """
+    text = text.strip()
+    match = re.fullmatch(r'(\d{1,2})([A-Za-z]{3})(\d{2})', text)
+    try:
+        if match and match.group(2).upper() in _months:
+            day, month, year = match.groups()
+            return datetime.date(2000 + int(year), _months[month.upper()],
+                                 int(day))
+        match = re.fullmatch(r'(\d{2})-(\d{2})-(\d{2})', text)
+        if match:
+            year, month, day = map(int, match.groups())
+            return datetime.date(2000 + year, month, day)
+    except ValueError:
+        pass
+    return None
+
+
+def parse_name(filename):
+    """Parse the metadata out of a file name.
+
+    The name is split on '_' and the tokens are recognized by their form:
+    date, 'chip<N>' or 'chip' followed by the chip name, either followed by
+    the device, 'wg-ring gap <n> nm' (gap) and 'ring-ring gap <n> nm' (ring_gap), TE/TM (polarization),
+    'heater<N>', 'through port'/'drop port' (port), 'broadband'/'narrow band'
+    (span), '<x>mA', '<x>mW', '<x>dBm', and a bare number after the heater
+    (step). The other tokens are kept in 'extra'.
+
+    :param filename: File name or path
+    :type filename: str
+    :rtype: dict
+    """
+    name = os.path.splitext(os.path.basename(filename))[0]
+    meta = {'date': None, 'chip': None, 'device': None, 'gap': None,
+            'ring_gap': None, 'polarization': None, 'heater': None,
+            'port': None, 'span': None, 'step': None, 'current_mA': None,
+            'power_mW': None, 'power_dBm': None, 'test': False}
+    extra = []
+    tokens = [token.strip() for token in name.split('_')]
+    i = 0
+    while i < len(tokens):
+        token = tokens[i]
+        i += 1
+        date = parse_date(token)
+        match = None
+        if not token:
+            continue
+        elif date and meta['date'] is None:
+            meta['date'] = date
+        elif token.lower() == 'test':
+            meta['test'] = True
+        elif token.lower() == 'chip' and i < len(tokens):
+            # 'chip_3 degenerated coupled rings': the number is the chip, the
+            # rest the device, as after 'chip<N>'
+            match = re.fullmatch(r'(\d+)\s*(.*)', tokens[i])
+            if match:
+                meta['chip'] = match.group(1)
+                meta['device'] = match.group(2) or None
+            else:
+                meta['chip'] = tokens[i]
+            i += 1
+        elif re.fullmatch(r'chip\s*\d+', token, re.I):
+            meta['chip'] = re.sub(r'\D', '', token)
+            # the device follows the chip number, e.g. R-2R-R
+            if i < len(tokens) and 'gap' not in tokens[i]:
+                meta['device'] = tokens[i]
+                i += 1
+        elif re.fullmatch(r'wg-ring gap (\d+) nm', token):
+            meta['gap'] = int(re.search(r'\d+', token).group())
+        elif re.fullmatch(r'ring-ring gap (\d+) nm', token):
+            meta['ring_gap'] = int(re.search(r'\d+', token).group())
+        elif re.fullmatch(r'(through|drop) port', token):
+            meta['port'] = token.split()[0]
+        elif re.fullmatch(r'heater(\d+)', token):
+            meta['heater'] = int(token[6:])
+        elif token.isdigit() and meta['heater'] is not None \
+                and meta['step'] is None:
+            meta['step'] = int(token)
+        elif re.fullmatch(r'[-+.\de]+(mA|mW|dBm)', token):
+            value, unit = re.fullmatch(r'([-+.\de]+)(mA|mW|dBm)', token).groups()
+            try:
+                meta[{'mA': 'current_mA', 'mW': 'power_mW',
+                      'dBm': 'power_dBm'}[unit]] = float(value)
+            except ValueError:
+                extra.append(token)
+        else:
+            match = re.search(r'\b(TE|TM)\b', token)
+            if match:
+                meta['polarization'] = match.group(1)
+            if re.match(r'(broadband|narrow band)', token):
+                meta['span'] = re.match(r'(broadband|narrow band)',
+                                        token).group(1)
+            rest = re.sub(r'\b(TE|TM)\b|broadband|narrow band', '', token)
+            if rest.strip():
+                extra.append(token)
+    meta['extra'] = '_'.join(extra)
+    return meta
+
+
+class Sweep():
+    """One file of the archive, loaded on first access.
+
+    The columns are float64 arrays memory-mapped from the cache::
+
+        sweep['cav']  # one column
+        sweep.data    # every column, one per row
+
+    :param archive: The archive holding the file
+    :param path: Path of the file, relative to the archive root
+    :type archive: Archive
+    :type path: str
+    """
+
+    def __init__(self, archive, path):
+        self.archive = archive
+        self.path = path
+        self.kind = extensions[os.path.splitext(path)[1].lower()]
+        self.meta = parse_name(path)
+        self.meta['folder'] = os.path.dirname(path)
+        self._data = None
+        self._columns = None
+
+    def __repr__(self):
+        return f"Sweep({self.path!r})"
+
+    def _load(self):
+        if self._data is None:
+            self._columns, self._data = self.archive._open(self)
+        return self._data
+
+    @property
+    def columns(self):
+        """Names of the columns, as in the original file"""
+        self._load()
+        return list(self._columns)
+
+    @property
+    def data(self):
+        """Memory-mapped array of all columns, shape (columns, samples)"""
+        return self._load()
+
+    def __getitem__(self, column):
+        data = self._load()
+        try:
+            return data[self._columns.index(column)]
+        except ValueError:
+            raise KeyError(f"No column {column!r} in {self.path}")
+
+    def release(self):
+        """Close the memory map, it is opened again on the next access"""
+        self._data = None
+
+    def to_dataframe(self):
+        """Return the columns as a pandas DataFrame, copied in memory
+
+        :rtype: pandas.DataFrame
+        """
+        import pandas as pd
+        return pd.DataFrame({name: np.array(self[name])
+                             for name in self.columns})
+
+
+class Archive():
+    """Index of the files under a folder of measurements.
+
+    :param root: Folder of the measurements
+    :param cache: Folder of the converted arrays, '<root>/.cache' if None
+    :type root: str
+    :type cache: str
+    """
+
+    def __init__(self, root='transmission data', cache=None):
+        self.root = root
+        self.cache = cache or os.path.join(root, '.cache')
+        self.sweeps = []
+        self.empty = []  # files of 0 bytes, not indexed
+        self._index = None
+        self.scan()
+
+    def __repr__(self):
+        return f"Archive({self.root!r}, {len(self.sweeps)} files)"
+
+    def __len__(self):
+        return len(self.sweeps)
+
+    def __iter__(self):
+        return iter(self.sweeps)
+
+    def scan(self):
+        """Index the files under the root again, e.g. after new
+        measurements"""
+        cache = os.path.abspath(self.cache)
+        self.sweeps = []
+        self.empty = []
+        for folder, dirs, files in os.walk(self.root):
+            dirs[:] = sorted(d for d in dirs
+                             if os.path.abspath(os.path.join(folder, d)) != cache)
+            for filename in sorted(files):
+                if os.path.splitext(filename)[1].lower() not in extensions:
+                    continue
+                full = os.path.join(folder, filename)
+                path = os.path.relpath(full, self.root)
+                if os.path.getsize(full) == 0:
+                    self.empty.append(path)
+                else:
+                    self.sweeps.append(Sweep(self, path))
+
+    def select(self, kind=None, **criteria):
+        """Return the files whose metadata matches every criterion.
+
+        A criterion is a value, a list/tuple/set of accepted values or a
+        function returning True for the accepted values. Dates may be given
+        as in the file names, e.g. ``date='08DEZ21'``::
+
+            data.select(chip='2', gap=800, polarization='TE', heater=1)
+            data.select(kind='sweep', date=lambda d: d.month == 11)
+
+        :param kind: 'sweep' or 'heater', any if None
+        :type kind: str
+        :rtype: list of Sweep
+        """
+        tests = {}
+        for key, value in criteria.items():
+            if key == 'date' and isinstance(value, str):
+                value = parse_date(value)
+            if callable(value):
+                tests[key] = value
+            elif isinstance(value, (list, tuple, set)):
+                tests[key] = lambda v, accepted=value: v in accepted
+            else:
+                tests[key] = lambda v, accepted=value: v == accepted
+        return [sweep for sweep in self.sweeps
+                if (kind is None or sweep.kind == kind)
+                and all(key in sweep.meta and test(sweep.meta[key])
+                        for key, test in tests.items())]
+
+    def values(self, key):
+        """Return the distinct values of a metadata key, e.g. the chips
+
+        :rtype: list
+        """
+        return sorted({sweep.meta[key] for sweep in self.sweeps
+                       if sweep.meta.get(key) is not None}, key=str)
+
+    # cache
+
+    def _load_index(self):
+        if self._index is None:
+            try:
+                with open(os.path.join(self.cache, _index_name)) as file:
+                    self._index = json.load(file)
+            except (FileNotFoundError, ValueError):
+                self._index = {}
+        return self._index
+
+    def _save_index(self):
+        filename = os.path.join(self.cache, _index_name)
+        with open(filename + '.tmp', 'w') as file:
+            json.dump(self._index, file, indent=1)
+        os.replace(filename + '.tmp', filename)
+
+    def _open(self, sweep):
+        """Return the column names and the memory-mapped array of a file,
+        converting it first if it is not cached or changed"""
+        full = os.path.join(self.root, sweep.path)
+        stat = os.stat(full)
+        index = self._load_index()
+        entry = index.get(sweep.path)
+        if entry is None or entry['size'] != stat.st_size \
+                or entry['mtime'] != stat.st_mtime \
+                or not os.path.exists(os.path.join(self.cache, entry['file'])):
+            entry = self._convert(sweep, full, stat)
+            index[sweep.path] = entry
+            self._save_index()
+        data = np.load(os.path.join(self.cache, entry['file']), mmap_mode='r')
+        return entry['columns'], data
+
+    def _convert(self, sweep, full, stat):
+        columns, data = _readers[sweep.kind](full)
+        os.makedirs(self.cache, exist_ok=True)
+        name = hashlib.sha1(sweep.path.encode()).hexdigest()[:16] + '.npy'
+        filename = os.path.join(self.cache, name)
+        # written aside and renamed, an interrupted conversion is redone
+        with open(filename + '.tmp', 'wb') as file:
+            np.save(file, np.ascontiguousarray(data, dtype=float))
+        os.replace(filename + '.tmp', filename)
+        return {'file': name, 'columns': columns, 'shape': list(data.shape),
+                'size': stat.st_size, 'mtime': stat.st_mtime}
+
+
+def _read_pickle(filename):
+    # the pickled DataFrames need pandas to be loaded
+    with open(filename, 'rb') as file:
+        df = pickle.load(file)
+    columns = [str(name) for name in df]
+    return columns, np.array([np.asarray(df[name], dtype=float)
+                              for name in df])
+
+
+def _read_csv(filename):
+    # csv saved by DataFrame.to_csv, the first column is the row index
+    with open(filename, newline='') as file:
+        header = next(csv.reader(file))
+    data = np.loadtxt(filename, delimiter=',', skiprows=1, ndmin=2)
+    if header and header[0] == '':
+        header, data = header[1:], data[:, 1:]
+    return header, data.T
+
+
+_readers = {'sweep': _read_pickle, 'heater': _read_csv}
@@ -184,17 +184,22 @@ class MainWindow(FormUI, WindowUI):
             self.gauss_W = self.gauss_W_0*r3
 
         self.launchwl.append(self.startSpin.value())
-        startime = time.time()
-        prep_elapsed = time.time() - startime
-        while self.launchwl[-1] <= self.startSpin.value() and prep_elapsed < self.timeout:
-            if not self.simulate:
-                self.launchwl[-1] = self.laser.getWL(self.slotSpin.value())
-            else:
+        if not self.simulate:
+            # the laser is polled at a bounded rate until it passes the start wavelength
+            try:
+                launchtime = self.laser.wait_sweep_started(self.slotSpin.value(), self.startSpin.value(),
+                                                           self.timeout)
+            except TimeoutError:
+                launchtime = time.time()
+        else:
+            startime = time.time()
+            while self.launchwl[-1] <= self.startSpin.value() and time.time() - startime < self.timeout:
                 if (time.time() - startime)*1000.0 >= self.sweep_start_delay:
                     self.launchwl[-1] = self.startSpin.value() + np.random.uniform(0.000, 0.1)
-            prep_elapsed = time.time() - startime
+                time.sleep(0.005)
+            launchtime = time.time()
         
-        self.launchtime.append(time.time())
+        self.launchtime.append(launchtime)
         self.sweepspan = np.abs(self.stopSpin.value() - self.launchwl[-1])
         if self.launchwl[-1] < 100:
             self.sweepesttime = (self.stopSpin.value() - self.startSpin.value())/self.speedSpin.value()
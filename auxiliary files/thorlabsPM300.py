@@ -5,7 +5,7 @@ Created on Mon Jan 8 11:00:00 2019
 @author: Paulo Jarschel
 """
 
-import visa
+import visasessions
 import numpy as np
 
 class ThorLabsPM300:
@@ -24,18 +24,17 @@ class ThorLabsPM300:
 
     def close(self):
         if self.ok:
-            self.pm.close()
+            visasessions.close_session(self.pm)
             self.ok = False
 
     def init(self):
-        self.rm = visa.ResourceManager("@ni")
-        list = self.rm.list_resources()
+        self.rm = visasessions.resource_manager()
         self.pm = None
-        for i in range(0, len(list)):
-            if self.stringsearch in list[i]:
-                self.pm = self.rm.open_resource(list[i])
-                self.ok = True
-                break
+        try:
+            self.pm = visasessions.open_session(visasessions.find_resource(self.stringsearch))
+            self.ok = True
+        except LookupError:
+            pass
 
     def readPwr(self, db=True):
         if self.ok:
@@ -0,0 +1,71 @@
+"""Benchmarks of the acquisition flows, run against the simulated
+instruments of the simulation module.
+
+Every flow is split in stages and, for each stage, the wall time, the CPU
+time, the SCPI writes and reads (round trips), the bytes transferred and the
+DAQ samples are recorded. Results are written as JSON so they can be
+compared between commits::
+
+    python -m benchmarks --output results.json
+    python -m benchmarks --flows osa_trace,scope_capture --repeat 3
+
+Micro benchmarks of single functions live in their own modules, e.g.
+``python -m benchmarks.ascii_trace``.
+"""
+
+__all__ = ['Recorder']
+
+import time
+from contextlib import contextmanager
+
+import simulation
+
+
+class Recorder():
+    """Collect the per stage measurements of a flow.
+
+    A stage entered several times, e.g. in a loop, is accumulated and its
+    number of calls counted.
+
+    :param world: Simulation state whose traffic counters are read, the
+        simulation module world if None
+    """
+
+    def __init__(self, world=None):
+        self.world = world
+        self.stages = {}
+
+    def _counters(self):
+        world = self.world or simulation.world
+        return dict(world.counters)
+
+    @contextmanager
+    def stage(self, name):
+        """Measure the block as the stage `name`"""
+        counters = self._counters()
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        try:
+            yield
+        finally:
+            result = {'wall_s': time.perf_counter() - wall,
+                      'cpu_s': time.process_time() - cpu}
+            after = self._counters()
+            for key in after:
+                result[key] = after[key] - counters.get(key, 0)
+            stage = self.stages.setdefault(name, {'calls': 0})
+            stage['calls'] += 1
+            for key, value in result.items():
+                stage[key] = stage.get(key, 0) + value
+
+    def totals(self):
+        """Sum of every measurement over the stages"""
+        totals = {}
+        for stage in self.stages.values():
+            for key, value in stage.items():
+                if key != 'calls':
+                    totals[key] = totals.get(key, 0) + value
+        return totals
+
+    def result(self):
+        return {'stages': self.stages, 'total': self.totals()}
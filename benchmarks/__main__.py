@@ -0,0 +1,90 @@
+"""Run the flow benchmarks against the simulated instruments and write the
+results as JSON, see :mod:`benchmarks`."""
+
+import argparse
+import contextlib
+import json
+import platform
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+import simulation
+from benchmarks import Recorder, ascii_trace
+from benchmarks.flows import flows
+
+
+def git_commit():
+    """The commit of the working tree, None outside a git checkout"""
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_flow(name, repeat, seed=0, **params):
+    """Run a flow `repeat` times, each in a new simulated world"""
+    runs = []
+    for i in range(repeat):
+        simulation.install(simulation.World(seed=seed))
+        rec = Recorder()
+        used = flows[name](rec, **params)
+        runs.append(rec.result())
+    simulation.uninstall()
+    return {'params': used, 'runs': runs}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks',
+                                     description=__doc__)
+    parser.add_argument('--flows', default=','.join(flows),
+                        help="comma separated flows to run, among: "
+                        + ', '.join(flows))
+    parser.add_argument('--repeat', type=int, default=1,
+                        help="runs of each flow")
+    parser.add_argument('--output', help="JSON file, stdout if not given")
+    parser.add_argument('--no-save', action='store_true',
+                        help="skip the saving of the sweeps to disk")
+    parser.add_argument('--micro', action='store_true',
+                        help="also run the micro benchmarks")
+    args = parser.parse_args(argv)
+
+    names = [name.strip() for name in args.flows.split(',') if name.strip()]
+    for name in names:
+        if name not in flows:
+            parser.error(f"unknown flow {name!r}")
+
+    results = {'meta': {'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                        'platform': platform.platform(),
+                        'python': platform.python_version(),
+                        'numpy': np.__version__,
+                        'commit': git_commit(),
+                        'repeat': args.repeat},
+               'flows': {}}
+    for name in names:
+        params = {}
+        if args.no_save and 'save' in flows[name].__code__.co_varnames:
+            params['save'] = False
+        print(f"{name}...", file=sys.stderr)
+        # the drivers and flows print their progress, stdout is kept for the
+        # JSON report
+        with contextlib.redirect_stdout(sys.stderr):
+            results['flows'][name] = run_flow(name, args.repeat, **params)
+    if args.micro:
+        with contextlib.redirect_stdout(sys.stderr):
+            results['micro'] = {
+                'ascii_trace': ascii_trace.run(repeat=args.repeat)}
+
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as file:
+            file.write(text)
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
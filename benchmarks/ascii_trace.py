@@ -0,0 +1,57 @@
+"""Compare the ASCII trace parsing of scpidata.parse_ascii with the former
+split and float() loop used by AQ63XX.GetASCIITrace and the oscilloscope
+drivers.
+
+Run it from the repository folder::
+
+    python -m benchmarks.ascii_trace
+"""
+
+import timeit
+
+import numpy as np
+
+import scpidata
+
+
+def legacy_parse(data):
+    """The parsing loop the drivers used before scpidata.parse_ascii"""
+    stringlist = data.split(",")
+    numlist = []
+    for i in range(0, len(stringlist)):
+        if "#" in stringlist[i]:
+            firstitem = stringlist[i][10:]
+            numlist.append(float(firstitem))
+        else:
+            numlist.append(float(stringlist[i]))
+    return np.array(numlist)
+
+
+def make_trace(points):
+    """Return an ASCII OSA-like trace with a block header"""
+    y = -60 + 10*np.random.rand(points)
+    body = ",".join("{:+.8E}".format(v) for v in y)
+    return "#8{:08d}{}".format(len(body), body), y
+
+
+def run(sizes=(1000, 10000, 100000), repeat=5):
+    results = []
+    for points in sizes:
+        data, y = make_trace(points)
+        assert np.allclose(legacy_parse(data), scpidata.parse_ascii(data))
+        number = max(1, 100000//points)
+        legacy = min(timeit.repeat(lambda: legacy_parse(data),
+                                   number=number, repeat=repeat))/number
+        vector = min(timeit.repeat(lambda: scpidata.parse_ascii(data),
+                                   number=number, repeat=repeat))/number
+        results.append({'points': points, 'legacy_s': legacy,
+                        'parse_ascii_s': vector, 'speedup': legacy/vector})
+    return results
+
+
+if __name__ == '__main__':
+    print(f"{'points':>8} {'legacy (ms)':>12} {'parse_ascii (ms)':>17} "
+          f"{'speedup':>8}")
+    for r in run():
+        print(f"{r['points']:>8} {1e3*r['legacy_s']:>12.3f} "
+              f"{1e3*r['parse_ascii_s']:>17.3f} {r['speedup']:>8.1f}")
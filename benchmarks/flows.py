@@ -0,0 +1,358 @@
+"""The measurement flows of the acquisition scripts, reduced in size so they
+run in seconds against the simulated instruments.
+
+Each flow follows the driver calls of its script, takes a
+:class:`benchmarks.Recorder` and returns its parameters. Waits that only let
+the hardware settle are shortened by the `settle` argument.
+"""
+
+import tempfile
+import time
+
+import numpy as np
+
+import agilent816xb
+import aq63XX
+import controller
+import heater
+import keithley2400
+import orchestration
+import oscDSOX3104A
+import sweepstore
+
+_dev_read_T = "Dev1/ai1"
+_dev_read_mzi = "Dev1/ai3"
+_dev_write = "Dev1/ao0"
+
+
+def _laser_setup(laser, wth_i, wth_f, llog_step, scan_speed):
+    laser.checkLambdaLogging(wth_i, wth_f, llog_step)
+    with laser.batch(check_errors=True):
+        laser.setState(0, 1)
+        laser.setOutputTrigger(0, 1, mode="STF")
+        laser.setSweepState(0, "Stop")
+        laser.setSweep(0, "CONT", wth_i, wth_f, llog_step, 0, 0, scan_speed)
+        laser.setLambdaLogging(0, True)
+        laser.setPwr(0, 7)
+
+
+def _daq_task(rate, samples, timeout):
+    task = controller.Task()
+    for channel in ("Dev1/ai0", "Dev1/ai1", "Dev1/ai2", "Dev1/ai3"):
+        task.add_channel(channel)
+    task.acquisition_mode = 'N Samples'
+    task.rate = rate
+    task.samples = samples
+    task.timeout = timeout
+    return task
+
+
+def _sweep(rec, laser, task, store, metadata):
+    with rec.stage('acquire'):
+        task.config()
+        task.start()
+        laser.setSweepState(0, "Start")
+        r = task.read()
+        task.stop()
+    with rec.stage('wavelength'):
+        wl = agilent816xb.align_lambda_log(laser.getLambdaLog(0), r[0])
+        laser.setSweepState(0, "Stop")
+    if store is not None:
+        with rec.stage('save'):
+            store.append({'wavelength': wl, 'trigger_laser': r[0, :],
+                          'cav': r[1, :], 'acetylene': r[2, :],
+                          'mzi': r[3, :]}, metadata)
+    return r
+
+
+def daq_sweep(rec, span=1.0, scan_speed=5.0, rate=100e3, llog_step=1e-3,
+              save=True):
+    """Broadband transmission sweep acquired by the DAQ (LaserDaqConfig.py)"""
+    wth_i = 1550.0 - span/2
+    wth_f = wth_i + span
+    scan_time = span/scan_speed
+    with rec.stage('connect'):
+        laser = agilent816xb.Agilent816xb()
+        laser.connectlaser()
+    with rec.stage('setup'):
+        _laser_setup(laser, wth_i, wth_f, llog_step, scan_speed)
+        task = _daq_task(rate, int(rate*(scan_time + 0.5)), 1.5*scan_time + 2)
+    with tempfile.TemporaryDirectory() as tmp:
+        store = sweepstore.SweepStore(tmp) if save else None
+        _sweep(rec, laser, task, store,
+               {'span': span, 'rate': rate})
+    with rec.stage('close'):
+        task.close()
+        laser.closelaser()
+    return {'span_nm': span, 'scan_speed_nm_s': scan_speed, 'rate': rate,
+            'save': save}
+
+
+def heater_power_sweep(rec, powers=3, max_current=20e-3, span=1.0,
+                       scan_speed=5.0, rate=100e3, llog_step=1e-3, save=True):
+    """Transmission sweeps at linearly spaced heater powers
+    (KeithleyCurrentControlTransmMaps.py)"""
+    wth_i = 1550.0 - span/2
+    wth_f = wth_i + span
+    scan_time = span/scan_speed
+    with rec.stage('connect'):
+        laser = agilent816xb.Agilent816xb()
+        laser.connectlaser()
+        keithley = keithley2400.Keithley2400SM()
+        keithley.connectSM()
+    with rec.stage('setup'):
+        _laser_setup(laser, wth_i, wth_f, llog_step, scan_speed)
+        keithley.conf_apply_current()
+        keithley.set_compliance_voltage(10)
+        task = _daq_task(rate, int(rate*(scan_time + 0.5)), 1.5*scan_time + 2)
+    with rec.stage('max_power'):
+        controller_ = heater.HeaterPowerController(keithley)
+        controller_.settle_time = 0.05
+        keithley.set_source_current(max_current)
+        res = controller_.measure_settled()
+        controller_.R0 = res
+        controller_.add_point(max_current**2*res, res)
+    with tempfile.TemporaryDirectory() as tmp:
+        store = sweepstore.SweepStore(tmp) if save else None
+        for i, p in enumerate(np.linspace(0, max_current**2*res, powers)):
+            with rec.stage('set_power'):
+                sp = controller_.set_power(p)
+            _sweep(rec, laser, task, store,
+                   {'step': i, 'power_W': p, 'current_A': sp.curr})
+    with rec.stage('close'):
+        task.close()
+        keithley.set_source_current(0)
+        keithley.closeSM()
+        laser.closelaser()
+    return {'powers': powers, 'max_current_A': max_current, 'span_nm': span,
+            'rate': rate, 'save': save}
+
+
+def heater_map(rec, currents1=2, currents3=2, volts=3, osa_points=1001,
+               settle=0.1):
+    """Map of OSA spectra and DAQ transmission versus two heater currents and
+    the DAQ output voltage (DAQ_voltage_ramp.py)"""
+    with rec.stage('connect'):
+        daq = controller.PointIO(_dev_write, rate=200e3)
+        osa = aq63XX.AQ63XX()
+        osa.ConnectOSA(isgpib=True, address=5)
+        keithley3 = keithley2400.Keithley2400SM()
+        keithley3.connectSM(address=25)
+        keithley1 = keithley2400.Keithley2400SM()
+        keithley1.connectSM(address=24)
+    with rec.stage('setup'):
+        osa.osa.write(':CALibration:ZERO off')
+        osa.SetBinary(False)
+        osa.SetStartWavelength(1555.15)
+        osa.SetStopWavelength(1556.15)
+        osa.SetTraceLength(osa_points)
+        osa.SetSensMode("Mid")
+        osa.SingleSweep()
+        osa.wait_sweep()
+        x_a, y_a = osa.GetData()
+        for keithley in (keithley1, keithley3):
+            keithley.conf_apply_current()
+            keithley.set_compliance_voltage(5)
+    current_vec1 = np.linspace(30.2, 30.6, currents1)
+    current_vec3 = np.linspace(31.2, 31.6, currents3)
+    volt_vec = np.linspace(2.0, -2.0, volts)
+    mapOsa = np.zeros((currents1, currents3, volts, len(x_a)))
+    mapTransm = np.zeros((currents1, currents3, volts, 2))
+    for i1, curr1 in enumerate(current_vec1):
+        with rec.stage('set_heaters'):
+            keithley1.set_source_current(curr1*1e-3)
+            time.sleep(settle)
+        for i3, curr3 in enumerate(current_vec3):
+            with rec.stage('set_heaters'):
+                keithley3.set_source_current(curr3*1e-3)
+                time.sleep(settle)
+            for iv, v0 in enumerate(volt_vec):
+                with rec.stage('set_voltage'):
+                    daq.write(v0, _dev_write)
+                with rec.stage('osa_sweep'):
+                    osa.SingleSweep()
+                    osa.wait_sweep(timeout=60)
+                    x_a, y_a = osa.GetData()
+                mapOsa[i1, i3, iv] = y_a
+                with rec.stage('daq_read'):
+                    mapTransm[i1, i3, iv] = daq.read_settled(
+                        [_dev_read_T, _dev_read_mzi], 100, tol=1e-3)
+            daq.write(0, _dev_write)
+    with rec.stage('close'):
+        osa.CloseOSA()
+        keithley1.set_source_current(0)
+        keithley3.set_source_current(0)
+        keithley1.closeSM()
+        keithley3.closeSM()
+        daq.close()
+    return {'points': currents1*currents3*volts, 'osa_points': osa_points,
+            'settle_s': settle}
+
+
+def _osa_sweep(osa):
+    osa.SingleSweep()
+    osa.wait_sweep(timeout=60)
+
+
+def _osa_fetch(osa):
+    return osa.GetData()[1]
+
+
+def _osa_retry(osa, action, attempts=3):
+    for attempt in range(1, attempts + 1):
+        try:
+            return action(osa)
+        except Exception:
+            if attempt == attempts:
+                raise
+            time.sleep(0.1)
+
+
+def heater_map_async(rec, currents1=2, currents3=2, volts=3, osa_points=1001,
+                     settle=0.1):
+    """heater_map with the instruments driven concurrently by orchestration:
+    the setup of the instruments overlaps, the heaters settle together, the
+    DAQ reads during the OSA sweep and the OSA trace is fetched while the
+    next point is set"""
+    async def setup():
+        plan = orchestration.Plan()
+        plan.step('daq', controller.PointIO, _dev_write, rate=200e3)
+        plan.step('osa', osa.run, _setup_osa, osa_points)
+        for keithley, address in ((keithley1, 24), (keithley3, 25)):
+            plan.step(address, keithley.run, _setup_keithley, address)
+        return await plan.run()
+
+    async def fetch(index):
+        mapOsa[index] = await osa.run(_osa_retry, _osa_fetch)
+
+    async def grid():
+        # the last trace is fetched with the set up of the next point, and
+        # always before the next sweep
+        pending = []
+        for i1, curr1 in enumerate(current_vec1):
+            await keithley1.set_source_current(curr1*1e-3, settle=settle)
+            for i3, curr3 in enumerate(current_vec3):
+                await keithley3.set_source_current(curr3*1e-3, settle=settle)
+                await orchestration.gather(keithley1.ready(), keithley3.ready(),
+                                           *pending)
+                pending = []
+                for iv, v0 in enumerate(volt_vec):
+                    await orchestration.gather(daq.write(v0, _dev_write),
+                                               *pending)
+                    pending = []
+                    _, mapTransm[i1, i3, iv] = await orchestration.gather(
+                        osa.run(_osa_retry, _osa_sweep),
+                        daq.read_settled([_dev_read_T, _dev_read_mzi], 100,
+                                         tol=1e-3))
+                    pending = [fetch((i1, i3, iv))]
+                await daq.write(0, _dev_write)
+        await orchestration.gather(*pending)
+
+    osa = orchestration.Instrument(aq63XX.AQ63XX(), 'osa')
+    keithley1 = orchestration.Instrument(keithley2400.Keithley2400SM(), 'k1')
+    keithley3 = orchestration.Instrument(keithley2400.Keithley2400SM(), 'k3')
+    with rec.stage('setup'):
+        results = orchestration.run(setup())
+        daq = orchestration.Instrument(results['daq'], 'daq')
+    x_a, y_a = results['osa']
+    current_vec1 = np.linspace(30.2, 30.6, currents1)
+    current_vec3 = np.linspace(31.2, 31.6, currents3)
+    volt_vec = np.linspace(2.0, -2.0, volts)
+    mapOsa = np.zeros((currents1, currents3, volts, len(x_a)))
+    mapTransm = np.zeros((currents1, currents3, volts, 2))
+    with rec.stage('grid'):
+        orchestration.run(grid())
+    with rec.stage('close'):
+        osa.driver.CloseOSA()
+        for keithley in (keithley1, keithley3):
+            keithley.driver.set_source_current(0)
+            keithley.driver.closeSM()
+            keithley.close()
+        daq.driver.close()
+        osa.close()
+        daq.close()
+    return {'points': currents1*currents3*volts, 'osa_points': osa_points,
+            'settle_s': settle}
+
+
+def _setup_osa(osa, osa_points):
+    osa.ConnectOSA(isgpib=True, address=5)
+    osa.osa.write(':CALibration:ZERO off')
+    osa.SetBinary(False)
+    osa.SetStartWavelength(1555.15)
+    osa.SetStopWavelength(1556.15)
+    osa.SetTraceLength(osa_points)
+    osa.SetSensMode("Mid")
+    _osa_sweep(osa)
+    return osa.GetData()
+
+
+def _setup_keithley(keithley, address):
+    keithley.connectSM(address=address)
+    keithley.conf_apply_current()
+    keithley.set_compliance_voltage(5)
+
+
+def osa_trace(rec, points=20001, traces=5):
+    """OSA sweep and trace transfer, in binary and ASCII"""
+    with rec.stage('connect'):
+        osa = aq63XX.AQ63XX()
+        osa.ConnectOSA()
+        osa.InitOSA(print_bool=False)
+    with rec.stage('setup'):
+        osa.SetStartWavelength(1540)
+        osa.SetStopWavelength(1560)
+        osa.SetTraceLength(points)
+    with rec.stage('sweep'):
+        osa.SingleSweep()
+        osa.wait_sweep(timeout=60)
+    for binary in (True, False):
+        osa.SetBinary(binary)
+        with rec.stage('fetch_binary' if binary else 'fetch_ascii'):
+            for i in range(traces):
+                x, y = osa.GetData()
+    with rec.stage('close'):
+        osa.CloseOSA()
+    return {'points': points, 'traces': traces}
+
+
+def scope_capture(rec, points=100000, span=1.0, scan_speed=5.0):
+    """Capture of the four scope channels during a laser sweep
+    (LaserOscConfig.py)"""
+    scan_time = span/scan_speed
+    with rec.stage('connect'):
+        laser = agilent816xb.Agilent816xb()
+        laser.connectlaser()
+        osc = oscDSOX3104A.OSCDSOX3104A()
+        osc.connectOSC()
+        osc.initOSC()
+    with rec.stage('setup'):
+        _laser_setup(laser, 1550.0 - span/2, 1550.0 + span/2, 1e-3, scan_speed)
+        osc.setTraceLength(points)
+        osc.setTimeScale(scan_time/10)
+        osc.setStartTime(scan_time/2)
+        for chan in (1, 2, 3, 4):
+            osc.setChannel(chan, 1)
+        osc.setEdgeTrigger(1, level=1000e-3)
+    with rec.stage('sweep'):
+        laser.setSweepState(0, "Start")
+        laser.wait_sweep_finished(0, timeout=2*scan_time + 5)
+    with rec.stage('fetch_all_channels'):
+        t, volt = osc.get_all_channels((1, 2, 3, 4))
+    with rec.stage('fetch_per_channel'):
+        volt = [osc.getBinTrace(chan) for chan in (1, 2, 3, 4)]
+    with rec.stage('close'):
+        laser.setSweepState(0, "Stop")
+        osc.closeOSC()
+        laser.closelaser()
+    return {'points': points, 'span_nm': span}
+
+
+# name -> flow, in the order they are run
+flows = {'daq_sweep': daq_sweep,
+         'heater_power_sweep': heater_power_sweep,
+         'heater_map': heater_map,
+         'heater_map_async': heater_map_async,
+         'osa_trace': osa_trace,
+         'scope_capture': scope_capture,
+         }
@@ -11,15 +11,48 @@ it::
     task.config()
     r = task.read()
     task.close() 
+
+For continuous acquisitions the task can also stream into a preallocated 
+ring buffer on a background thread, so consumers only take views or 
+snapshots of the latest samples::
+
+    task.acquisition_mode = 'Continuous Samples'
+    task.samples = 10000
+    task.config()
+    buffer = task.start_stream()
+    r = buffer.snapshot()
+    task.stop_stream()
+
+Long acquisitions can be streamed block by block to a .npy file instead of
+being held in memory, and are returned memory-mapped::
+
+    task.acquisition_mode = 'N Samples'
+    task.samples = 20000000
+    task.config()
+    r = task.read_to_file("sweep.npy", progress=lambda n, total: print(n))
+
+At the highest rates the driver can log to a TDMS file by itself ('Log
+Only'), and the file is read back memory-mapped with the scaling applied::
+
+    task.tdmsLogging = True
+    task.tdmsFilepath = "sweep.tdms"
+    task.logging_mode = 'Log Only'
+    task.config()
+    r = controller.read_tdms(task.run_logging())
 """
 
-__all__ = ['Task']
+__all__ = ['Task', 'RingBuffer', 'PointIO', 'read_tdms']
 __version__ = '0.1.1'
 __author__ = 'Flavio Moraes'
 
+import os
+import threading
+import time
+
 import nidaqmx
 import nidaqmx.constants as cts
 import numpy as np
+from nidaqmx import stream_readers
 
 # A dictionary to convert string inputs into nidaqmx constants
 dict_ = {'Rising': cts.Slope.RISING,
@@ -184,6 +217,125 @@ class Channel(object):
         return dict_.__repr__()     
 
 
+class RingBuffer():
+    """A preallocated multi-channel ring buffer of float64 samples.
+
+    The buffer is made of `nblocks` slots of shape (channels, block), each 
+    one contiguous in memory so that a DAQ reader can fill it in place 
+    without any intermediate allocation. The writer asks for the next free 
+    slot with next_slot() and publishes it with commit(). Consumers may take
+    a view of the last block with last_block() or an independent copy of 
+    the latest samples with snapshot().
+
+    Views are only valid until the writer wraps around the buffer, use 
+    snapshot() when the data must be kept.
+    """
+    def __init__(self, channels, block, nblocks=16):
+        self.channels = channels
+        self.block = block
+        self.nblocks = nblocks
+        self.data = np.zeros((nblocks, channels, block), dtype=np.float64)
+        self.blocks_written = 0
+        self.lock = threading.Lock()
+
+    @property
+    def size(self):
+        """Number of samples per channel that the buffer can hold"""
+        return self.nblocks*self.block
+
+    @property
+    def samples_written(self):
+        """Total number of samples per channel written so far"""
+        return self.blocks_written*self.block
+
+    def next_slot(self):
+        """Return a view of the slot to be filled by the writer"""
+        return self.data[self.blocks_written % self.nblocks]
+
+    def commit(self):
+        """Publish the slot returned by the last next_slot() call"""
+        with self.lock:
+            self.blocks_written += 1
+
+    def write(self, block):
+        """Copy a (channels, block) array into the next slot"""
+        np.copyto(self.next_slot(), block)
+        self.commit()
+
+    def last_block(self):
+        """Return a view of the last committed block or None"""
+        with self.lock:
+            if not self.blocks_written:
+                return None
+            return self.data[(self.blocks_written - 1) % self.nblocks]
+
+    def snapshot(self, n=None):
+        """Return a copy of the latest `n` samples of every channel.
+
+        :param n: Number of samples per channel, defaults to all the samples
+            available in the buffer
+        :type n: int
+        :rtype: numpy.ndarray with shape (channels, n)
+        """
+        with self.lock:
+            nblocks = min(self.blocks_written, self.nblocks - 1)
+            if n is not None:
+                nblocks = min(nblocks, -(-n//self.block))
+            last = self.blocks_written
+            # the slot after the last committed one may be under writing
+            slots = [(last - nblocks + k) % self.nblocks 
+                     for k in range(nblocks)]
+            out = np.concatenate([self.data[k] for k in slots], axis=1) \
+                if slots else np.empty((self.channels, 0))
+        if n is not None:
+            out = out[:, -n:]
+        return out
+
+
+class _NpyFile():
+    """A .npy file of shape (samples, channels) growing by blocks.
+
+    The header has a fixed length and is rewritten after every block, so the
+    file is always a valid array of the samples written so far.
+    """
+    header_length = 128
+
+    def __init__(self, filename, channels, dtype='float64'):
+        self.dtype = np.dtype(dtype)
+        self.channels = channels
+        self.samples = 0
+        self.file = open(filename, 'wb')
+        self._write_header()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _write_header(self):
+        header = "{{'descr': '{}', 'fortran_order': False, 'shape': ({}, {}), }}"\
+            .format(self.dtype.str, self.samples, self.channels)
+        length = self.header_length - 10
+        self.file.seek(0)
+        self.file.write(b'\x93NUMPY\x01\x00' + 
+                        length.to_bytes(2, 'little') + 
+                        header.ljust(length - 1).encode('latin1') + b'\n')
+
+    def append(self, block):
+        """Write a (channels, n) block at the end of the file"""
+        self.file.seek(0, 2)
+        self.file.write(np.ascontiguousarray(block.T, dtype=self.dtype)\
+                        .tobytes())
+        self.samples += block.shape[1]
+        self._write_header()
+        self.file.flush()
+
+    def close(self):
+        if not self.file.closed:
+            self.file.close()
+
+
 class Task():
     """
     A simplified version for the nidaqmx Task, which represents a DAQmx Task.
@@ -210,6 +362,17 @@ class Task():
     """
     def __init__(self):
         self.nitask = None
+        ##Streaming Variables
+        self.buffer = None
+        self.stream_error = None
+        self._stream_thread = None
+        self._stream_stop = threading.Event()
+        self._sample_callbacks = []
+        self._sample_interval = None
+        self._sample_handler = None
+        ##Incremental Configuration Variables
+        self._committed = None
+        self._stats = {'builds': 0, 'updates': 0, 'unchanged': 0}
         ##Setting Variables
         self.clist = _ChannelList()
         self.mode = None
@@ -278,6 +441,72 @@ class Task():
                         channel['max'], channel['min'])
 
     def config(self, *, timing='intrinsic'):
+        """Apply the task setup to the DAQmx task.
+
+        Only the values changed since the last call are committed: the live 
+        DAQmx task is kept when the channel set is the same and only 
+        timing, triggers or logging are reconfigured, and nothing is sent 
+        when no value changed. The task is rebuilt from scratch when 
+        channels are added, removed or edited.
+
+        :param timing: 'on_demand' for software timed tasks, otherwise the 
+            sample clock is configured from rate, acquisition_mode and 
+            samples
+        :type timing: str
+        """
+        settings = self._settings(timing)
+        last = self._committed
+        if self.nitask is None or last['channels'] != settings['channels']:
+            self._build()
+            self._config_timing(timing)
+            self._config_triggers()
+            self._config_logging()
+            # Register again the every N samples callbacks on the new task
+            if self._sample_callbacks:
+                self._register_sample_handler()
+            self._stats['builds'] += 1
+        elif last == settings:
+            self._stats['unchanged'] += 1
+        else:
+            self.nitask.stop()
+            if last['timing'] != settings['timing']:
+                self._config_timing(timing)
+            if last['triggers'] != settings['triggers']:
+                self._config_triggers(reset=True)
+            if last['logging'] != settings['logging']:
+                self._config_logging(reset=True)
+            self._stats['updates'] += 1
+        self._committed = settings
+
+    def config_stats(self):
+        """Return how many times config() rebuilt the DAQmx task, updated 
+        the live task or had nothing to change.
+
+        :rtype: dict
+        """
+        stats = dict(self._stats)
+        stats['avoided'] = stats['updates'] + stats['unchanged']
+        return stats
+
+    def _settings(self, timing):
+        triggers = []
+        for trigger in (self.stt_trigger, self.ref_trigger):
+            triggers.extend((key, value.get()) 
+                            for key, value in vars(trigger).items())
+        return {
+            'channels': tuple((c.name, getattr(c, 'type', None), 
+                               c.maxInputRange, c.minInputRange) 
+                              for c in self.clist),
+            'timing': (timing, self.rate.get(), self.acquisition_mode.get(),
+                       self.samples.get()),
+            'triggers': tuple(triggers),
+            'logging': (self.tdmsLogging.get(), self.tdmsFilepath.get(), 
+                        self.append_data.get(), self.logging_mode.get(),
+                        self.group_name.get(), self.sample_per_file.get(),
+                        self.span.get()),
+            }
+
+    def _build(self):
         if self.nitask:
             self.nitask.close()
         self.nitask = nidaqmx.Task()
@@ -294,15 +523,20 @@ class Task():
                         channel.name, 
                         min_val=channel.minInputRange,
                         max_val=channel.maxInputRange)
-        # Set task timing
+
+    def _config_timing(self, timing):
         if timing == 'on_demand':
             self.nitask.timing.samp_timing_type=cts.SampleTimingType.ON_DEMAND
         else:
             self.nitask.timing.cfg_samp_clk_timing(
                 self.rate.get(),
                 sample_mode=dict_[self.acquisition_mode.get()],
-                samps_per_chan=self.samples.get())
+                samps_per_chan=int(self.samples.get()))
+
+    def _config_triggers(self, *, reset=False):
         # Set start trigger configuration
+        if reset and self.stt_trigger.ttype == '<None>':
+            self.nitask.triggers.start_trigger.disable_start_trig()
         if self.stt_trigger.ttype == 'Analog Edge':
             self.nitask.triggers.start_trigger.cfg_anlg_edge_start_trig(
                 trigger_source=self.stt_trigger.source.get(),
@@ -311,35 +545,43 @@ class Task():
         elif self.stt_trigger.ttype == 'Analog Window':
             self.nitask.triggers.start_trigger.cfg_anlg_window_start_trig(
                 trigger_source=self.stt_trigger.source.get(),
-                window_top=self.stt_trigger.window_top.get(),
-                window_bottom=self.stt_trigger.window_botget(),
+                window_top=self.stt_trigger.wtop.get(),
+                window_bottom=self.stt_trigger.wbot.get(),
                 trigger_when=dict_[self.stt_trigger.condition.get()])
         elif self.stt_trigger.ttype == 'Digital Edge':
             self.nitask.triggers.start_trigger.cfg_dig_edge_start_trig(
                 trigger_source=self.stt_trigger.source.get(),
                 trigger_edge=dict_[self.stt_trigger.edge.get()])
         # Set reference trigger configuration
+        if reset and self.ref_trigger.ttype == '<None>':
+            self.nitask.triggers.reference_trigger.disable_ref_trig()
         if self.ref_trigger.ttype == 'Analog Edge':
             self.nitask.triggers.reference_trigger.cfg_anlg_edge_ref_trig(
                 trigger_source=self.ref_trigger.source.get(),
-                pretrigger_samples=self.ref_trigger.preTriggerSamples.get(),
+                pretrigger_samples=self.ref_trigger.presamp.get(),
                 trigger_slope=dict_[self.ref_trigger.slope.get()],
                 trigger_level=self.ref_trigger.level.get())
         elif self.ref_trigger.ttype == 'Analog Window':
             self.nitask.triggers.reference_trigger.cfg_anlg_window_ref_trig(
                 trigger_source=self.ref_trigger.source.get(),
-                window_top=self.ref_trigger.window_top.get(),
-                window_bottom=self.ref_trigger.window_bot.get(),
-                pretrigger_samples=self.ref_trigger.preTriggerSamples.get(),
+                window_top=self.ref_trigger.wtop.get(),
+                window_bottom=self.ref_trigger.wbot.get(),
+                pretrigger_samples=self.ref_trigger.presamp.get(),
                 trigger_when=dict_[self.ref_trigger.condition.get()])
         elif self.ref_trigger.ttype == 'Digital Edge':
             self.nitask.triggers.reference_trigger.cfg_dig_edge_ref_trig(
                 trigger_source=self.ref_trigger.source.get(),
-                pretrigger_samples=self.ref_trigger.preTriggerSamples.get(),
+                pretrigger_samples=self.ref_trigger.presamp.get(),
                 trigger_edge=dict_[self.ref_trigger.edge.get()])
+
+    def _config_logging(self, *, reset=False):
         # Set TDMS Loggin configuration
+        if reset and not self.tdmsLogging.get():
+            self.nitask.in_stream.logging_mode = cts.LoggingMode.OFF
         if self.tdmsLogging.get():
-            loggin_samples = self.sample_per_file.get()*self.span.get()
+            # span is the 'span files' switch, 0 samples per file is one file
+            loggin_samples = int(self.sample_per_file.get() or 0)*\
+                int(self.span.get() or 0)
             if self.append_data.get():
                 operation = 'open'
             else:
@@ -347,7 +589,7 @@ class Task():
             self.nitask.in_stream.configure_logging(
                 self.tdmsFilepath.get(), 
                 logging_mode=dict_[self.logging_mode.get()],
-                group_name=self.group_name.get(), 
+                group_name=self.group_name.get() or '', 
                 operation=dict_[operation])
             self.nitask.in_stream.logging_samps_per_file = loggin_samples
 
@@ -356,10 +598,285 @@ class Task():
         if self.nitask is None:
             raise TaskError('Task must be configured before read. Try to use '\
                             'task.config() before task.read()')
-        r = self.nitask.read(
-            number_of_samples_per_channel=self.samples.get(),
-            timeout=self.timeout.get())
-        return np.array(r)
+        if self._log_only():
+            raise TaskError('Samples of "Log Only" tasks are not read, use '\
+                            'task.run_logging() and controller.read_tdms()')
+        nchan = len(self.nitask.ai_channels.channel_names)
+        if not nchan:
+            r = self.nitask.read(
+                number_of_samples_per_channel=self.samples.get(),
+                timeout=self.timeout.get())
+            return np.array(r)
+        samples = int(self.samples.get())
+        r = np.empty((nchan, samples), dtype=np.float64)
+        reader = stream_readers.AnalogMultiChannelReader(self.nitask.in_stream)
+        reader.read_many_sample(r, number_of_samples_per_channel=samples,
+                                timeout=self.timeout.get())
+        if nchan == 1:
+            return r[0]
+        return r
+
+    def read_to_file(self, filename, samples=None, *, block=None, nblocks=16,
+                     dtype='float64', progress=None, start=True):
+        '''Acquire block by block into a .npy file, keeping only one block 
+        in memory, and return the samples memory-mapped from the file.
+
+        'N Samples' tasks acquire task.samples unless `samples` is given. 
+        'Continuous Samples' tasks acquire `samples`, or until `progress` 
+        returns False. The file header is updated after every block, so the 
+        file holds every sample written so far even if the acquisition is 
+        interrupted.
+
+        :param filename: Path of the .npy file, replaced if it exists
+        :param samples: Samples per channel to acquire
+        :param block: Samples per channel read at once, 0.1 s by default
+        :param nblocks: Size of the DAQmx input buffer, in blocks
+        :param dtype: Data type of the file, 'float32' halves its size
+        :param progress: Called as progress(written, total) after every 
+            block, total is None when unbounded. Returning False stops 
+            the acquisition
+        :param start: Start the task, False if it was already started
+        :type filename: str
+        :type samples: int
+        :type block: int
+        :type nblocks: int
+        :type dtype: str
+        :type progress: callable
+        :type start: bool
+        :rtype: numpy.memmap of shape (channels, samples), (samples,) for a 
+            single channel
+        '''
+        if self.nitask is None:
+            raise TaskError('Task must be configured before read. Try to use '\
+                            'task.config() before task.read_to_file()')
+        if samples is None and self.acquisition_mode == 'N Samples':
+            samples = self.samples.get()
+        if samples is None and progress is None:
+            raise TaskError('Continuous acquisitions to a file need samples '\
+                            'or a progress callback to stop')
+        total = None if samples is None else int(samples)
+        block = int(block or max(1000, self.rate.get()//10))
+        if total is not None:
+            block = min(block, total)
+        nchan = len(self.nitask.ai_channels.channel_names)
+        buffer = np.empty((nchan, block), dtype=np.float64)
+        reader = stream_readers.AnalogMultiChannelReader(self.nitask.in_stream)
+        if total is None or total > block*nblocks:
+            # the driver would otherwise buffer the whole acquisition
+            self.nitask.in_stream.input_buf_size = block*nblocks
+        written = 0
+        with _NpyFile(filename, nchan, dtype) as file:
+            if start:
+                self.nitask.start()
+            try:
+                while total is None or written < total:
+                    n = block if total is None else min(block, total - written)
+                    if n < block:
+                        buffer = np.empty((nchan, n), dtype=np.float64)
+                    reader.read_many_sample(buffer, 
+                                            number_of_samples_per_channel=n,
+                                            timeout=self.timeout.get())
+                    file.append(buffer)
+                    written += n
+                    if progress and progress(written, total) is False:
+                        break
+            finally:
+                self.nitask.stop()
+        r = np.load(filename, mmap_mode='r').T
+        if nchan == 1:
+            return r[0]
+        return r
+
+    def _log_only(self):
+        return bool(self.tdmsLogging.get()) and \
+            self.logging_mode == 'Log Only'
+
+    def run_logging(self, duration=None, *, progress=None, poll=0.1, 
+                    start=True):
+        '''Run a 'Log Only' task, the driver writes the samples straight to
+        the TDMS file and none of them goes through Python.
+
+        'N Samples' tasks run until done. 'Continuous Samples' tasks run for
+        `duration` seconds, or until `progress` returns False. Read the file
+        back with :func:`controller.read_tdms`.
+
+        :param duration: Acquisition time of continuous tasks in s
+        :param progress: Called as progress(acquired) every `poll` seconds,
+            returning False stops the acquisition
+        :param poll: Interval between the progress calls in s
+        :param start: Start the task, False if it was already started
+        :type duration: float
+        :type progress: callable
+        :type poll: float
+        :type start: bool
+        :return: Path of the TDMS file
+        :rtype: str
+        '''
+        if self.nitask is None:
+            raise TaskError('Task must be configured before logging. Try to '\
+                            'use task.config() first')
+        if not self._log_only():
+            raise TaskError('run_logging requires tdmsLogging and '\
+                            'logging_mode "Log Only"')
+        finite = self.acquisition_mode == 'N Samples'
+        if not finite and duration is None and progress is None:
+            raise TaskError('Continuous logging needs a duration or a '\
+                            'progress callback to stop')
+        t0 = time.time()
+        if start:
+            self.nitask.start()
+        try:
+            while True:
+                if finite and self.nitask.is_task_done():
+                    break
+                if duration is not None and time.time() - t0 >= duration:
+                    break
+                if finite and time.time() - t0 > self.timeout.get() + \
+                        self.samples.get()/self.rate.get():
+                    raise TaskError('Logging did not finish within the '\
+                                    'timeout')
+                time.sleep(poll)
+                if progress and progress(
+                        self.nitask.in_stream.total_samp_per_chan_acquired)\
+                        is False:
+                    break
+        finally:
+            self.nitask.stop()
+        return self.tdmsFilepath.get()
+
+    def start_stream(self, *, block=None, nblocks=16):
+        '''Start a background acquisition into a ring buffer.
+
+        The task must have been configured with 'Continuous Samples'. Each 
+        block is read in place into a slot of a preallocated 
+        :class:`controller.RingBuffer`, which is returned and is also 
+        available as task.buffer.
+
+        :param block: Samples per channel read at once, defaults to 
+            task.samples
+        :param nblocks: Number of blocks kept in the ring buffer
+        :type block: int
+        :type nblocks: int
+        :rtype: :class:`controller.RingBuffer`
+        '''
+        if self.nitask is None:
+            raise TaskError('It is impossible to stream a task that was not '\
+                            'previously configured. Try to use task.config() '\
+                            'first')
+        if self.acquisition_mode != 'Continuous Samples':
+            raise TaskError('Streaming requires acquisition_mode to be '\
+                            '"Continuous Samples"')
+        if self._stream_thread is not None:
+            raise TaskError('Task is already streaming')
+        block = int(block or self.samples.get())
+        nchan = len(self.nitask.ai_channels.channel_names)
+        self.buffer = RingBuffer(nchan, block, nblocks)
+        self.stream_error = None
+        self.nitask.in_stream.input_buf_size = block*nblocks
+        reader = stream_readers.AnalogMultiChannelReader(self.nitask.in_stream)
+        self._stream_stop.clear()
+        self._stream_thread = threading.Thread(
+            target=self._stream_loop, args=(reader, block), daemon=True)
+        self.nitask.start()
+        self._stream_thread.start()
+        return self.buffer
+
+    def _stream_loop(self, reader, block):
+        try:
+            while not self._stream_stop.is_set():
+                reader.read_many_sample(self.buffer.next_slot(), 
+                                        number_of_samples_per_channel=block,
+                                        timeout=self.timeout.get())
+                self.buffer.commit()
+        except nidaqmx.errors.DaqError as err:
+            self.stream_error = err
+
+    def on_samples(self, n, callback):
+        '''Call `callback` every time `n` samples per channel are acquired.
+
+        The callback is driven by the DAQmx every N samples event, so no 
+        consumer needs to poll task.read(). It receives a (channels, n) 
+        numpy view of the block just read, which is reused for the next 
+        block and must be copied if it is kept after the call. Several 
+        callbacks may be registered as long as they share the same `n`. 
+        Callbacks must be registered before the task is started.
+
+        :param n: Samples per channel between calls
+        :param callback: A function accepting the block as only argument
+        :type n: int
+        :type callback: callable
+        '''
+        if self.nitask is None:
+            raise TaskError('Task must be configured before registering '\
+                            'callbacks. Try to use task.config() first')
+        n = int(n)
+        if self._sample_interval not in (None, n):
+            raise TaskError('Callbacks are already registered every {} '\
+                            'samples'.format(self._sample_interval))
+        self._sample_callbacks.append(callback)
+        if self._sample_interval is None:
+            self._sample_interval = n
+            self._register_sample_handler()
+
+    def clear_sample_callbacks(self):
+        '''Unregister every callback added by on_samples(), then raise the 
+        error of a callback if one failed, see check_stream()'''
+        if self.nitask and self._sample_handler:
+            self.nitask.register_every_n_samples_acquired_into_buffer_event(
+                self._sample_interval, None)
+        self._sample_callbacks = []
+        self._sample_interval = None
+        self._sample_handler = None
+        self.check_stream()
+
+    def check_stream(self):
+        '''Raise the error of the streaming thread or of an on_samples() 
+        callback, if any, and forget it.
+
+        Those errors happen outside the thread of the caller, so they can 
+        only be reported by polling, e.g. from the timer refreshing a plot. 
+        Once a callback failed the following blocks are not passed to the 
+        callbacks anymore.
+        '''
+        error, self.stream_error = self.stream_error, None
+        if error:
+            raise error
+
+    def _register_sample_handler(self):
+        self.stream_error = None
+        n = self._sample_interval
+        nchan = len(self.nitask.ai_channels.channel_names)
+        block = np.empty((nchan, n), dtype=np.float64)
+        reader = stream_readers.AnalogMultiChannelReader(self.nitask.in_stream)
+
+        def handler(task_handle, event_type, number_of_samples, callback_data):
+            # an exception cannot propagate through the DAQmx event, it is 
+            # kept for check_stream(), the first one only
+            if self.stream_error is not None:
+                return 0
+            try:
+                reader.read_many_sample(block, number_of_samples_per_channel=n,
+                                        timeout=self.timeout.get())
+                for callback in self._sample_callbacks:
+                    callback(block)
+            except Exception as err:
+                self.stream_error = err
+            return 0
+
+        # keep a reference so the handler is not garbage collected
+        self._sample_handler = handler
+        self.nitask.register_every_n_samples_acquired_into_buffer_event(
+            n, handler)
+
+    def stop_stream(self):
+        '''Stop the background acquisition, the buffer is kept. Raises the 
+        error that stopped the acquisition or a callback, see check_stream()'''
+        if self._stream_thread is not None:
+            self._stream_stop.set()
+            self._stream_thread.join()
+            self._stream_thread = None
+            self.nitask.stop()
+        self.check_stream()
 
     def write(self, data):
         error = None
@@ -392,9 +909,209 @@ class Task():
                             'configured yet. Try to use task.config() first')
 
     def close(self):
+        if self._stream_thread is not None:
+            self._stream_stop.set()
+            self._stream_thread.join()
+            self._stream_thread = None
+        self._sample_callbacks = []
+        self._sample_interval = None
+        self._sample_handler = None
         if self.nitask:
             self.nitask.close()
             self.nitask = None
+        self._committed = None
+
+
+class PointIO():
+    """On demand single point output and averaged single point input 
+    backed by long lived tasks.
+
+    Creating a DAQmx task costs tens of milliseconds, so instead of opening
+    a new task for every point the output and input tasks are created once
+    and only reconfigured when the requested channels or number of samples
+    change. All the requested input channels are sampled together in one 
+    hardware timed burst::
+
+        pio = controller.PointIO('Dev1/ao0')
+        pio.write(1.5)
+        transmission, mzi = pio.read_mean(['Dev1/ai1', 'Dev1/ai3'], 100)
+        transmission, mzi = pio.read_settled(['Dev1/ai1', 'Dev1/ai3'], 
+                                             tol=1e-3)
+        pio.close()
+    """
+    def __init__(self, ao=None, *, rate=100000, timeout=10):
+        self.ao = ao
+        self.rate = rate
+        self.timeout = timeout
+        self.ao_task = None
+        self.ai_task = None
+        self.settle_reads = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def write(self, voltage, channel=None):
+        '''Write a single voltage to the output channel.
+
+        :param voltage: Voltage to be written
+        :param channel: Output channel, defaults to the one given to the 
+            constructor
+        :type voltage: float
+        :type channel: str
+        '''
+        channel = channel or self.ao
+        if channel is None:
+            raise TaskError('No analog output channel was given')
+        if self.ao_task is None:
+            self.ao_task = Task()
+        if self.ao_task.clist.names != [channel]:
+            self.ao_task.clist.clear()
+            self.ao_task.add_channel(channel)
+        self.ao_task.config(timing='on_demand')
+        self.ao_task.write(voltage)
+
+    def read_block(self, channels, n=100):
+        '''Read `n` samples of every channel in one hardware timed burst.
+
+        :param channels: Input channel name or list of names
+        :param n: Number of samples per channel
+        :type channels: str or list
+        :type n: int
+        :rtype: numpy.ndarray with shape (len(channels), n)
+        '''
+        if isinstance(channels, str):
+            channels = [channels]
+        if self.ai_task is None:
+            self.ai_task = Task()
+        if [c.name for c in self.ai_task.clist] != list(channels):
+            self.ai_task.clist.clear()
+            for channel in channels:
+                self.ai_task.add_channel(channel)
+        self.ai_task.acquisition_mode = 'N Samples'
+        self.ai_task.rate = self.rate
+        self.ai_task.samples = int(n)
+        self.ai_task.timeout = self.timeout
+        self.ai_task.config()
+        return np.atleast_2d(self.ai_task.read())
+
+    def read_mean(self, channels, n=100):
+        '''Return the mean of `n` samples of every channel.
+
+        :param channels: Input channel name or list of names
+        :param n: Number of samples per channel
+        :type channels: str or list
+        :type n: int
+        :rtype: float for a single channel name, numpy.ndarray otherwise
+        '''
+        means = self.read_block(channels, n).mean(axis=1)
+        if isinstance(channels, str):
+            return means[0]
+        return means
+
+    def read_settled(self, channels, n=100, *, tol=1e-3, max_reads=20):
+        '''Return the mean of every channel once the signal has settled.
+
+        Blocks of `n` samples of all channels are read until the mean of two
+        consecutive blocks differ by less than `tol` in every channel, 
+        instead of waiting a fixed time before a single read. The number of
+        blocks read is kept in `settle_reads`.
+
+        :param channels: Input channel name or list of names
+        :param n: Number of samples per channel in each block
+        :param tol: Maximum change of the mean between blocks, in volts
+        :param max_reads: Maximum number of blocks read before giving up
+        :type channels: str or list
+        :type n: int
+        :type tol: float
+        :type max_reads: int
+        :rtype: float for a single channel name, numpy.ndarray otherwise
+        '''
+        last = self.read_block(channels, n).mean(axis=1)
+        self.settle_reads = 1
+        while self.settle_reads < max_reads:
+            means = self.read_block(channels, n).mean(axis=1)
+            self.settle_reads += 1
+            settled = np.all(np.abs(means - last) < tol)
+            last = means
+            if settled:
+                break
+        else:
+            print('signal did not settle within {} V after {} reads'.format(
+                tol, max_reads))
+        if isinstance(channels, str):
+            return last[0]
+        return last
+
+    def close(self):
+        for task in (self.ao_task, self.ai_task):
+            if task is not None:
+                task.close()
+        self.ao_task = None
+        self.ai_task = None
+
+
+def read_tdms(filename, channels=None, *, group=None, dtype='float64'):
+    """Read the channels of a TDMS file logged by DAQmx.
+
+    The file is read chunk by chunk with npTDMS, the raw samples scaled to
+    volts and written to a .npy file next to it, returned memory-mapped. The
+    .npy file is reused while it is newer than the TDMS file.
+
+    :param filename: Path of the TDMS file
+    :param channels: Names of the channels to return, all if None
+    :param group: TDMS group, the first one with channels if None
+    :param dtype: Data type of the .npy file
+    :type filename: str
+    :type channels: list
+    :type group: str
+    :type dtype: str
+    :return: The samples as a numpy.memmap of shape (channels, samples), 
+        (samples,) for a single channel, or a tuple of one memmap per name 
+        when `channels` is given
+    """
+    from nptdms import TdmsFile
+
+    base = os.path.splitext(filename)[0]
+    metadata = TdmsFile.read_metadata(filename)
+    if group is None:
+        group = next(g.name for g in metadata.groups() if g.channels())
+        out = base + '.npy'
+    else:
+        out = '{}_{}.npy'.format(base, group)
+    names = [c.name for c in metadata[group].channels()]
+    if not os.path.exists(out) or \
+            os.path.getmtime(out) < os.path.getmtime(filename):
+        # converted aside and renamed once complete, so an interrupted or
+        # failed conversion never leaves a truncated cache behind
+        tmp = out + '.tmp'
+        try:
+            with TdmsFile.open(filename) as tdms, \
+                    _NpyFile(tmp, len(names), dtype) as file:
+                for chunk in tdms.data_chunks():
+                    if group not in [g.name for g in chunk.groups()]:
+                        continue
+                    # indexing a chunk returns the scaled values
+                    data = [chunk[group][name][:] for name in names]
+                    if len({len(d) for d in data}) > 1:
+                        raise TaskError('The channels of {} have different '\
+                                        'lengths'.format(filename))
+                    if len(data[0]):
+                        file.append(np.array(data))
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        os.replace(tmp, out)
+    r = np.load(out, mmap_mode='r').T
+    if channels is not None:
+        # views of the memory map, indexing several rows at once would copy
+        return tuple(r[names.index(name)] for name in channels)
+    if len(r) == 1:
+        return r[0]
+    return r
 
 
 class TaskError(Exception):
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+
+import time
+import numpy as np
+
+# One logged setpoint of the heater
+setpoint_dtype = np.dtype([("target", float), ("res", float), ("volt", float),
+                           ("curr", float), ("power", float), ("steps", int)])
+
+
+class HeaterPowerController:
+    """
+    Sets the electrical power dissipated in a heater driven in current by a
+    Keithley2400SM
+
+    The heater resistance follows a linear TCR model, R(P) = R0 + dRdP*P,
+    fitted to the setpoints already reached. The current for a new target
+    is predicted as I = sqrt(P/R(P)), so most targets converge in one or two
+    steps instead of a fixed wait and re-measure loop.
+
+    Usage:
+        heater = HeaterPowerController(keithley)
+        heater.set_power(10e-3)  # in W
+        log = heater.get_log()   # record array with target, res, volt, curr, power, steps
+    """
+    # definitions
+    tol = 0.01  # relative error accepted on the power
+    max_steps = 5  # current corrections per setpoint
+    nreadings = 10  # resistance readings per buffered measurement
+    settle_tol = 1e-3  # relative change of R between readings to be settled
+    settle_time = 0.2  # wait in s between settle readings
+    max_settle = 50  # max buffered readings while waiting the heater to settle
+    max_res = 1e3  # above this the probes are considered off the pads
+
+    # main functions
+    def __init__(self, keithley, R0=None, dRdP=0.0):
+        """
+        keithley: a connected Keithley2400SM set to apply current
+        R0: initial guess of the cold resistance in Ohm, measured if None
+        dRdP: initial guess of the resistance change per dissipated power in Ohm/W
+        """
+        self.sm = keithley
+        self.R0 = R0
+        self.dRdP = dRdP
+        self.points = []  # (power, resistance) pairs used by the model
+        self.log = []
+
+    # model functions
+
+    def resistance(self, power):  # Resistance predicted by the model at a power in W
+        return self.R0 + self.dRdP*power
+
+    def predict_current(self, power):  # Current in A that dissipates a power in W
+        if power <= 0:
+            return 0.0
+        return float(np.sqrt(power/self.resistance(power)))
+
+    def add_point(self, power, res):  # Adds a measured point and refits the model
+        self.points.append((power, res))
+        p, r = np.array(self.points).T
+        if len(self.points) > 1 and np.ptp(p) > 0:
+            self.dRdP, self.R0 = np.polyfit(p, r, 1)
+        elif len(self.points) == 1:
+            # keep the slope guess, move the model through the point
+            self.R0 = res - self.dRdP*power
+
+    def reset_model(self):
+        self.points = []
+        self.R0 = None
+
+    # measurement functions
+
+    def read_resistance(self):  # Mean and std in Ohm of one buffered measurement, checked against max_res
+        _, res, std = self.sm.get_buffered(self.nreadings, "RES")
+        if abs(res) > self.max_res:
+            raise IOError("No electrical contact - make sure the probes are touching the pads")
+        return res, std
+
+    def measure_settled(self):
+        """
+        Take buffered resistance readings until the mean changes by less
+        than settle_tol between two readings
+
+        returns the settled resistance in Ohm
+        """
+        last, _ = self.read_resistance()
+        for i in range(self.max_settle):
+            time.sleep(self.settle_time)
+            res, std = self.read_resistance()
+            if abs(res - last) <= max(self.settle_tol*abs(res), std/np.sqrt(self.nreadings)):
+                return res
+            last = res
+        print(f"Heater resistance did not settle, last reading {res:.2f} Ohm")
+        return res
+
+    def set_current(self, curr):  # Sets the current in A and returns the settled resistance
+        self.sm.set_source_current(curr)
+        return self.measure_settled()
+
+    def set_power(self, power):
+        """
+        Set the dissipated power of the heater
+
+        power: target power in W
+
+        returns the logged setpoint (target, res, volt, curr, power, steps)
+        """
+        if power <= 0:
+            self.sm.set_source_current(0)
+            entry = (power, 0.0, 0.0, 0.0, 0.0, 0)
+            self.log.append(entry)
+            return np.rec.fromrecords([entry], dtype=setpoint_dtype)[0]
+        if self.R0 is None:
+            # measure the cold resistance with a small current
+            self.R0 = self.set_current(min(1e-3, np.sqrt(power/self.max_res)))
+        steps = 0
+        while True:
+            curr = self.predict_current(power)
+            res = self.set_current(curr)
+            steps += 1
+            pwr = curr**2*res
+            self.add_point(pwr, res)
+            if abs(pwr - power) <= self.tol*power or steps >= self.max_steps:
+                break
+        if abs(pwr - power) > self.tol*power:
+            print(f"Power {pwr*1e3:.3f} mW is off the target {power*1e3:.3f} mW after {steps} steps")
+        # the voltage logged is the one measured across the heater
+        volt = float(self.sm.get_all().volt)
+        entry = (power, res, volt, curr, pwr, steps)
+        self.log.append(entry)
+        return np.rec.fromrecords([entry], dtype=setpoint_dtype)[0]
+
+    def get_log(self):  # All setpoints as a record array
+        return np.rec.fromrecords(self.log, dtype=setpoint_dtype) if self.log else \
+            np.recarray(0, dtype=setpoint_dtype)
@@ -1,7 +1,11 @@
 # -*- coding: utf-8 -*-
 
-import visa
+import visasessions
 import numpy as np
+import scpidata
+
+# One reading of the concurrent voltage, current and resistance measurement
+reading_dtype = np.dtype([("volt", float), ("curr", float), ("res", float)])
 
 
 class Keithley2400SM:
@@ -25,22 +29,20 @@ class Keithley2400SM:
     meas_curr = False
     meas_volt = False
     meas_ohm = False
+    meas_all = False
+    elements = ("VOLT", "CURR", "RES")  # order of the readings in a READ? answer
 
     # main functions
     def __init__(self):
+        # last value written for every setting, so unchanged settings are 
+        # not sent again
+        self.state = {}
         try:
-            self.visarm = visa.ResourceManager('@ni')
+            self.visarm = visasessions.resource_manager()
             self.visaOK = True
         except:
-            print("Error creating NI VISA Resource Manager! Is the GPIB Card connected?")
+            print("Error creating VISA Resource Manager! Is the GPIB Card connected?")
             pass
-        if not self.visaOK:
-            try:
-                self.visarm = visa.ResourceManager('@py')
-                self.visaOK = True
-            except:
-                print("Error creating PYVISA Resource Manager! Is the GPIB Card connected?")
-                pass
 
     def __del__(self):
         self.closeSM()
@@ -59,20 +61,17 @@ class Keithley2400SM:
             try:
                 if self.gpib:
                     smname = "GPIB0::" + str(self.gpibAddr) + "::INSTR"
-                    self.sm = self.visarm.open_resource(smname)
+                    self.sm = visasessions.open_session(smname)
                 elif self.eth:
                     smname = "TCPIP0::" + self.ip + "::" + str(self.port) + "::SOCKET"
-                    self.sm = self.visarm.open_resource(smname, read_termination="\r\n", timeout=5000)
+                    self.sm = visasessions.open_session(smname, read_termination="\r\n", timeout=5000)
                     self.sm.query('open "' + self.user + '"')
                     self.sm.query(self.passwd)
                 elif self.usb:
-                    smname = ""
-                    all = self.visarm.list_resources()
-                    for name in all:
-                        if self.usbid in name:
-                            smname = name
-                    self.sm = self.visarm.open_resource(smname)
+                    smname = visasessions.find_resource(self.usbid)
+                    self.sm = visasessions.open_session(smname)
 
+                self.invalidate()
                 if self.usbid in self.sm.query("*IDN?"):
                     self.smOK = True
                 else:
@@ -88,72 +87,105 @@ class Keithley2400SM:
     def closeSM(self):
         if self.smOK:
             self.smOK = False
-            self.sm.close()
+            visasessions.close_session(self.sm)
+
+    def invalidate(self):  # Forgets the cached state, e.g. after front panel changes
+        self.state = {}
+        self.meas_volt = False
+        self.meas_curr = False
+        self.meas_ohm = False
+        self.meas_all = False
+
+    def write_setting(self, header, value):  # Writes a setting only if it changed
+        if self.smOK:
+            if self.state.get(header) != value:
+                self.sm.write(header + " " + str(value))
+                self.state[header] = value
+
+    def set_sense_functions(self, *functions):  # Turns on only the given sense functions
+        if self.smOK:
+            if self.state.get(":SENS:FUNC") != functions:
+                self.sm.write(":SENS:FUNC:OFF:ALL")
+                self.sm.write(":SENS:FUNC " + ",".join(f"'{f}'" for f in functions))
+                self.state[":SENS:FUNC"] = functions
 
     def conf_apply_current(self):  # Sets up to source current
         if self.smOK:
-            self.sm.write(":SOUR:FUNC CURR")
+            self.write_setting(":SOUR:FUNC", "CURR")
             self.apply_curr = True
             self.apply_volt = False
 
     def conf_apply_voltage(self):  # Sets up to source voltage
         if self.smOK:
-            self.sm.write(":SOUR:FUNC VOLT")   
+            self.write_setting(":SOUR:FUNC", "VOLT")
             self.apply_volt = True
             self.apply_curr = False
 
     def conf_measure_voltage(self):  # Sets up to measure voltage
         if self.smOK:
-            self.sm.write(":SENS:FUNC:OFF:ALL")
-            self.sm.write(":SENS:FUNC 'VOLT'")
-            self.sm.write(":SENS:VOLT:NPLC " + str(self.nplc))
-            self.sm.write(":FORM:ELEM VOLT")
-            self.sm.write(":SENS:VOLT:RANG:AUTO 1")
+            self.set_sense_functions("VOLT")
+            self.write_setting(":SENS:VOLT:NPLC", self.nplc)
+            self.write_setting(":FORM:ELEM", "VOLT")
+            self.write_setting(":SENS:VOLT:RANG:AUTO", 1)
 
             self.meas_volt = True
             self.meas_curr = False
             self.meas_ohm = False
+            self.meas_all = False
 
     def conf_measure_current(self):  # Sets up to measure current
         if self.smOK:
-            self.sm.write(":SENS:FUNC:OFF:ALL")
-            self.sm.write(":SENS:FUNC 'CURR'")
-            self.sm.write(":SENS:VOLT:NPLC " + str(self.nplc))
-            self.sm.write(":FORM:ELEM CURR")
-            self.sm.write(":SENS:CURR:RANG:AUTO 1")
+            self.set_sense_functions("CURR")
+            self.write_setting(":SENS:VOLT:NPLC", self.nplc)
+            self.write_setting(":FORM:ELEM", "CURR")
+            self.write_setting(":SENS:CURR:RANG:AUTO", 1)
 
             self.meas_volt = False
             self.meas_curr = True
             self.meas_ohm = False
+            self.meas_all = False
 
     def conf_measure_ohms(self):  # Sets up to measure resistance
         if self.smOK:
-            self.sm.write(":SENS:FUNC:OFF:ALL")
-            self.sm.write(":SENS:FUNC 'RES'")
-            self.sm.write(":SENS:RES:MODE MAN")
-            self.sm.write(":SENS:RES:NPLC " + str(self.nplc))
-            self.sm.write(":FORM:ELEM RES")
-            self.sm.write(":SENS:RES:RANG:AUTO 1")
+            self.set_sense_functions("RES")
+            self.write_setting(":SENS:RES:MODE", "MAN")
+            self.write_setting(":SENS:RES:NPLC", self.nplc)
+            self.write_setting(":FORM:ELEM", "RES")
+            self.write_setting(":SENS:RES:RANG:AUTO", 1)
 
             self.meas_volt = False
             self.meas_curr = False
             self.meas_ohm = True
+            self.meas_all = False
+
+    def conf_measure_all(self):  # Sets up to measure voltage, current and resistance concurrently
+        if self.smOK:
+            self.write_setting(":SENS:FUNC:CONC", "ON")
+            self.set_sense_functions("VOLT", "CURR", "RES")
+            self.write_setting(":SENS:RES:MODE", "MAN")
+            self.write_setting(":SENS:VOLT:NPLC", self.nplc)
+            self.write_setting(":FORM:ELEM", "VOLT,CURR,RES")
+
+            self.meas_volt = False
+            self.meas_curr = False
+            self.meas_ohm = False
+            self.meas_all = True
 
     def set_compliance_voltage(self, volt):  # Sets the compliance voltage
         if self.smOK:
-            self.sm.write(":SENS:VOLT:PROT " + str(volt))
+            self.write_setting(":SENS:VOLT:PROT", volt)
 
     def set_compliance_current(self, curr):  # Sets the compliance current
         if self.smOK:
-            self.sm.write(":SENS:CURR:PROT " + str(curr))
+            self.write_setting(":SENS:CURR:PROT", curr)
 
     def set_source_current(self, curr):  # Sets the source current
         if self.smOK:
-            self.sm.write(":SOUR:CURR:LEV " + str(curr))
+            self.write_setting(":SOUR:CURR:LEV", curr)
 
     def set_source_voltage(self, volt):  # Sets the source voltage
         if self.smOK:
-            self.sm.write(":SOUR:VOLT:LEV " + str(volt))
+            self.write_setting(":SOUR:VOLT:LEV", volt)
 
     def enable_output(self):  # Enables the source output
          if self.smOK:
@@ -165,8 +197,11 @@ class Keithley2400SM:
 
     def get_voltage(self):  # Get the voltage in Volts
         if self.smOK:
+            if self.meas_all:
+                return float(self.get_all().volt)
             if not self.meas_volt:
                 self.conf_measure_voltage()
+            self.set_trigger_count(1)
             resp = self.sm.query("READ?")
             volt = float(resp)
             return volt
@@ -175,8 +210,11 @@ class Keithley2400SM:
 
     def get_current(self):  # Get the current in amps
         if self.smOK:
+            if self.meas_all:
+                return float(self.get_all().curr)
             if not self.meas_curr:
                 self.conf_measure_current()
+            self.set_trigger_count(1)
             resp = self.sm.query("READ?")
             curr = float(resp)
             return curr
@@ -185,14 +223,120 @@ class Keithley2400SM:
 
     def get_ohms(self):  # Get the resistance in Ohms
         if self.smOK:
+            if self.meas_all:
+                return float(self.get_all().res)
             if not self.meas_ohm:
                 self.conf_measure_ohms()
+            self.set_trigger_count(1)
             resp = self.sm.query("READ?")
             ohms = float(resp)
             return ohms
         else:
             return 0
 
+    def get_all(self):
+        """
+        Get voltage, current and resistance from a single READ?, using the
+        concurrent measurement mode, so interleaved readings of different
+        quantities need no reconfiguration
+
+        returns a numpy record with the fields volt, curr and res
+        """
+        values = np.zeros(3)
+        if self.smOK:
+            if not self.meas_all:
+                self.conf_measure_all()
+            self.set_trigger_count(1)
+            values = scpidata.parse_ascii(self.sm.query("READ?"))
+        return np.rec.fromrecords([tuple(values)], dtype=reading_dtype)[0]
+
+    def set_trigger_count(self, count):  # Sets the number of readings per READ?
+        self.write_setting(":TRIG:COUN", count)
+
+    def get_buffered(self, n, quantity="RES"):
+        """
+        Take n readings of one quantity with a single trigger and fetch them
+        all in one READ? response, instead of one GPIB round trip per reading
+
+        quantity: "VOLT", "CURR" or "RES"
+
+        returns the readings as a numpy array, their mean and std
+        """
+        if self.smOK:
+            if quantity == "VOLT" and not self.meas_volt:
+                self.conf_measure_voltage()
+            elif quantity == "CURR" and not self.meas_curr:
+                self.conf_measure_current()
+            elif quantity == "RES" and not self.meas_ohm:
+                self.conf_measure_ohms()
+            self.set_trigger_count(n)
+            data = scpidata.parse_ascii(self.sm.query("READ?"))
+            return data, np.mean(data), np.std(data)
+        else:
+            return np.zeros(n), 0, 0
+
+    def source_list(self, currents, dwell, measure=("VOLT", "CURR", "RES")):
+        """
+        Run a current sweep on the instrument with a source list, instead of
+        setting every point from the PC
+
+        currents: source currents in A (the list is loaded in chunks of 100 
+                  points, the instrument maximum)
+        dwell: source delay in s before the measurement of each point
+        measure: quantities measured concurrently at each point, 
+                 any of "VOLT", "CURR" and "RES"
+
+        The source delay in use before the sweep is restored after it.
+
+        returns a dictionary with one numpy array per measured quantity
+        """
+        # the instrument sends the elements in this order, whatever the order of FORM:ELEM
+        unknown = set(measure) - set(self.elements)
+        if unknown:
+            raise ValueError(f"Cannot measure {', '.join(sorted(unknown))}, use {', '.join(self.elements)}")
+        measure = tuple(q for q in self.elements if q in measure)
+        currents = np.asarray(currents, dtype=float)
+        result = {q: np.zeros(len(currents)) for q in measure}
+        if self.smOK:
+            self.conf_apply_current()
+            self.write_setting(":SENS:FUNC:CONC", "ON")
+            self.set_sense_functions(*measure)
+            if "RES" in measure:
+                self.write_setting(":SENS:RES:MODE", "MAN")
+            self.write_setting(":FORM:ELEM", ",".join(measure))
+            delay_auto = self.sm.query(":SOUR:DEL:AUTO?").strip() in ("1", "ON")
+            delay = self.sm.query(":SOUR:DEL?").strip()
+            self.write_setting(":SOUR:DEL", dwell)
+            self.write_setting(":SOUR:CURR:MODE", "LIST")
+            self.meas_volt = False
+            self.meas_curr = False
+            self.meas_ohm = False
+            self.meas_all = tuple(measure) == ("VOLT", "CURR", "RES")
+            visatimeout = self.sm.timeout
+            try:
+                for i in range(0, len(currents), 100):
+                    chunk = currents[i:i+100]
+                    self.sm.write(":SOUR:LIST:CURR " + ",".join(f"{c:.6g}" for c in chunk))
+                    self.set_trigger_count(len(chunk))
+                    # the whole chunk is measured before READ? is answered
+                    self.sm.timeout = visatimeout + 1000*len(chunk)*(dwell + 0.1)
+                    data = scpidata.parse_ascii(self.sm.query("READ?"))
+                    data = data.reshape(len(chunk), len(measure))
+                    for j, q in enumerate(measure):
+                        result[q][i:i+len(chunk)] = data[:, j]
+            finally:
+                self.sm.timeout = visatimeout
+                self.write_setting(":SOUR:CURR:MODE", "FIX")
+                # the dwell would otherwise delay every later reading
+                if delay_auto:
+                    self.sm.write(":SOUR:DEL:AUTO ON")
+                else:
+                    self.sm.write(":SOUR:DEL " + delay)
+                self.state.pop(":SOUR:DEL", None)
+                # the source level is not known after the sweep
+                self.state.pop(":SOUR:CURR:LEV", None)
+        return result
+
     def set_nplc(self, nplc):
         self.nplc = nplc
 
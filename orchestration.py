@@ -0,0 +1,219 @@
+"""This module runs the blocking calls of several instruments concurrently
+with asyncio.
+
+Each driver is wrapped in an :class:`Instrument` owning one worker thread,
+so the calls to one instrument stay in order while different instruments
+work at the same time (the scope is set up while the laser arms, the OSA
+trace is fetched while the next heater current settles)::
+
+    import orchestration
+
+    laser = orchestration.Instrument(agilent816xb.Agilent816xb())
+    heater = orchestration.Instrument(keithley2400.Keithley2400SM())
+
+    async def main():
+        await orchestration.gather(laser.connectlaser(), heater.connectSM())
+        await heater.set_source_current(10e-3, settle=2)
+        await heater.ready()  # 2 s after the current was set
+        ...
+
+    orchestration.run(main())
+
+Dependencies between the steps of a setup are declared with a
+:class:`Plan`, and every step starts as soon as the steps it needs are done
+and settled.
+"""
+
+__all__ = ['Instrument', 'Plan', 'gather', 'run']
+
+import asyncio
+import functools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class Instrument():
+    """Proxy of a driver whose methods run in a dedicated worker thread.
+
+    Calling a method of the proxy returns a coroutine; the keyword `settle`
+    (in s), removed before the driver is called, marks the instrument as not
+    ready until that time after the call has returned.
+
+    :param driver: The instrument driver, e.g. an Agilent816xb
+    :param name: Name of the worker thread, the driver class if None
+    :type driver: object
+    :type name: str
+    """
+
+    def __init__(self, driver, name=None):
+        self.driver = driver
+        self.name = name or type(driver).__name__
+        self.ready_at = 0.0  # time.monotonic() at which the last call settled
+        self._executor = ThreadPoolExecutor(max_workers=1,
+                                            thread_name_prefix=self.name)
+
+    def __repr__(self):
+        return f"Instrument({self.name})"
+
+    def __getattr__(self, name):
+        # only the driver methods are proxied, not its other attributes
+        if name.startswith('_') or 'driver' not in self.__dict__:
+            raise AttributeError(name)
+        attribute = getattr(self.driver, name)
+        if not callable(attribute):
+            raise AttributeError(f"{self.name}.{name} is not a method, use "
+                                 f"{self.name}.driver.{name}")
+        return functools.partial(self.call, name)
+
+    async def call(self, method, *args, settle=0.0, **kwargs):
+        """Call a method of the driver in the worker thread.
+
+        :param method: Method name
+        :param settle: Time in s the instrument takes to settle after the
+            call
+        :type method: str
+        :type settle: float
+        """
+        return await self.run(
+            lambda driver: getattr(driver, method)(*args, **kwargs),
+            settle=settle)
+
+    async def run(self, function, *args, settle=0.0):
+        """Run `function(driver, *args)` in the worker thread, for sequences
+        of calls that belong together, e.g. a batch.
+
+        :param function: A function taking the driver as first argument
+        :param settle: Time in s the instrument takes to settle after the
+            call
+        :type function: callable
+        :type settle: float
+        """
+        loop = asyncio.get_running_loop()
+        result = await loop.run_in_executor(
+            self._executor, functools.partial(function, self.driver, *args))
+        if settle:
+            self.ready_at = max(self.ready_at, time.monotonic() + settle)
+        return result
+
+    async def ready(self):
+        """Wait until the settle time of the previous calls has elapsed"""
+        delay = self.ready_at - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def close(self):
+        """Wait for the pending calls and stop the worker thread"""
+        self._executor.shutdown(wait=True)
+
+
+class Plan():
+    """Steps of an experiment with their dependencies.
+
+    A step starts once every step named in `after` has finished and settled,
+    independent steps run concurrently::
+
+        plan = orchestration.Plan()
+        plan.step('laser', laser.run, setup_laser)
+        plan.step('scope', scope.run, setup_scope)
+        plan.step('heater', heater.set_source_current, 10e-3, settle=2)
+        plan.step('sweep', laser.setSweepState, 0, "Start",
+                  after=('laser', 'scope', 'heater'))
+        results = await plan.run()
+    """
+
+    def __init__(self):
+        self.steps = {}
+
+    def step(self, name, function, *args, after=(), settle=0.0, **kwargs):
+        """Add a step.
+
+        :param name: Name of the step, used in `after` and in the results
+        :param function: A coroutine function, e.g. a method of an
+            :class:`Instrument`, or a plain function run in the event loop
+        :param after: Names of the steps that must be done before
+        :param settle: Time in s the steps after this one wait once it is
+            done
+        :type name: str
+        :type function: callable
+        :type after: tuple
+        :type settle: float
+        """
+        if name in self.steps:
+            raise ValueError(f"Step {name!r} already in the plan")
+        for dependency in after:
+            if dependency not in self.steps:
+                raise ValueError(f"Step {name!r} depends on {dependency!r}, "
+                                 "which must be added first")
+        self.steps[name] = (function, args, kwargs, tuple(after), settle)
+
+    async def run(self):
+        """Run the steps, each as soon as its dependencies allow.
+
+        If a step fails the steps not finished are cancelled and the error
+        is raised.
+
+        :return: Step name -> result
+        :rtype: dict
+        """
+        tasks = {}
+
+        async def execute(name, function, args, kwargs, after, settle):
+            for dependency in after:
+                await tasks[dependency]
+            result = function(*args, **kwargs)
+            if asyncio.iscoroutine(result):
+                result = await result
+            if settle:
+                await asyncio.sleep(settle)
+            return result
+
+        for name, step in self.steps.items():
+            tasks[name] = asyncio.ensure_future(execute(name, *step))
+        results = await gather(*tasks.values())
+        return dict(zip(tasks, results))
+
+
+async def gather(*aws):
+    """Like asyncio.gather, but when one awaitable fails the others are
+    cancelled before the error is raised. A call already running in a
+    worker thread still completes, and the next call to that instrument
+    waits for it.
+
+    :rtype: list
+    """
+    tasks = [asyncio.ensure_future(aw) for aw in aws]
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+
+def run(coroutine):
+    """Run a coroutine to completion and return its result.
+
+    Works from a plain script as well as from IPython/Spyder, where an
+    event loop is already running: the coroutine then runs in a loop of its
+    own thread.
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coroutine)
+    result = {}
+
+    def target():
+        try:
+            result['value'] = asyncio.run(coroutine)
+        except BaseException as err:
+            result['error'] = err
+
+    thread = threading.Thread(target=target)
+    thread.start()
+    thread.join()
+    if 'error' in result:
+        raise result['error']
+    return result['value']
@@ -1,7 +1,8 @@
 # -*- coding: utf-8 -*-
 
-import visa
+import visasessions
 import numpy as np
+import scpidata
 
 
 class OSCDSO9404A:
@@ -20,6 +21,7 @@ class OSCDSO9404A:
     oscOK = False
     oscID = ""
     binary = False
+    wave_setup = None  # waveform settings last sent by get_all_channels
     traceLength = 0
     trace = "trace1"
     tracen = 0
@@ -27,18 +29,11 @@ class OSCDSO9404A:
     # main functions
     def __init__(self):
         try:
-            self.visarm = visa.ResourceManager('@ni')
+            self.visarm = visasessions.resource_manager()
             self.visaOK = True
         except:
             print("Error creating VISA Resource Manager! Is the GPIB Card connected?")
             pass
-        if not self.visaOK:
-            try:
-                self.visarm = visa.ResourceManager('@py')
-                self.visaOK = True
-            except:
-                print("Error creating VISA Resource Manager! Is the GPIB Card connected?")
-                pass
 
     def __del__(self):
         self.closeOSC()
@@ -57,20 +52,17 @@ class OSCDSO9404A:
             try:
                 if self.gpib:
                     oscname = "GPIB0::" + str(self.gpibAddr) + "::INSTR"
-                    self.osc = self.visarm.open_resource(oscname)
+                    self.osc = visasessions.open_session(oscname)
                 # elif self.eth:
                 #     osaname = "TCPIP0::" + self.ip + "::" + str(self.port) + "::SOCKET"
-                #     self.osc = self.visarm.open_resource(osaname, read_termination="\r\n", timeout=5000)
+                #     self.osc = visasessions.open_session(osaname, read_termination="\r\n", timeout=5000)
                 #     self.osc.query('open "' + self.user + '"')
                 #     self.osc.query(self.passwd)
                 elif self.usb:
-                    oscname = ""
-                    all = self.visarm.list_resources()
-                    for name in all:
-                        if self.usbid in name:
-                            oscname = name
-                    self.osc = self.visarm.open_resource(oscname)
+                    oscname = visasessions.find_resource(self.usbid)
+                    self.osc = visasessions.open_session(oscname)
 
+                self.wave_setup = None
                 if self.usbid in self.osc.query("*IDN?"):
                     self.oscOK = True
                 else:
@@ -82,6 +74,7 @@ class OSCDSO9404A:
     def initOSC(self, binarymode=True):
         if self.oscOK:
             self.binary = binarymode
+            self.wave_setup = None
 
             #self.osc.write("DISP:PERS MIN")
             #self.osc.write("ACQ:MODE RTIM")
@@ -98,7 +91,7 @@ class OSCDSO9404A:
         if self.oscOK:
             # self.single()
             self.oscOK = False
-            self.osc.close()
+            visasessions.close_session(self.osc)
 
     def run(self):
         if self.oscOK:
@@ -247,15 +240,34 @@ class OSCDSO9404A:
             if nchan == 0:
                 nchan = 4
             self.osc.write("WAV:SOUR CHAN" + str(nchan))
-            rawdata = self.osc.query_binary_values("WAV:DATA?", datatype="h", is_big_endian=True)
+            self.osc.write("WAV:DATA?")
+            rawdata = scpidata.decode_block(self.osc.read_raw(), datatype="h", is_big_endian=True)
             scale = float(self.osc.query("CHAN" + str(nchan) + ":SCAL?"))
             off = float(self.osc.query("CHAN" + str(nchan) + ":OFFS?"))
             conv = scale*4/30720
-            data = off + np.array(rawdata)*conv
+            data = off + rawdata*conv
             return data
         else:
             return np.zeros(self.traceLength)
 
+    def get_all_channels(self, chans=(1, 2, 3, 4)):
+        """
+        Fetch several channels of the last acquisition, in volts, see 
+        scpidata.read_channels
+
+        returns the shared time axis and an array with shape (len(chans), points)
+        """
+        if self.oscOK:
+            # sent once per session, the scope may have been left in any format
+            setup = "WAV:FORM WORD;:WAV:BYT MSBF"
+            if self.wave_setup != setup:
+                self.osc.write(setup)
+                self.wave_setup = setup
+                self.binary = True
+            return scpidata.read_channels(self.osc, chans, datatype="h")
+        else:
+            return np.zeros(self.traceLength), np.zeros((len(chans), self.traceLength))
+
     def getASCIITrace(self, chan):
         if self.oscOK:
             nchan = int(np.mod(chan, 4))
@@ -264,12 +276,7 @@ class OSCDSO9404A:
             self.osc.write("WAV:SOUR CHAN" + str(nchan))
             off = float(self.osc.query("CHAN" + str(nchan) + ":OFFS?"))
             data = self.osc.query("WAV:DATA?")
-            stringlist = data.split(",")
-            numlist = []
-
-            for i in range(0, len(stringlist) - 1):
-                numlist.append(float(stringlist[i]))
-            numlist = off + np.array(numlist)
+            numlist = off + scpidata.parse_ascii(data)
             return numlist
         else:
             return np.zeros(self.traceLength)
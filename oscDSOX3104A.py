@@ -1,7 +1,8 @@
 # -*- coding: utf-8 -*-
 
-import visa
+import visasessions
 import numpy as np
+import scpidata
 
 
 class OSCDSOX3104A:
@@ -19,6 +20,7 @@ class OSCDSOX3104A:
     oscOK = False
     oscID = ""
     binary = True
+    wave_setup = None  # waveform settings last sent by get_all_channels
     traceLength = 0
     trace = "trace1"
     tracen = 0
@@ -26,18 +28,11 @@ class OSCDSOX3104A:
     # main functions
     def __init__(self):
         try:
-            self.visarm = visa.ResourceManager('@ni')
+            self.visarm = visasessions.resource_manager()
             self.visaOK = True
         except:
-            print("Error creating NI VISA Resource Manager! Is the GPIB Card connected?")
+            print("Error creating VISA Resource Manager! Is the GPIB Card connected?")
             pass
-        if not self.visaOK:
-            try:
-                self.visarm = visa.ResourceManager('@py')
-                self.visaOK = True
-            except:
-                print("Error creating PYVISA Resource Manager! Is the GPIB Card connected?")
-                pass
 
     def __del__(self):
         self.closeOSC()
@@ -56,20 +51,17 @@ class OSCDSOX3104A:
             try:
                 if self.gpib:
                     oscname = "GPIB0::" + str(self.gpibAddr) + "::INSTR"
-                    self.osc = self.visarm.open_resource(oscname)
+                    self.osc = visasessions.open_session(oscname)
                 # elif self.eth:
                 #     osaname = "TCPIP0::" + self.ip + "::" + str(self.port) + "::SOCKET"
-                #     self.osc = self.visarm.open_resource(osaname, read_termination="\r\n", timeout=5000)
+                #     self.osc = visasessions.open_session(osaname, read_termination="\r\n", timeout=5000)
                 #     self.osc.query('open "' + self.user + '"')
                 #     self.osc.query(self.passwd)
                 elif self.usb:
-                    oscname = ""
-                    all = self.visarm.list_resources()
-                    for name in all:
-                        if self.usbid in name:
-                            oscname = name
-                    self.osc = self.visarm.open_resource(oscname)
+                    oscname = visasessions.find_resource(self.usbid)
+                    self.osc = visasessions.open_session(oscname)
 
+                self.wave_setup = None
                 if self.usbid in self.osc.query("*IDN?"):
                     self.oscOK = True
                 else:
@@ -81,6 +73,7 @@ class OSCDSOX3104A:
     def initOSC(self, binarymode=True):
         if self.oscOK:
             self.binary = binarymode
+            self.wave_setup = None
             # self.osc.timeout = 10000
 
             # self.osc.write("DISP:PERS MIN")
@@ -98,7 +91,7 @@ class OSCDSOX3104A:
     def closeOSC(self):
         if self.oscOK:
             self.oscOK = False
-            self.osc.close()
+            visasessions.close_session(self.osc)
 
     def run(self):
         if self.oscOK:
@@ -248,12 +241,12 @@ class OSCDSOX3104A:
 
     def getBinTrace(self, chan):
         if self.oscOK:
-            # nchan = int(np.mod(chan, 4))
-            # if nchan == 0:
-            #     nchan = 4
+            nchan = int(np.mod(chan, 4))
+            if nchan == 0:
+                nchan = 4
             self.osc.write("WAV:SOUR CHAN" + str(nchan))
-            rawdata = self.osc.query_binary_values("WAV:DATA?", datatype="H", is_big_endian=True)
-            data = np.array(rawdata)
+            self.osc.write("WAV:DATA?")
+            data = scpidata.decode_block(self.osc.read_raw(), datatype="H", is_big_endian=True)
             # scale = float(self.osc.query("CHAN" + str(nchan) + ":SCAL?"))
             off = float(self.osc.query("CHAN" + str(nchan) + ":OFFS?"))
             yref = float(self.osc.query("WAV:YREF?"))
@@ -268,6 +261,24 @@ class OSCDSOX3104A:
         else:
             return np.zeros(self.traceLength)
 
+    def get_all_channels(self, chans=(1, 2, 3, 4)):
+        """
+        Fetch several channels of the last acquisition, in volts, see 
+        scpidata.read_channels
+
+        returns the shared time axis and an array with shape (len(chans), points)
+        """
+        if self.oscOK:
+            # sent once per session, the scope may have been left in any format
+            setup = "WAV:FORM WORD;:WAV:BYT MSBF;:WAV:UNS 1;:WAV:POIN:MODE RAW"
+            if self.wave_setup != setup:
+                self.osc.write(setup)
+                self.wave_setup = setup
+                self.binary = True
+            return scpidata.read_channels(self.osc, chans, datatype="H")
+        else:
+            return np.zeros(self.traceLength), np.zeros((len(chans), self.traceLength))
+
     def getASCIITrace(self, chan):
         if self.oscOK:
             nchan = int(np.mod(chan, 4))
@@ -278,17 +289,7 @@ class OSCDSOX3104A:
             off = float(self.osc.query("CHAN" + str(nchan) + ":OFFS?"))
 
             data = self.osc.query("WAV:DATA?")
-            stringlist = data.split(",")
-            numlist = []
-
-            for i in range(0, len(stringlist)):
-                if "#" in stringlist[i]:
-                    firstitem = stringlist[i][10:]
-                    firstitem.replace(" ", "")
-                    numlist.append(float(firstitem))
-                else:
-                    numlist.append(float(stringlist[i]))
-            numlist = off + np.array(numlist)
+            numlist = off + scpidata.parse_ascii(data)
             return numlist
         else:
             return np.zeros(self.traceLength)
@@ -296,11 +297,12 @@ class OSCDSOX3104A:
     def getBinFFT(self):
         if self.oscOK:
             self.osc.write("WAV:SOUR FUNC")
-            rawdata = self.osc.query_binary_values("WAV:DATA?", datatype="h", is_big_endian=True)
+            self.osc.write("WAV:DATA?")
+            rawdata = scpidata.decode_block(self.osc.read_raw(), datatype="h", is_big_endian=True)
             scale = float(self.osc.query("FUNC:SCAL?"))
             off = float(self.osc.query("FUNC:OFFS?"))
             conv = scale*4/30720
-            data = off + np.array(rawdata)*conv
+            data = off + rawdata*conv
 
             fftspan = float(self.osc.query("FUNC:SPAN?"))
             fftcenter = float(self.osc.query("FUNC:CENT?"))
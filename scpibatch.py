@@ -0,0 +1,126 @@
+"""This module joins the SCPI commands written to an instrument into as few
+transfers as possible.
+
+Every write to a GPIB instrument is a separate bus transaction, with its own
+addressing and handshake overhead. Inside a batch, the writes of a driver are
+queued and sent together as one program message, the commands separated by
+`;`. Queries, reads and the end of the batch flush the queue first, so the
+order of the commands is kept. If the block raises, the commands still queued
+are discarded::
+
+    with laser.batch(check_errors=True):
+        laser.setSweep(0, "CONT", 1530, 1570, 1, 0, 0, 5)
+        laser.setPwr(0, 7)
+
+Drivers offer `batch` by wrapping their visa resource with :func:`batch`.
+"""
+
+__all__ = ['BatchedResource', 'batch', 'check_error']
+
+from contextlib import contextmanager
+
+
+class BatchedResource:
+    """Proxy of a visa resource that queues the written commands.
+
+    :param resource: The visa resource of the instrument
+    :param max_length: Longest program message sent in one transfer, in
+        characters
+    """
+
+    def __init__(self, resource, max_length=256):
+        self.resource = resource
+        self.max_length = max_length
+        self.queue = []
+        self.transfers = 0
+        self.commands = 0
+
+    @staticmethod
+    def _rooted(command):
+        # after a `;` a header without a leading colon is relative to the
+        # previous one, so every command starts again from the root
+        command = command.strip()
+        if command.startswith((':', '*')):
+            return command
+        return ':' + command
+
+    def message(self):
+        """The queued commands joined into one program message"""
+        return ';'.join(self.queue)
+
+    def write(self, command):
+        command = self._rooted(command)
+        if self.queue and len(self.message()) + len(command) + 1 > self.max_length:
+            self.flush()
+        self.queue.append(command)
+        self.commands += 1
+
+    def flush(self):
+        """Send the queued commands"""
+        if self.queue:
+            message = self.message()
+            self.queue = []
+            self.resource.write(message)
+            self.transfers += 1
+
+    def query(self, command, *args, **kwargs):
+        self.flush()
+        return self.resource.query(command, *args, **kwargs)
+
+    def __getattr__(self, name):
+        # any other access to the resource (read, read_raw, timeout...)
+        # must see the queued commands already sent
+        self.flush()
+        return getattr(self.resource, name)
+
+
+def check_error(resource):
+    """Query SYST:ERR? and raise an IOError if the instrument reports one.
+
+    :param resource: The visa resource of the instrument
+    """
+    resp = resource.query("SYST:ERR?")
+    try:
+        code = int(resp.split(',')[0])
+    except ValueError:
+        raise IOError("Invalid answer to SYST:ERR?: {!r}".format(resp))
+    if code != 0:
+        raise IOError("Instrument error: {}".format(resp.strip()))
+
+
+@contextmanager
+def batch(driver, attribute, check_errors=False, max_length=256):
+    """Queue the writes made through `driver.<attribute>` and send them in as
+    few transfers as possible when the block ends. Nothing more is sent if the
+    block raises.
+
+    Nested batches on the same driver join the outermost one.
+
+    :param driver: The instrument driver
+    :param attribute: Name of the visa resource attribute of the driver
+    :param check_errors: Query SYST:ERR? once at the end of the batch
+    :param max_length: Longest program message sent in one transfer
+    :type driver: object
+    :type attribute: str
+    :type check_errors: bool
+    :type max_length: int
+    :rtype: BatchedResource
+    """
+    resource = getattr(driver, attribute)
+    if resource is None or isinstance(resource, BatchedResource):
+        yield resource
+        return
+    proxy = BatchedResource(resource, max_length)
+    setattr(driver, attribute, proxy)
+    try:
+        yield proxy
+    except BaseException:
+        # the commands queued before the error are not sent, half of a setup
+        # must not reach the instrument
+        proxy.queue = []
+        raise
+    finally:
+        setattr(driver, attribute, resource)
+    proxy.flush()
+    if check_errors and proxy.commands:
+        check_error(resource)
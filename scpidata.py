@@ -0,0 +1,179 @@
+"""This module offers tools to decode the trace data returned by SCPI
+instruments (OSA, oscilloscopes) into numpy arrays.
+
+Binary traces come as IEEE 488.2 definite length blocks, a header
+`#<n><length>` followed by `length` bytes of packed samples. The payload is
+decoded at once with numpy.frombuffer, without copying it and without any
+python loop over the samples::
+
+    import scpidata
+
+    osa.write("trac:data:y? tra")
+    y = scpidata.decode_block(osa.read_raw(), 'f')
+
+ASCII traces, comma separated values optionally preceded by the same block 
+header, are parsed in a single numpy call as well::
+
+    y = scpidata.parse_ascii(osa.query("trac:data:y? tra"))
+"""
+
+__all__ = ['parse_header', 'decode_block', 'parse_ascii', 'parse_preamble',
+           'read_channels']
+
+import numpy as np
+
+# Data types accepted by decode_block, using the struct format characters
+# that pyvisa query_binary_values also uses
+dtypes = {'f': 'f4',  # float32
+          'e': 'f2',  # float16
+          'd': 'f8',  # float64
+          'H': 'u2',  # uint16
+          'h': 'i2',  # int16
+          'B': 'u1',  # uint8
+          'b': 'i1',  # int8
+          }
+
+
+def parse_header(data):
+    """Return the offset and the length in bytes of the payload of an
+    IEEE 488.2 binary block.
+
+    :param data: Raw response of the instrument
+    :type data: bytes
+    :rtype: tuple (offset, length)
+    """
+    start = data.find(b'#')
+    if start < 0:
+        raise IOError("No start of block found")
+    try:
+        ndigits = int(data[start+1:start+2])
+        if ndigits == 0:
+            # indefinite length block, the payload goes up to the terminator
+            offset = start + 2
+            return offset, len(data.rstrip(b'\r\n')) - offset
+        offset = start + 2 + ndigits
+        length = int(data[start+2:offset])
+    except ValueError:
+        raise IOError("Invalid block header: {!r}".format(data[start:start+12]))
+    return offset, length
+
+
+def decode_block(data, datatype='f', is_big_endian=False):
+    """Decode an IEEE 488.2 binary block into a numpy array.
+
+    The returned array is a read only view of `data`, copy it if it must be
+    changed in place.
+
+    :param data: Raw response of the instrument
+    :param datatype: A struct format character ('f', 'e', 'd', 'H', 'h',
+        'B', 'b') or a numpy dtype
+    :param is_big_endian: Byte order of the samples
+    :type data: bytes
+    :type datatype: str
+    :type is_big_endian: bool
+    :rtype: numpy.ndarray
+    """
+    offset, length = parse_header(data)
+    dtype = np.dtype(dtypes.get(datatype, datatype))
+    dtype = dtype.newbyteorder('>' if is_big_endian else '<')
+    if len(data) < offset + length:
+        raise IOError("Block is truncated: {} bytes expected, {} received"
+                      .format(length, len(data) - offset))
+    if length % dtype.itemsize:
+        raise IOError("Block length {} is not a multiple of the sample size {}"
+                      .format(length, dtype.itemsize))
+    return np.frombuffer(data, dtype=dtype, count=length//dtype.itemsize,
+                         offset=offset)
+
+
+def parse_ascii(text, sep=','):
+    """Parse an ASCII trace of separated values into a float64 array.
+
+    A leading IEEE 488.2 block header is skipped, as well as surrounding
+    whitespace and a trailing separator. No intermediate list is built.
+
+    :param text: Response of the instrument
+    :param sep: Separator between values
+    :type text: str or bytes
+    :type sep: str
+    :rtype: numpy.ndarray
+    """
+    if isinstance(text, bytes):
+        text = text.decode('ascii')
+    text = text.strip()
+    if text.startswith('#'):
+        ndigits = int(text[1])
+        text = text[2+ndigits:] if ndigits else text[2:]
+    text = text.strip().rstrip(sep)
+    if not text:
+        return np.empty(0)
+    data = np.fromstring(text, dtype=np.float64, sep=sep)
+    if len(data) != text.count(sep) + 1:
+        raise ValueError("Invalid value in ASCII trace after {} values"
+                         .format(len(data)))
+    return data
+
+
+# Fields of the waveform preamble of Keysight/Agilent oscilloscopes
+preamble_fields = ('format', 'type', 'points', 'count', 'xincrement', 
+                   'xorigin', 'xreference', 'yincrement', 'yorigin', 
+                   'yreference')
+
+
+def parse_preamble(text):
+    """Parse the answer to WAV:PREamble? into a dictionary.
+
+    Only the first ten fields, common to the InfiniiVision and Infiniium
+    series, are kept.
+
+    :param text: Response of the instrument
+    :type text: str
+    :rtype: dict
+    """
+    values = text.strip().split(',')
+    if len(values) < len(preamble_fields):
+        raise IOError("Invalid waveform preamble: {!r}".format(text))
+    preamble = {}
+    for field, value in zip(preamble_fields, values):
+        preamble[field] = float(value)
+    for field in ('format', 'type', 'points', 'count'):
+        preamble[field] = int(preamble[field])
+    return preamble
+
+
+def read_channels(resource, chans, datatype='h'):
+    """Fetch several channels of the last acquisition of an oscilloscope, in
+    volts, with the waveform format already set to WORD, MSB first.
+
+    Each channel takes two transactions: the source selection together with
+    WAV:PREamble?, and the binary data. The samples are decoded without
+    copies and converted to volts in one vectorized step.
+
+    :param resource: Session of the oscilloscope
+    :param chans: Channel numbers
+    :param datatype: 'h' (int16) or 'H' (uint16), as the model sends them
+    :type resource: pyvisa.resources.MessageBasedResource
+    :type chans: sequence of int
+    :type datatype: str
+    :return: The time axis shared by the channels and the samples with shape
+        (len(chans), points)
+    :rtype: tuple of numpy.ndarray
+    """
+    raw = []
+    pre = []
+    for chan in chans:
+        pre.append(parse_preamble(
+            resource.query(f"WAV:SOUR CHAN{chan};:WAV:PRE?")))
+        resource.write("WAV:DATA?")
+        raw.append(decode_block(resource.read_raw(), datatype=datatype,
+                                is_big_endian=True))
+    points = len(raw[0])
+    if any(len(r) != points for r in raw):
+        raise IOError("Channels returned different number of points")
+    yinc = np.array([p["yincrement"] for p in pre])[:, None]
+    yorig = np.array([p["yorigin"] for p in pre])[:, None]
+    yref = np.array([p["yreference"] for p in pre])[:, None]
+    volt = (np.stack(raw) - yref)*yinc + yorig
+    t = (np.arange(points) - pre[0]["xreference"])*pre[0]["xincrement"] \
+        + pre[0]["xorigin"]
+    return t, volt
@@ -0,0 +1,993 @@
+"""This module offers an in-process simulation of the lab instruments, so the
+drivers and the measurement scripts can run, and be timed, without any GPIB,
+USB or NI-DAQ hardware.
+
+The simulated instruments answer the SCPI commands used by the drivers, with
+a configurable latency per transaction and per transferred byte, and share a
+:class:`World` that holds the synthetic device under test (a ring resonator,
+an MZI and an acetylene cell), the laser sweep, the heater powers and the DAQ
+outputs. The laser sweeping in the world moves the resonances seen by the
+OSA, the scopes, the power meter and the DAQ, and the Keithley currents heat
+the ring.
+
+:func:`install` replaces the VISA backend used by visasessions and the
+nidaqmx objects used by controller::
+
+    import simulation
+    simulation.install()
+
+    import agilent816xb, controller
+    laser = agilent816xb.Agilent816xb()
+    laser.connectlaser()  # talks to simulation.FakeLaser
+    task = controller.Task()  # runs on simulation.FakeNITask
+
+The simulated resources are listed in :attr:`ResourceManager.resources` and
+the DAQ channel signals in :attr:`FakeNITask.signals`.
+"""
+
+__all__ = ['Chip', 'World', 'world', 'FakeSession', 'FakeLaser', 'FakeOSA',
+           'FakeScope', 'FakeInfiniium', 'FakeKeithley', 'FakePM300',
+           'ResourceManager', 'FakeNITask', 'daqmx', 'install', 'uninstall']
+
+import re
+import threading
+import time
+import types
+
+import numpy as np
+from pyvisa.constants import StatusCode
+from pyvisa.errors import VisaIOError
+from pyvisa.util import from_ieee_block
+
+try:
+    from nidaqmx.errors import DaqError
+except ImportError:
+    class DaqError(Exception):
+        def __init__(self, message, error_code):
+            super().__init__(message)
+            self.error_code = error_code
+
+
+# Units accepted after the numeric values of the commands, in SI units
+units = {'nm': 1e-9, 'pm': 1e-12, 'um': 1e-6, 'm': 1.0, 'ms': 1e-3,
+         's': 1.0, 'nm/s': 1e-9, 'thz': 1e12, 'dbm': 1.0, 'w': 1.0,
+         'mw': 1e-3}
+
+
+def _number(text):
+    """Parse a SCPI numeric value with an optional unit into SI units"""
+    match = re.match(r'\s*([-+0-9.eE]+)\s*([a-zA-Z/]*)', text)
+    if not match:
+        raise ValueError("Invalid numeric value {!r}".format(text))
+    return float(match.group(1))*units.get(match.group(2).lower(), 1.0)
+
+
+def _short(header):
+    """Reduce a SCPI header to the lower case short form of its nodes,
+    keeping numeric suffixes, e.g. ':SENSe:WAVelength:STARt' -> 'sens:wav:star'
+    """
+    nodes = []
+    for node in header.strip().lstrip(':').lower().split(':'):
+        match = re.match(r'(\*?[a-z]+)(\d*)(\??)$', node)
+        if not match:
+            nodes.append(node)
+            continue
+        name, digits, question = match.groups()
+        if len(name) > 4 and not name.startswith('*'):
+            name = name[:3] if name[3] in 'aeiou' else name[:4]
+        nodes.append(name + digits + question)
+    return ':'.join(nodes)
+
+
+def _block(payload):
+    """Pack bytes into an IEEE 488.2 definite length block"""
+    length = str(len(payload)).encode()
+    return b'#' + str(len(length)).encode() + length + payload + b'\n'
+
+
+class Chip():
+    """Synthetic transmission spectra of the devices, wavelengths in nm.
+
+    The acetylene lines are an approximation of the 12C2H2 nu1+nu3 band,
+    good enough to test wavelength calibration code, not a reference.
+    """
+    ring_center = 1550.0
+    ring_fsr = 0.8
+    ring_fwhm = 0.01
+    ring_depth = 0.9
+    tuning = 20.0  # resonance shift in nm per W of heater power
+    ao_tuning = 0.01  # resonance shift in nm per V of the DAQ outputs
+    mzi_fsr = 0.08
+    acetylene_center = 1525.76
+    acetylene_width = 0.005
+    acetylene_depth = 0.6
+
+    def __init__(self):
+        j = np.arange(1, 26)
+        r_branch = self.acetylene_center - 0.58*j
+        p_branch = self.acetylene_center + 0.61*j
+        self.acetylene_lines = np.concatenate((r_branch, p_branch))
+        # alternating intensities of the ortho and para states
+        strength = np.where(j % 2, 1.0, 1/3)*np.exp(-((j - 9)/8)**2)
+        self.acetylene_strength = np.concatenate((strength, strength))
+
+    def ring(self, wl, shift=0.0):
+        detuning = np.mod(wl - self.ring_center - shift + self.ring_fsr/2,
+                          self.ring_fsr) - self.ring_fsr/2
+        return 1 - self.ring_depth/(1 + (2*detuning/self.ring_fwhm)**2)
+
+    def mzi(self, wl):
+        return 0.5*(1 + np.cos(2*np.pi*wl/self.mzi_fsr))
+
+    def acetylene(self, wl):
+        wl = np.asarray(wl, dtype=float)
+        lines = np.zeros(wl.shape)
+        for center, strength in zip(self.acetylene_lines,
+                                    self.acetylene_strength):
+            lines += strength/(1 + (2*(wl - center)/self.acetylene_width)**2)
+        return 1 - self.acetylene_depth*np.clip(lines, 0, 1)
+
+
+class World():
+    """State shared by the simulated instruments.
+
+    :param chip: The simulated devices, a default :class:`Chip` if None
+    :param seed: Seed of the noise generator
+    :param noise: Standard deviation of the noise added to the signals
+    """
+
+    def __init__(self, chip=None, seed=None, noise=1e-3):
+        self.chip = chip or Chip()
+        self.rng = np.random.default_rng(seed)
+        self.noise = noise
+        self.laser = None
+        self.heaters = {}  # resource name -> dissipated power in W
+        self.ao = {}  # DAQ output channel -> voltage
+        # traffic of all the simulated instruments, used by the benchmarks
+        self.counters = dict.fromkeys(('writes', 'reads', 'bytes_written',
+                                       'bytes_read', 'daq_samples'), 0)
+
+    def shift(self):
+        """Thermal shift of the ring resonances in nm"""
+        return (self.chip.tuning*sum(self.heaters.values())
+                + self.chip.ao_tuning*sum(self.ao.values()))
+
+    def wavelength(self, t):
+        """Laser wavelength in nm at the times `t`"""
+        if self.laser is None:
+            return np.full(np.shape(t), self.chip.ring_center)
+        return self.laser.wavelength(t)
+
+    def signal(self, kind, t):
+        """Detector signal in V at the times `t` (time.time() values).
+
+        :param kind: 'trigger', 'ring', 'acetylene' or 'mzi'
+        """
+        t = np.asarray(t, dtype=float)
+        if kind == 'trigger':
+            data = 5.0*self.laser.trigger(t) if self.laser else np.zeros(t.shape)
+        else:
+            on = self.laser is not None and self.laser.on
+            wl = self.wavelength(t)
+            if kind == 'ring':
+                data = on*self.chip.ring(wl, self.shift())
+            elif kind == 'acetylene':
+                data = on*self.chip.acetylene(wl)
+            elif kind == 'mzi':
+                data = on*self.chip.mzi(wl)
+            else:
+                data = np.zeros(t.shape)
+        return data + self.rng.normal(0, self.noise, t.shape)
+
+
+# The world used when none is given
+world = World()
+
+
+class FakeSession():
+    """Base of the simulated VISA sessions.
+
+    Written messages are split on `;` and every command is passed to
+    :meth:`handle` with its header reduced to the short form. Answers are
+    queued and returned by read/read_raw. Settings without a specific
+    handler are stored and returned by the matching query.
+    """
+    idn = "SIMULATED,INSTRUMENT,0,1.0"
+    write_latency = 0.5e-3  # s per write transaction
+    read_latency = 2e-3  # s per read transaction
+    byte_time = 1e-6  # s per transferred byte (1 MB/s)
+
+    def __init__(self, name, world, **kwargs):
+        self.resource_name = name
+        self.world = world
+        self.timeout = 2000
+        self.read_termination = None
+        self.write_termination = '\n'
+        self.chunk_size = 20*1024
+        self.settings = {}
+        self.output = []
+        self.errors = []  # SCPI error queue, e.g. '-221,"Settings conflict"'
+        self.transactions = 0
+        self.closed = False
+        for attribute, value in kwargs.items():
+            setattr(self, attribute, value)
+
+    def _sleep(self, duration):
+        if duration > 0:
+            time.sleep(duration)
+
+    def write(self, message):
+        self._sleep(self.write_latency + len(message)*self.byte_time)
+        self.transactions += 1
+        self.world.counters['writes'] += 1
+        self.world.counters['bytes_written'] += len(message)
+        for command in message.split(';'):
+            command = command.strip()
+            if not command:
+                continue
+            parts = command.split(None, 1)
+            header = _short(parts[0])
+            args = parts[1].strip() if len(parts) > 1 else ''
+            answer = self.handle(header, args)
+            if answer is not None:
+                if not isinstance(answer, bytes):
+                    answer = (str(answer) + '\n').encode()
+                self.output.append(answer)
+        return len(message)
+
+    def read_raw(self, size=None):
+        if not self.output:
+            self._sleep(self.timeout/1000)
+            raise VisaIOError(StatusCode.error_timeout)
+        data = self.output.pop(0)
+        self._sleep(self.read_latency + len(data)*self.byte_time)
+        self.transactions += 1
+        self.world.counters['reads'] += 1
+        self.world.counters['bytes_read'] += len(data)
+        return data
+
+    def read(self):
+        return self.read_raw().decode('ascii').rstrip('\r\n')
+
+    def query(self, message):
+        self.write(message)
+        return self.read()
+
+    def query_binary_values(self, message, datatype='f', is_big_endian=False,
+                            container=list, **kwargs):
+        self.write(message)
+        return from_ieee_block(self.read_raw(), datatype, is_big_endian,
+                               container)
+
+    def close(self):
+        self.closed = True
+
+    def wait(self):
+        """Wait until the pending operations are complete, for *OPC?"""
+        pass
+
+    def handle(self, header, args):
+        if header == '*idn?':
+            return self.idn
+        if header == '*opc?':
+            self.wait()
+            return '1'
+        if header == '*cls':
+            self.errors.clear()
+            return None
+        if header in ('*rst', '*wai', 'open', 'close'):
+            return None
+        if header in ('syst:err?', 'syst:err:next?'):
+            return self.errors.pop(0) if self.errors else '+0,"No error"'
+        if header.endswith('?'):
+            return self.settings.get(header[:-1], '0')
+        self.settings[header] = args
+        return None
+
+
+class FakeLaser(FakeSession):
+    """Agilent/Keysight 816x tunable laser, one laser for all slots"""
+    idn = "Agilent Technologies,8164B,SIM00001,V5.25(72637)"
+    settle_time = 0.2  # s from the sweep start command to the start wavelength
+    trigger_width = 1e-3  # s
+
+    def __init__(self, name, world, **kwargs):
+        super().__init__(name, world, **kwargs)
+        self.wl = 1550.0
+        self.power = 0.0
+        self.on = False
+        self.start = 1530.0
+        self.stop = 1570.0
+        self.step = 1.0
+        self.speed = 5.0
+        self.llog = False
+        self.trigger_mode = 'swst'
+        self.sweep_t0 = None
+        self.world.laser = self
+
+    def close(self):
+        super().close()
+        if self.world.laser is self:
+            self.world.laser = None
+
+    def sweep_end(self):
+        return self.sweep_t0 + (self.stop - self.start)/self.speed
+
+    def running(self, now=None):
+        if self.sweep_t0 is None:
+            return False
+        now = time.time() if now is None else now
+        if now >= self.sweep_end():
+            return False
+        return True
+
+    def wavelength(self, t):
+        t = np.asarray(t, dtype=float)
+        if self.sweep_t0 is None:
+            return np.full(t.shape, self.wl)
+        wl = self.start + self.speed*(t - self.sweep_t0)
+        return np.clip(wl, self.start, self.stop)
+
+    def trigger(self, t):
+        t = np.asarray(t, dtype=float)
+        if self.sweep_t0 is None:
+            return np.zeros(t.shape)
+        dt = t - self.sweep_t0
+        if self.trigger_mode == 'stf':
+            period = self.step/self.speed
+            # one pulse per logged wavelength, the last at the sweep end
+            pulse = np.mod(dt, period) < min(self.trigger_width, period/2)
+            return (pulse & (dt >= 0)
+                    & (dt < self.points()*period)).astype(float)
+        return ((dt >= 0) & (dt < self.trigger_width)).astype(float)
+
+    def wait(self):
+        if self.sweep_t0 is not None:
+            self._sleep(self.sweep_end() - time.time())
+
+    def points(self):
+        return int(np.floor((self.stop - self.start)/self.step + 1e-9)) + 1
+
+    def logged(self):
+        points = self.points()
+        wl = self.start + self.step*np.arange(points)
+        return wl + self.world.rng.normal(0, 1e-4, points)
+
+    def handle(self, header, args):
+        key = re.sub(r'(sour|trig|slot)\d+', r'\1', header)
+        if key == 'sour:wav':
+            self.sweep_t0 = None
+            self.wl = _number(args)*1e9
+        elif key == 'sour:wav?':
+            return "{:+.8E}".format(float(self.wavelength(time.time()))*1e-9)
+        elif key == 'sour:pow':
+            self.power = _number(args)
+        elif key == 'sour:pow?':
+            return "{:+.6E}".format(self.power)
+        elif key == 'sour:pow:stat':
+            self.on = args.strip().lower() in ('1', 'on')
+        elif key == 'sour:pow:stat?':
+            return '1' if self.on else '0'
+        elif key == 'sour:wav:swe:star':
+            self.start = _number(args)*1e9
+        elif key == 'sour:wav:swe:stop':
+            self.stop = _number(args)*1e9
+        elif key == 'sour:wav:swe:step':
+            self.step = _number(args)*1e9
+        elif key == 'sour:wav:swe:spe':
+            self.speed = _number(args)*1e9
+        elif key == 'sour:wav:swe:llog':
+            self.llog = args.strip().lower() in ('1', 'on')
+        elif key == 'sour:wav:swe:stat':
+            state = int(_number(args))
+            now = time.time()
+            if state == 1 and self.llog and self.trigger_mode != 'stf':
+                # the wavelength logging needs a trigger at every step
+                self.errors.append('-221,"Settings conflict;lambda logging '
+                                   'requires output trigger STF"')
+            elif state == 1 and self.llog and self.points() > 100001:
+                self.errors.append('-222,"Data out of range;too many lambda '
+                                   'logging points"')
+            elif state == 1:
+                self.sweep_t0 = now + self.settle_time
+            else:
+                self.wl = float(self.wavelength(now))
+                self.sweep_t0 = None
+        elif key == 'sour:wav:swe:stat?':
+            return '+1' if self.running() else '+0'
+        elif key in ('sour:read:data?', 'sour:read:poin?'):
+            if not self.llog or self.sweep_t0 is None and not hasattr(self, '_log'):
+                data = np.zeros(0)
+            elif self.sweep_t0 is not None:
+                self.wait()
+                data = self._log = self.logged()
+            else:
+                data = self._log
+            if key == 'sour:read:poin?':
+                return str(len(data))
+            return _block((data*1e-9).astype('<f8').tobytes())
+        elif key == 'trig:outp':
+            self.trigger_mode = args.strip().lower()
+        else:
+            return super().handle(header, args)
+        return None
+
+
+class FakeOSA(FakeSession):
+    """Yokogawa AQ63XX optical spectrum analyzer measuring the ring with a
+    broadband source"""
+    idn = "YOKOGAWA,AQ6370D,SIM00002,02.08"
+    sweep_point_time = 2e-4  # s per trace point
+    sweep_overhead = 0.2  # s
+    level = -30.0  # dBm out of resonance
+
+    def __init__(self, name, world, **kwargs):
+        super().__init__(name, world, **kwargs)
+        self.start = 1500e-9
+        self.stop = 1600e-9
+        self.points = 1001
+        self.binary = False
+        self.sweep_end = 0.0
+        self.repeat = False
+
+    def wait(self):
+        if not self.repeat:
+            self._sleep(self.sweep_end - time.time())
+
+    def trace(self):
+        wl = np.linspace(self.start, self.stop, self.points)*1e9
+        transmission = self.world.chip.ring(wl, self.world.shift())
+        y = self.level + 10*np.log10(transmission)
+        return wl, y + self.world.rng.normal(0, 0.05, self.points)
+
+    def handle(self, header, args):
+        if header == 'form:data':
+            self.binary = args.lower().startswith('real')
+        elif header == 'init:smod':
+            self.repeat = args.strip().lower() in ('rep', 'repeat', '2')
+        elif header == 'init':
+            self.sweep_end = time.time() + self.sweep_overhead \
+                + self.points*self.sweep_point_time
+        elif header == 'abor':
+            self.sweep_end = time.time()
+        elif header == 'stat:oper:cond?':
+            ended = not self.repeat and time.time() >= self.sweep_end
+            return '1' if ended else '0'
+        elif header == 'sens:wav:star':
+            self.start = _number(args)
+        elif header == 'sens:wav:stop':
+            self.stop = _number(args)
+        elif header in ('sens:wav:cent', 'sens:wav:span'):
+            center = (self.start + self.stop)/2
+            span = self.stop - self.start
+            if header == 'sens:wav:cent':
+                center = _number(args)
+            else:
+                span = _number(args)
+            self.start = center - span/2
+            self.stop = center + span/2
+        elif header in ('sens:wav:star?', 'sens:wav:stop?', 'sens:wav:cent?',
+                        'sens:wav:span?'):
+            value = {'sens:wav:star?': self.start, 'sens:wav:stop?': self.stop,
+                     'sens:wav:cent?': (self.start + self.stop)/2,
+                     'sens:wav:span?': self.stop - self.start}[header]
+            return "{:+.8E}".format(value)
+        elif header == 'sens:swe:poin':
+            self.points = int(_number(args))
+        elif header == 'sens:swe:poin?':
+            return str(self.points)
+        elif header == 'sens:swe:poin:auto':
+            self.points = 1001
+        elif header in ('trac:data:y?', 'trac:y?', 'trac:data:x?', 'trac:x?'):
+            wl, y = self.trace()
+            data = wl*1e-9 if 'x?' in header else y
+            if self.binary:
+                return _block(data.astype('<f4').tobytes())
+            return ','.join('{:+.8E}'.format(v) for v in data)
+        else:
+            return super().handle(header, args)
+        return None
+
+
+class FakeScope(FakeSession):
+    """Keysight InfiniiVision DSOX3104A, recording the laser sweep on its
+    four channels: trigger, ring, acetylene and MZI"""
+    idn = "KEYSIGHT TECHNOLOGIES,DSO-X 3104A,MY52490398,02.43"
+    channels = {1: 'trigger', 2: 'ring', 3: 'acetylene', 4: 'mzi'}
+    byte_time = 1e-7  # USB, 10 MB/s
+    signed = False
+
+    def __init__(self, name, world, **kwargs):
+        super().__init__(name, world, **kwargs)
+        self.source = 1
+        self.points = 10000
+        self.scale = 1e-3
+        self.position = 0.0
+        self.binary = True
+        self.vscale = {1: 2.0, 2: 0.2, 3: 0.2, 4: 0.2}
+        self.offset = {1: 0.0, 2: 0.0, 3: 0.0, 4: 0.0}
+
+    def preamble(self):
+        xinc = 10*self.scale/self.points
+        xorig = self.position - 5*self.scale
+        if self.signed:
+            yinc, yref = self.vscale[self.source]*4/30720, 0
+        else:
+            yinc, yref = self.vscale[self.source]*8/65536, 32768
+        return {'points': self.points, 'xincrement': xinc, 'xorigin': xorig,
+                'xreference': 0, 'yincrement': yinc, 'yorigin': 0.0,
+                'yreference': yref}
+
+    def waveform(self):
+        pre = self.preamble()
+        laser = self.world.laser
+        t0 = laser.sweep_t0 if laser and laser.sweep_t0 else time.time()
+        t = t0 + pre['xorigin'] + pre['xincrement']*np.arange(self.points)
+        return self.world.signal(self.channels[self.source], t) \
+            - self.offset[self.source], pre
+
+    def handle(self, header, args):
+        match = re.match(r'chan(\d)(:.*)$', header)
+        if header == 'wav:sour':
+            match_sour = re.match(r'chan(\d)', args.strip().lower())
+            if match_sour:
+                self.source = int(match_sour.group(1))
+        elif header == 'wav:form':
+            self.binary = not args.lower().startswith('asc')
+        elif header == 'wav:pre?':
+            pre = self.preamble()
+            return "{},0,{},1,{:E},{:E},0,{:E},{:E},{}".format(
+                0 if not self.binary else 1, pre['points'],
+                pre['xincrement'], pre['xorigin'], pre['yincrement'],
+                pre['yorigin'], pre['yreference'])
+        elif header in ('wav:yinc?', 'wav:yor?', 'wav:yref?'):
+            pre = self.preamble()
+            key = {'wav:yinc?': 'yincrement', 'wav:yor?': 'yorigin',
+                   'wav:yref?': 'yreference'}[header]
+            return "{:E}".format(pre[key])
+        elif header == 'wav:data?':
+            volt, pre = self.waveform()
+            if not self.binary:
+                return _block(','.join('{:+.6E}'.format(v)
+                                       for v in volt).encode())[:-1]
+            counts = np.round(volt/pre['yincrement'] + pre['yreference'])
+            if self.signed:
+                counts = np.clip(counts, -32768, 32767).astype('>i2')
+            else:
+                counts = np.clip(counts, 0, 65535).astype('>u2')
+            return _block(counts.tobytes())
+        elif header == 'acq:poin':
+            self.points = int(_number(args))
+        elif header == 'acq:poin?':
+            return str(self.points)
+        elif header == 'acq:srat?':
+            return "{:E}".format(self.points/(10*self.scale))
+        elif header == 'tim:scal':
+            self.scale = _number(args)
+        elif header == 'tim:scal?':
+            return "{:E}".format(self.scale)
+        elif header == 'tim:pos':
+            self.position = _number(args)
+        elif header == 'tim:pos?':
+            return "{:E}".format(self.position)
+        elif header == 'pder?':
+            return '1'
+        elif match and match.group(2) in (':scal', ':offs'):
+            store = self.vscale if match.group(2) == ':scal' else self.offset
+            store[int(match.group(1))] = _number(args)
+        elif match and match.group(2) in (':scal?', ':offs?'):
+            store = self.vscale if match.group(2) == ':scal?' else self.offset
+            return "{:E}".format(store[int(match.group(1))])
+        else:
+            return super().handle(header, args)
+        return None
+
+
+class FakeInfiniium(FakeScope):
+    """Agilent Infiniium DSO9404A, signed words"""
+    idn = "AGILENT TECHNOLOGIES,DSO9404A,MY53060106,05.50"
+    signed = True
+
+
+class FakeKeithley(FakeSession):
+    """Keithley 2400 source meter driving a heater.
+
+    The heater resistance follows R = R0*(1 + tcr*P) with P = I^2 R, and
+    relaxes towards it with the thermal time constant `tau`.
+    """
+    idn = "KEITHLEY INSTRUMENTS INC.,MODEL 2400,SIM00003,C32"
+    R0 = 100.0
+    tcr = 2.0  # relative resistance change per W
+    tau = 0.3  # s
+    overflow = 9.91e37
+
+    def __init__(self, name, world, **kwargs):
+        super().__init__(name, world, **kwargs)
+        self.function = 'curr'
+        self.level = {'curr': 0.0, 'volt': 0.0}
+        self.elements = ['volt', 'curr', 'res']
+        self.count = 1
+        self.nplc = 1.0
+        self.delay = 0.0
+        self.delay_auto = False
+        self.mode = 'fix'
+        self.list = []
+        self.res = self.R0
+        self.updated = time.time()
+
+    def steady(self, curr):
+        x = self.tcr*self.R0*curr**2
+        return self.R0/(1 - min(x, 0.9))
+
+    def advance(self, now):
+        """Let the heater temperature evolve up to `now`"""
+        curr = self.current()
+        target = self.steady(curr)
+        self.res = target + (self.res - target)*np.exp(-(now - self.updated)/self.tau)
+        self.updated = now
+        self.world.heaters[self.resource_name] = curr**2*self.res
+
+    def current(self):
+        if self.function == 'curr':
+            return self.level['curr']
+        return self.level['volt']/self.res
+
+    def reading(self):
+        self._sleep(self.nplc/60)
+        self.advance(time.time())
+        curr = self.current()
+        noise = 1 + self.world.rng.normal(0, 1e-5)
+        values = {'volt': curr*self.res*noise, 'curr': curr,
+                  'res': self.res*noise if curr else self.overflow}
+        return [values[e] for e in self.elements]
+
+    def handle(self, header, args):
+        if header == 'sour:func':
+            self.function = args.strip().lower()[:4]
+        elif header in ('sour:curr:lev', 'sour:curr', 'sour:volt:lev', 'sour:volt'):
+            self.advance(time.time())
+            self.level[header.split(':')[1]] = _number(args)
+        elif header == 'sour:curr:mode':
+            self.mode = args.strip().lower()[:4]
+        elif header == 'sour:list:curr':
+            self.list = [_number(v) for v in args.split(',')]
+        elif header == 'sour:del':
+            self.delay = _number(args)
+            self.delay_auto = False
+        elif header == 'sour:del?':
+            return '{:+.6E}'.format(self.delay)
+        elif header == 'sour:del:auto':
+            self.delay_auto = args.strip().lower() in ('1', 'on')
+        elif header == 'sour:del:auto?':
+            return '1' if self.delay_auto else '0'
+        elif header == 'form:elem':
+            # the readings come in a fixed order, whatever the order given
+            elements = [e.strip().lower()[:4] for e in args.split(',')]
+            self.elements = [e for e in ('volt', 'curr', 'res')
+                             if e in elements]
+        elif header == 'trig:coun':
+            self.count = int(_number(args))
+        elif header in ('sens:volt:nplc', 'sens:curr:nplc', 'sens:res:nplc'):
+            self.nplc = _number(args)
+        elif header == 'read?':
+            readings = []
+            for i in range(self.count):
+                if self.mode == 'list' and self.list:
+                    self.advance(time.time())
+                    self.level['curr'] = self.list[i % len(self.list)]
+                self._sleep(self.delay)
+                readings.extend(self.reading())
+            return ','.join('{:+.6E}'.format(v) for v in readings)
+        else:
+            return super().handle(header, args)
+        return None
+
+
+class FakePM300(FakeSession):
+    """Thorlabs PM300 power meter after the ring"""
+    idn = "Thorlabs,PM300,P300001,1.0"
+
+    def handle(self, header, args):
+        if header == 'read?':
+            laser = self.world.laser
+            if laser is None or not laser.on:
+                return "{:E}".format(abs(self.world.rng.normal(0, 1e-9)))
+            now = time.time()
+            power = 10**(laser.power/10)*1e-3 if laser.power > 0.1 else 1e-3
+            power *= float(self.world.chip.ring(laser.wavelength(now),
+                                                self.world.shift()))
+            return "{:E}".format(power*(1 + self.world.rng.normal(0, 1e-3)))
+        return super().handle(header, args)
+
+
+class ResourceManager():
+    """Stand-in for visa.ResourceManager opening simulated sessions.
+
+    :param world: The shared simulation state, the module world if None
+    """
+    resources = {'GPIB0::17::INSTR': FakeLaser,
+                 'GPIB0::2::INSTR': FakeOSA,
+                 'GPIB0::5::INSTR': FakeOSA,
+                 'GPIB0::24::INSTR': FakeKeithley,
+                 'GPIB0::25::INSTR': FakeKeithley,
+                 'USB0::0x0957::0x17A0::MY52490398::INSTR': FakeScope,
+                 'USB0::0x0957::0x900D::MY53060106::INSTR': FakeInfiniium,
+                 'USB0::0x1313::0x8072::P300001::INSTR': FakePM300,
+                 }
+    scan_time = 0.2  # s per list_resources
+    open_time = 0.02  # s per open_resource
+
+    def __init__(self, world=None):
+        self.world = world or globals()['world']
+        self.sessions = []
+
+    def list_resources(self, query='?*::INSTR'):
+        time.sleep(self.scan_time)
+        return tuple(self.resources)
+
+    def open_resource(self, name, **kwargs):
+        if name not in self.resources:
+            raise VisaIOError(StatusCode.error_resource_not_found)
+        time.sleep(self.open_time)
+        session = self.resources[name](name, self.world, **kwargs)
+        self.sessions.append(session)
+        return session
+
+    def close(self):
+        for session in self.sessions:
+            session.close()
+        self.sessions = []
+
+
+class _Channels():
+    def __init__(self):
+        self.channel_names = []
+
+    def add_ai_voltage_chan(self, physical_channel, *args, **kwargs):
+        self.channel_names.append(physical_channel)
+
+    def add_ao_voltage_chan(self, physical_channel, *args, **kwargs):
+        self.channel_names.append(physical_channel)
+
+
+class _Timing():
+    def __init__(self):
+        self.samp_timing_type = None
+        self.samp_clk_rate = 1000.0
+        self.samp_quant_samp_mode = None
+        self.samp_quant_samp_per_chan = 1000
+
+    def cfg_samp_clk_timing(self, rate, source='', active_edge=None,
+                            sample_mode=None, samps_per_chan=1000):
+        self.samp_timing_type = 'sample clock'
+        self.samp_clk_rate = float(rate)
+        self.samp_quant_samp_mode = sample_mode
+        self.samp_quant_samp_per_chan = int(samps_per_chan)
+
+
+class _Trigger():
+    def __init__(self):
+        self.config = None
+
+    def __getattr__(self, name):
+        # cfg_*_trig and disable_*_trig only record the configuration
+        if name.startswith(('cfg_', 'disable_')):
+            return lambda **kwargs: setattr(self, 'config', (name, kwargs))
+        raise AttributeError(name)
+
+
+class _InStream():
+    def __init__(self, task):
+        self.task = task
+        self.logging_mode = None
+        self.logging_file_path = None
+        self.logging_samps_per_file = 0
+        self.input_buf_size = 0
+
+    def configure_logging(self, file_path, logging_mode=None, group_name='',
+                          operation=None):
+        self.logging_file_path = file_path
+        self.logging_mode = logging_mode
+
+    @property
+    def total_samp_per_chan_acquired(self):
+        return self.task.acquired()
+
+
+class FakeNITask():
+    """Stand-in for nidaqmx.Task sampling the world signals.
+
+    Samples are taken on a simulated clock started by start() (or by the
+    first read), and reads wait until the requested samples would have
+    been acquired, as the hardware does. Triggers and logging are accepted
+    but ignored.
+    """
+    # physical channel suffix -> World.signal kind
+    signals = {'ai0': 'trigger', 'ai1': 'ring', 'ai2': 'acetylene', 'ai3': 'mzi'}
+    realtime = True
+
+    def __init__(self, new_task_name='', world=None):
+        self.world = world or globals()['world']
+        self.ai_channels = _Channels()
+        self.ao_channels = _Channels()
+        self.timing = _Timing()
+        self.triggers = types.SimpleNamespace(start_trigger=_Trigger(),
+                                              reference_trigger=_Trigger())
+        self.in_stream = _InStream(self)
+        self.running = False
+        self.t0 = None
+        self.position = 0
+        self._event = None
+        self._event_thread = None
+
+    @property
+    def channel_names(self):
+        return self.ai_channels.channel_names + self.ao_channels.channel_names
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def start(self):
+        if not self.running:
+            self.running = True
+            self.t0 = time.time()
+            self.position = 0
+            if self._event:
+                self._event_thread = threading.Thread(target=self._event_loop,
+                                                      daemon=True)
+                self._event_thread.start()
+
+    def stop(self):
+        self.running = False
+        thread, self._event_thread = self._event_thread, None
+        if thread and thread is not threading.current_thread():
+            thread.join()
+
+    def close(self):
+        self.stop()
+
+    def _finite(self):
+        return self.timing.samp_timing_type == 'sample clock' and \
+            'FINITE' in str(self.timing.samp_quant_samp_mode)
+
+    def acquired(self):
+        """Samples per channel acquired by the clock since the start"""
+        if self.t0 is None:
+            return 0
+        n = int((time.time() - self.t0)*self.timing.samp_clk_rate)
+        if self._finite():
+            n = min(n, self.timing.samp_quant_samp_per_chan)
+        return n
+
+    def is_task_done(self):
+        return not self.running or self._finite() and \
+            self.acquired() >= self.timing.samp_quant_samp_per_chan
+
+    def acquire(self, n, timeout=10.0):
+        """Return the next n samples per channel of the input channels"""
+        on_demand = self.timing.samp_timing_type != 'sample clock'
+        # like DAQmx, a task started by the read is stopped after it
+        auto_start = not self.running
+        if auto_start:
+            self.start()
+        rate = self.timing.samp_clk_rate
+        if on_demand:
+            t = np.full(n, time.time())
+        else:
+            if self._finite() and \
+                    self.position + n > self.timing.samp_quant_samp_per_chan:
+                raise DaqError('Attempted to read samples that are no longer '
+                               'available', -200277)
+            end = self.t0 + (self.position + n)/rate
+            wait = end - time.time()
+            if self.realtime and wait > 0:
+                if timeout is not None and timeout >= 0 and wait > timeout:
+                    time.sleep(timeout)
+                    raise DaqError('Wait Until Done did not indicate that the '
+                                   'task was done within the specified '
+                                   'timeout', -200560)
+                time.sleep(wait)
+            t = self.t0 + (self.position + np.arange(n))/rate
+            self.position += n
+            if auto_start and self._finite():
+                self.stop()
+        data = np.empty((len(self.ai_channels.channel_names), n))
+        for i, name in enumerate(self.ai_channels.channel_names):
+            kind = self.signals.get(name.split('/')[-1], None)
+            data[i] = self.world.signal(kind, t)
+        self.world.counters['daq_samples'] += data.size
+        return data
+
+    def read(self, number_of_samples_per_channel=1, timeout=10.0):
+        data = self.acquire(max(1, int(number_of_samples_per_channel)), timeout)
+        if len(data) == 1:
+            data = data[0]
+        if number_of_samples_per_channel == 1:
+            return data[..., 0].tolist()
+        return data.tolist()
+
+    def write(self, data, auto_start=True, timeout=10.0):
+        data = np.asarray(data, dtype=float)
+        names = self.ao_channels.channel_names
+        if data.ndim == 0:
+            data = data[None]
+        if len(names) > 1:
+            values = data[:, -1] if data.ndim > 1 else data
+        else:
+            values = [data.ravel()[-1]]
+        for name, value in zip(names, values):
+            self.world.ao[name] = float(value)
+        return data.shape[-1]
+
+    def register_every_n_samples_acquired_into_buffer_event(self, n, callback):
+        self._event = (int(n), callback) if callback else None
+
+    def _event_loop(self):
+        k = 1
+        while self.running and self._event:
+            n, callback = self._event
+            wait = self.t0 + k*n/self.timing.samp_clk_rate - time.time()
+            if wait > 0:
+                time.sleep(wait)
+            if not self.running:
+                break
+            callback(0, 1, n, None)
+            k += 1
+
+
+class _AnalogMultiChannelReader():
+    def __init__(self, in_stream):
+        self.task = in_stream.task
+
+    def read_many_sample(self, data, number_of_samples_per_channel=1,
+                         timeout=10.0):
+        data[...] = self.task.acquire(number_of_samples_per_channel, timeout)
+        return number_of_samples_per_channel
+
+
+# Replacements of the nidaqmx names used by controller
+daqmx = types.SimpleNamespace(
+    Task=FakeNITask,
+    errors=types.SimpleNamespace(DaqError=DaqError),
+    stream_readers=types.SimpleNamespace(
+        AnalogMultiChannelReader=_AnalogMultiChannelReader))
+
+_saved = {}
+
+
+def install(new_world=None):
+    """Route the VISA sessions of visasessions and the DAQmx tasks of
+    controller to the simulated instruments.
+
+    Call it before the drivers connect. Sessions already open are closed.
+
+    :param new_world: Replaces the module world if given
+    :type new_world: :class:`World`
+    """
+    global world
+    import controller
+    import visasessions
+    if new_world is not None:
+        world = new_world
+    if not _saved:
+        _saved['backends'] = visasessions.backends
+        _saved['nidaqmx'] = controller.nidaqmx
+        _saved['stream_readers'] = controller.stream_readers
+    visasessions.close_all()
+    visasessions.backends = ('@sim',)
+    controller.nidaqmx = daqmx
+    controller.stream_readers = daqmx.stream_readers
+
+
+def uninstall():
+    """Restore the real VISA backends and nidaqmx"""
+    import controller
+    import visasessions
+    if _saved:
+        visasessions.close_all()
+        visasessions.backends = _saved.pop('backends')
+        controller.nidaqmx = _saved.pop('nidaqmx')
+        controller.stream_readers = _saved.pop('stream_readers')
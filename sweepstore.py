@@ -0,0 +1,364 @@
+"""This module stores the acquired sweeps in a chunked, compressed, columnar
+format, replacing the pickled pandas DataFrames.
+
+A store is a folder holding one sub folder per sweep. Each column of a sweep
+(wavelength, trigger, cavity...) is a separate file of zlib compressed
+chunks, so reading one channel, or a part of it, only reads and inflates the
+chunks it needs. Signal columns are kept as int16 counts plus a scale and an
+offset, at a resolution finer than the 16 bit DAQ, and the bytes are shuffled
+before compression. The metadata of the sweep (laser settings, heater
+currents, DAQ rate...) is saved with it as JSON::
+
+    import sweepstore
+
+    store = sweepstore.SweepStore("transmission data/heater map.sweeps")
+    n = store.append({'wavelength': wl, 'cav': r[1]},
+                     metadata={'rate': 100e3, 'current_mA': 12.5})
+    cav = store.read(n, 'cav')
+
+A sweep is written in a temporary folder and renamed when complete, so a
+crash during the write never leaves a partial sweep in the store, only a
+temporary folder that :meth:`SweepStore.discard_partial` removes.
+"""
+
+__all__ = ['SweepStore', 'import_pickle', 'default_encodings']
+
+import json
+import os
+import pickle
+import shutil
+import time
+import zlib
+
+import numpy as np
+
+# Encoding of the columns not given to SweepStore.append, 'int16' otherwise
+default_encodings = {'wavelength': 'float64'}
+
+_encodings = {'int16': 'i2', 'float32': 'f4', 'float64': 'f8'}
+_int16_max = 32767
+_int16_nan = -32768  # count that stands for nan
+_meta_name = 'meta.json'
+_tmp_prefix = '.tmp-'
+
+
+def _shuffle(data):
+    # group the n-th byte of every sample together, as the HDF5 shuffle
+    # filter, the high bytes of slowly varying signals then compress well
+    itemsize = data.dtype.itemsize
+    return data.view(np.uint8).reshape(-1, itemsize).T.tobytes()
+
+
+def _unshuffle(raw, dtype):
+    itemsize = np.dtype(dtype).itemsize
+    data = np.frombuffer(raw, np.uint8).reshape(itemsize, -1).T
+    return np.ascontiguousarray(data).view(dtype).ravel()
+
+
+def _json_default(obj):
+    # numpy scalars and arrays in the metadata
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    raise TypeError(f"{type(obj).__name__} is not JSON serializable")
+
+
+def _fsync_dir(path):
+    # make the rename durable, not possible (nor needed) on Windows
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except (OSError, AttributeError):
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+class SweepStore():
+    """Folder of sweeps stored column by column.
+
+    :param path: Folder of the store, created if it does not exist
+    :param chunk: Samples per compressed chunk
+    :param level: zlib compression level, 1 is fast enough to follow the
+        acquisition
+    :type path: str
+    :type chunk: int
+    :type level: int
+    """
+
+    def __init__(self, path, chunk=65536, level=1):
+        self.path = path
+        self.chunk = chunk
+        self.level = level
+        os.makedirs(path, exist_ok=True)
+        self._meta = {}  # sweep -> metadata read from disk
+
+    def __repr__(self):
+        return f"SweepStore({self.path!r}, {len(self)} sweeps)"
+
+    def __len__(self):
+        return len(self.sweeps())
+
+    def sweeps(self):
+        """Return the indexes of the complete sweeps, in order.
+
+        :rtype: list
+        """
+        indexes = []
+        for name in os.listdir(self.path):
+            if name.isdigit() and os.path.isfile(
+                    os.path.join(self.path, name, _meta_name)):
+                indexes.append(int(name))
+        return sorted(indexes)
+
+    def _folder(self, index):
+        return os.path.join(self.path, f"{index:05d}")
+
+    # writing
+
+    def _encode(self, data, encoding):
+        """Return the column entry of the metadata, with the scale and offset
+        of the int16 columns, computed chunk by chunk"""
+        if encoding not in _encodings:
+            raise ValueError(f"Unknown encoding {encoding!r}, use one of "
+                             f"{', '.join(_encodings)}")
+        entry = {'encoding': encoding, 'length': len(data),
+                 'chunk': self.chunk}
+        if encoding == 'int16':
+            low, high = np.inf, -np.inf
+            for start in range(0, len(data), self.chunk):
+                block = np.asarray(data[start:start+self.chunk], dtype=float)
+                block = block[np.isfinite(block)]
+                if len(block):
+                    low = min(low, block.min())
+                    high = max(high, block.max())
+            if low > high:
+                low = high = 0.0
+            offset = (high + low)/2
+            scale = (high - low)/(2*_int16_max) or 1.0
+            entry.update(scale=float(scale), offset=float(offset))
+        return entry
+
+    def _encode_chunk(self, block, entry):
+        block = np.asarray(block, dtype=float).ravel()
+        if entry['encoding'] == 'int16':
+            finite = np.isfinite(block)
+            counts = np.full(len(block), _int16_nan, dtype='i2')
+            counts[finite] = np.rint((block[finite] - entry['offset'])
+                                     / entry['scale'])
+            return counts
+        return block.astype(_encodings[entry['encoding']])
+
+    def _write_column(self, filename, data, entry):
+        """Encode and write the compressed chunks of a column, one chunk in
+        memory at a time, and return their sizes"""
+        sizes = []
+        with open(filename, 'wb') as file:
+            for start in range(0, len(data), self.chunk):
+                block = self._encode_chunk(data[start:start+self.chunk], entry)
+                block = zlib.compress(_shuffle(block), self.level)
+                file.write(block)
+                sizes.append(len(block))
+            file.flush()
+            os.fsync(file.fileno())
+        return sizes
+
+    def append(self, columns, metadata=None, encodings=None):
+        """Add a sweep to the store.
+
+        :param columns: Column name -> samples, a dict or a pandas DataFrame.
+            The columns are read one chunk at a time, so they can be
+            memory-mapped arrays larger than the memory
+        :param metadata: Settings of the sweep, anything JSON serializable
+            (numpy values are converted)
+        :param encodings: Column name -> 'int16', 'float32' or 'float64',
+            overriding :data:`default_encodings`
+        :type columns: dict
+        :type metadata: dict
+        :type encodings: dict
+        :return: The index of the new sweep
+        :rtype: int
+        """
+        encodings = dict(default_encodings, **(encodings or {}))
+        tmp = os.path.join(self.path, f"{_tmp_prefix}{os.getpid()}-"
+                                      f"{time.time_ns()}")
+        os.makedirs(tmp)
+        try:
+            meta = {'version': 1,
+                    'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                    'metadata': metadata or {},
+                    'columns': {}}
+            for i, name in enumerate(columns):
+                data = columns[name]
+                if np.ndim(data) != 1:
+                    data = np.ravel(data)
+                entry = self._encode(data, encodings.get(name, 'int16'))
+                entry['file'] = f"c{i}.bin"
+                entry['chunks'] = self._write_column(
+                    os.path.join(tmp, entry['file']), data, entry)
+                meta['columns'][str(name)] = entry
+            # the metadata is written last, a folder without it is partial
+            with open(os.path.join(tmp, _meta_name), 'w') as file:
+                json.dump(meta, file, indent=1, default=_json_default)
+                file.flush()
+                os.fsync(file.fileno())
+            index = max(self.sweeps(), default=-1) + 1
+            while True:
+                try:
+                    os.rename(tmp, self._folder(index))
+                    break
+                except FileExistsError:
+                    index += 1
+                except OSError:
+                    # Windows and some filesystems report an existing
+                    # folder differently
+                    if not os.path.exists(self._folder(index)):
+                        raise
+                    index += 1
+        except BaseException:
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
+        _fsync_dir(self.path)
+        return index
+
+    def discard_partial(self):
+        """Remove the temporary folders left by interrupted writes.
+
+        Do not call it while another process writes to the store.
+
+        :return: The number of folders removed
+        :rtype: int
+        """
+        removed = 0
+        for name in os.listdir(self.path):
+            if name.startswith(_tmp_prefix):
+                shutil.rmtree(os.path.join(self.path, name), ignore_errors=True)
+                removed += 1
+        return removed
+
+    # reading
+
+    def _sweep_meta(self, index):
+        if index not in self._meta:
+            filename = os.path.join(self._folder(index), _meta_name)
+            try:
+                with open(filename) as file:
+                    self._meta[index] = json.load(file)
+            except FileNotFoundError:
+                raise KeyError(f"No sweep {index} in {self.path}")
+        return self._meta[index]
+
+    def metadata(self, index):
+        """Return the metadata given when the sweep was appended.
+
+        :param index: Sweep index
+        :type index: int
+        :rtype: dict
+        """
+        return self._sweep_meta(index)['metadata']
+
+    def channels(self, index):
+        """Return the column names of a sweep.
+
+        :param index: Sweep index
+        :type index: int
+        :rtype: list
+        """
+        return list(self._sweep_meta(index)['columns'])
+
+    def find(self, **criteria):
+        """Return the indexes of the sweeps whose metadata has the given
+        values, e.g. ``store.find(polarization='TE')``.
+
+        :rtype: list
+        """
+        return [index for index in self.sweeps()
+                if all(self.metadata(index).get(key) == value
+                       for key, value in criteria.items())]
+
+    def read(self, index, channel, start=0, stop=None):
+        """Read a column of a sweep, or the samples [start, stop) of it.
+
+        Only the chunks holding the samples are read from the disk.
+
+        :param index: Sweep index
+        :param channel: Column name
+        :param start: First sample
+        :param stop: Sample after the last one, the end if None
+        :type index: int
+        :type channel: str
+        :type start: int
+        :type stop: int
+        :rtype: numpy.ndarray of float64
+        """
+        try:
+            entry = self._sweep_meta(index)['columns'][channel]
+        except KeyError:
+            if index in self._meta:
+                raise KeyError(f"No column {channel!r} in sweep {index}")
+            raise
+        start, stop, _ = slice(start, stop).indices(entry['length'])
+        if stop <= start:
+            return np.zeros(0)
+        chunk = entry['chunk']
+        first, last = start//chunk, (stop - 1)//chunk
+        offsets = np.concatenate(([0], np.cumsum(entry['chunks'])))
+        dtype = _encodings[entry['encoding']]
+        with open(os.path.join(self._folder(index), entry['file']), 'rb') as file:
+            file.seek(offsets[first])
+            raw = file.read(offsets[last + 1] - offsets[first])
+        blocks = []
+        for i in range(first, last + 1):
+            block = raw[offsets[i] - offsets[first]:offsets[i+1] - offsets[first]]
+            blocks.append(_unshuffle(zlib.decompress(block), dtype))
+        data = np.concatenate(blocks)[start - first*chunk:stop - first*chunk]
+        if entry['encoding'] == 'int16':
+            values = data*entry['scale'] + entry['offset']
+            values[data == _int16_nan] = np.nan
+            return values
+        return data.astype(float)
+
+    def read_all(self, index, channels=None):
+        """Read several columns of a sweep, all of them if None.
+
+        :rtype: dict
+        """
+        return {name: self.read(index, name)
+                for name in (channels or self.channels(index))}
+
+    def to_dataframe(self, index, channels=None):
+        """Return columns of a sweep as a pandas DataFrame, as the pickles
+        saved before the store.
+
+        :rtype: pandas.DataFrame
+        """
+        import pandas as pd
+        return pd.DataFrame(self.read_all(index, channels))
+
+
+def import_pickle(store, filename, metadata=None):
+    """Append a sweep saved as a pickled DataFrame to a store.
+
+    Empty pickles, left by interrupted runs, are skipped.
+
+    :param store: Destination store
+    :param filename: Path of the .pkl file
+    :param metadata: Metadata of the sweep, the source file name is added
+    :type store: SweepStore
+    :type filename: str
+    :type metadata: dict
+    :return: The index of the new sweep, None if the file is empty
+    :rtype: int
+    """
+    if os.path.getsize(filename) == 0:
+        print(f"Skipped empty file {filename}")
+        return None
+    with open(filename, 'rb') as file:
+        df = pickle.load(file)
+    metadata = dict(metadata or {}, source=os.path.basename(filename))
+    return store.append({name: df[name].to_numpy() for name in df.columns},
+                        metadata)
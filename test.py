@@ -78,3 +78,12 @@ t0 = time.time()
 data = _daq_read_voltage(_dev_read_T)
 t1 = time.time()
 print(f"it took {t1-t0:.6f} s to run")
+
+# same reading with the long lived tasks of controller.PointIO
+with controller.PointIO(_dev_write) as daq:
+    daq.write(0)
+    daq.read_mean([_dev_read_T, _dev_read_mzi], 100) # creates the task
+    t0 = time.time()
+    data = daq.read_mean([_dev_read_T, _dev_read_mzi], 100)
+    t1 = time.time()
+print(f"it took {t1-t0:.6f} s to run with controller.PointIO")
@@ -0,0 +1,148 @@
+"""This module holds the VISA resources shared by all the instrument drivers
+of the process.
+
+A single ResourceManager is created, with the NI backend if available and
+pyvisa-py otherwise. The list of resources is scanned once and kept, and the
+sessions are reused by resource name, so two drivers talking to the same
+address share one session. Everything still open is closed at exit::
+
+    import visasessions
+
+    name = visasessions.find_resource("KEITHLEY")
+    sm = visasessions.open_session(name)
+    ...
+    visasessions.close_session(sm)
+"""
+
+__all__ = ['resource_manager', 'list_resources', 'find_resource',
+           'open_session', 'close_session', 'close_all']
+
+import atexit
+
+try:
+    import pyvisa as visa
+except ImportError:  # older pyvisa releases are imported as visa
+    import visa
+
+# Tried in order, '@sim' uses the simulated instruments of simulation
+backends = ('@ni', '@py')
+
+_rm = None
+_resources = None
+# resource name -> [session, number of users]
+_sessions = {}
+
+
+def resource_manager():
+    """Return the shared ResourceManager, created on the first call.
+
+    :rtype: visa.ResourceManager
+    """
+    global _rm
+    if _rm is None:
+        error = None
+        for backend in backends:
+            try:
+                if backend == '@sim':
+                    # in-process simulated instruments, see simulation
+                    import simulation
+                    _rm = simulation.ResourceManager()
+                else:
+                    _rm = visa.ResourceManager(backend)
+                break
+            except Exception as e:
+                error = e
+        else:
+            raise error
+    return _rm
+
+
+def list_resources(refresh=False):
+    """Return the resources found on the buses, scanned only on the first
+    call or when `refresh` is set.
+
+    :param refresh: Scan the buses again
+    :type refresh: bool
+    :rtype: tuple
+    """
+    global _resources
+    if _resources is None or refresh:
+        _resources = tuple(resource_manager().list_resources())
+    return _resources
+
+
+def find_resource(pattern):
+    """Return the first resource whose name contains `pattern`.
+
+    The cached list is searched first, the buses are only scanned again if
+    the resource is not in it.
+
+    :param pattern: Part of the resource name, e.g. the USB vendor
+    :type pattern: str
+    :rtype: str
+    """
+    for refresh in (False, True):
+        for name in list_resources(refresh):
+            if pattern in name:
+                return name
+    raise LookupError("No VISA resource matching {!r}".format(pattern))
+
+
+def open_session(name, **kwargs):
+    """Open a session to a resource, or return the one already open.
+
+    Keyword arguments are resource attributes (timeout, read_termination...)
+    and are also applied to a reused session.
+
+    :param name: VISA resource name
+    :type name: str
+    :rtype: visa.Resource
+    """
+    if name in _sessions:
+        entry = _sessions[name]
+        entry[1] += 1
+        for attribute, value in kwargs.items():
+            setattr(entry[0], attribute, value)
+        return entry[0]
+    session = resource_manager().open_resource(name, **kwargs)
+    _sessions[name] = [session, 1]
+    return session
+
+
+def close_session(session):
+    """Release a session, closing it when no other driver uses it.
+
+    Sessions not open through this module (or already closed by
+    :func:`close_all`) are ignored.
+
+    :param session: A session returned by :func:`open_session`
+    :type session: visa.Resource
+    """
+    for name, entry in list(_sessions.items()):
+        if entry[0] is session:
+            entry[1] -= 1
+            if entry[1] <= 0:
+                del _sessions[name]
+                session.close()
+            return
+
+
+def close_all():
+    """Close every session and the ResourceManager"""
+    global _rm, _resources
+    for name, entry in list(_sessions.items()):
+        try:
+            entry[0].close()
+        except Exception:
+            pass
+    _sessions.clear()
+    if _rm is not None:
+        try:
+            _rm.close()
+        except Exception:
+            pass
+    _rm = None
+    _resources = None
+
+
+atexit.register(close_all)